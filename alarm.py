@@ -1,188 +1,393 @@
 #!/usr/bin/env python3
 
 import logging
-import json
-from datetime import datetime, timedelta
-import os
 import threading
-import time
+from datetime import date, datetime, timedelta
+
+from alarm_model import DEFAULT_ALARM_SOUND, EMPTY_SNAPSHOT, AlarmParser, AlarmSnapshot
+from clock import ClockService
+from recurrence import RecurrenceEngine
+from lifecycle import AlarmLifecycle, PRE_WAKE, RINGING, SNOOZED
+from scheduler import AlarmScheduler, RING, SNOOZE, TIMER, WAKE
+from wake_profile import get_wake_profile, register_profile
 
 logger = logging.getLogger(__name__)
 
 class AlarmManager:
-    def __init__(self, hardware_controller):
-        """Initialize the AlarmManager"""
+    def __init__(self, hardware_controller, clock=None, store=None, lifecycle=None):
+        """Initialize the AlarmManager.
+
+        With an AlarmStore, settings, snoozes, timers and dismissals are
+        persisted and restore() brings the schedule back after a restart.
+
+        `clock` and `lifecycle` replace the default ClockService and
+        AlarmLifecycle, e.g. with virtual-time ones in simulation.
+
+        Changes are serialized by a lock and published as an immutable
+        AlarmSnapshot, so `snapshot`, `alarms`, `get_active_alarms()` and
+        `next_event()` can be read from any thread without locking.
+        """
         self.hardware = hardware_controller
-        self.alarms = []
-        self.active_alarm = None
+        self.clock = clock or ClockService(hardware_controller)
+        self.store = store
+        self.snapshot = EMPTY_SNAPSHOT
+        self._write_lock = threading.RLock()
         self.snooze_duration = timedelta(minutes=9)  # Default snooze time
         self.gradual_wake_duration = timedelta(minutes=30)  # Duration for wake-up routine
+        self.missed_alarm_grace = timedelta(minutes=1)  # Late events older than this are skipped
+        
+        # Precomputed occurrences for the coming days, and the upcoming wake/ring events
+        self.recurrence = RecurrenceEngine()
+        self.scheduler = AlarmScheduler(self.gradual_wake_duration, self.recurrence)
+        self._preloaded_sound = None
+        self._held_since = None  # When the ring that due events are waiting behind started
         
         # Sound configuration
-        self.sounds_dir = "sounds"
-        self.default_alarm_sound = os.path.join(self.sounds_dir, "digital.mp3")
+        self.library = getattr(hardware_controller, 'library', None)
+        self.sounds_dir = self.library.sounds_dir if self.library else "sounds"
+        self.default_alarm_sound = self.library.default_sound(DEFAULT_ALARM_SOUND) if self.library \
+            else DEFAULT_ALARM_SOUND
+        self.parser = AlarmParser(self.default_alarm_sound, self.sounds_dir, self.library)
         
-        # Threading
-        self.alarm_thread = None
-        self.stop_thread = False
+        # State of the alarm that owns the lights and speaker
+        self.lifecycle = lifecycle or AlarmLifecycle(self.hardware, now=self.clock.now)
 
-    def update_settings(self, settings):
-        """Update alarm settings from website data"""
+    def restore(self):
+        """Load the schedule and any pending snooze from the store"""
+        if not self.store:
+            return False
+        with self._write_lock:
+            try:
+                settings, snooze = self.store.load()
+                if settings:
+                    self.update_settings(settings, persist=False)
+                if snooze:
+                    self._restore_snooze(snooze)
+                for fire_time, entry in list(self.store.timers.items()):
+                    self._restore_timer(entry, datetime.fromisoformat(fire_time))
+                logger.info(f"Restored {len(self.alarms)} alarms from the local store")
+                return True
+            except Exception as e:
+                logger.error(f"Failed to restore alarms: {str(e)}")
+                return False
+
+    def _restore_snooze(self, snooze):
+        """Re-schedule a snooze saved before the restart, unless it is long overdue"""
+        fire_time = datetime.fromisoformat(snooze['fire_time'])
+        if self.clock.now() - fire_time > self.missed_alarm_grace:
+            self.store.record_dismiss()
+            return
+        alarm = self.parser.parse(snooze['alarm'])
+        key = self.scheduler.schedule_snooze(alarm, fire_time)
+        if not self.lifecycle.restore_snooze(alarm, fire_time, key):
+            self.scheduler.unschedule(key)
+        self._publish()
+
+    def _restore_timer(self, entry, fire_time):
+        """Re-schedule a timer saved before the restart, unless it is long overdue"""
         try:
-            if 'alarms' in settings:
-                self.alarms = []
-                for alarm_data in settings['alarms']:
-                    alarm = {
-                        'time': datetime.strptime(alarm_data['time'], "%H:%M").time(),
-                        'days': alarm_data.get('days', []),  # Days of week (0-6, 0 is Monday)
-                        'enabled': alarm_data.get('enabled', True),
-                        'sound': alarm_data.get('sound', self.default_alarm_sound),
-                        'gradual_wake': alarm_data.get('gradual_wake', True),
-                        'snooze_enabled': alarm_data.get('snooze_enabled', True)
-                    }
-                    self.alarms.append(alarm)
-            
-            if 'snooze_duration' in settings:
-                self.snooze_duration = timedelta(minutes=settings['snooze_duration'])
-            
-            if 'gradual_wake_duration' in settings:
-                self.gradual_wake_duration = timedelta(
-                    minutes=settings['gradual_wake_duration']
-                )
-            
-            logger.info("Alarm settings updated successfully")
-        except Exception as e:
-            logger.error(f"Failed to update alarm settings: {str(e)}")
+            if self.clock.now() - fire_time > self.missed_alarm_grace:
+                raise ValueError("timer expired while stopped")
+            self.scheduler.schedule_timer(self.parser.parse(entry), fire_time)
+        except ValueError as e:
+            logger.warning(f"Dropping timer for {fire_time}: {str(e)}")
+            self.store.record_timer_done(fire_time)
+        self._publish()
+
+    def update_settings(self, settings, persist=True):
+        """Update alarm settings from website data"""
+        with self._write_lock:
+            try:
+                # Custom wake profiles must exist before alarms refer to them
+                for name, spec in settings.get('wake_profiles', {}).items():
+                    register_profile(name, spec)
+                
+                if 'alarms' in settings:
+                    # Invalid entries are skipped one by one; unchanged ones are reused
+                    alarms, errors = self.parser.parse_all(settings['alarms'])
+                    alarms = tuple(alarms)
+                    if alarms != self.snapshot.alarms:
+                        logger.info(f"Alarms changed: {len(alarms)} alarms, {len(errors)} invalid")
+                else:
+                    alarms = self.snapshot.alarms
+                
+                if 'snooze_duration' in settings:
+                    self.snooze_duration = timedelta(minutes=settings['snooze_duration'])
+                
+                if 'gradual_wake_duration' in settings:
+                    self.gradual_wake_duration = timedelta(
+                        minutes=settings['gradual_wake_duration']
+                    )
+                
+                now = self.clock.now()
+                self.recurrence.sync([alarm for alarm in alarms if alarm.enabled], now.date())
+                holidays_changed = 'holidays' in settings and \
+                    self.recurrence.set_holidays(self._parse_holidays(settings['holidays']))
+                self.scheduler.set_gradual_wake_duration(self.gradual_wake_duration, alarms, now)
+                self.scheduler.sync(alarms, now, force=holidays_changed)
+                self._publish(alarms)
+                self._preload_next_sound()
+                
+                if persist and self.store:
+                    self.store.record_settings(settings)
+                
+                logger.info("Alarm settings updated successfully")
+            except Exception as e:
+                logger.error(f"Failed to update alarm settings: {str(e)}")
+
+    @staticmethod
+    def _parse_holidays(holidays):
+        """Parse the website's holiday list, skipping invalid dates"""
+        parsed = set()
+        for value in holidays:
+            try:
+                parsed.add(date.fromisoformat(value))
+            except (TypeError, ValueError):
+                logger.error(f"Skipping invalid holiday {value!r}")
+        return parsed
+
+    def occurrences_between(self, start, end):
+        """(datetime, alarm) pairs for the alarm occurrences in [start, end)"""
+        with self._write_lock:
+            return self.recurrence.between(start, end)
+
+    @property
+    def alarms(self):
+        """Get the current alarms as a tuple"""
+        return self.snapshot.alarms
 
     def get_active_alarms(self):
-        """Get list of active alarms"""
-        return [alarm for alarm in self.alarms if alarm['enabled']]
+        """Get the enabled alarms as a tuple"""
+        return self.snapshot.enabled
+
+    def next_event(self, kind=None):
+        """Get the next scheduled alarm event"""
+        return self.snapshot.next_event(kind)
+
+    def seconds_until_next_event(self, now=None):
+        """Get how long the main loop may sleep before check_alarms is due.
+
+        While an alarm rings, due events are held back until it is answered,
+        so only the ring timeout bounds the sleep; the lifecycle's listeners
+        wake the loop when the ring ends.
+        """
+        now = now or self.clock.now()
+        if self.lifecycle.is_ringing():
+            deadline = self.lifecycle.ring_deadline
+            return max(0.0, (deadline - now).total_seconds()) if deadline else None
+        event = self.snapshot.next_event()
+        if event is None:
+            return None
+        return max(0.0, (event.fire_time - now).total_seconds())
+
+    def _publish(self, alarms=None):
+        """Swap in a new snapshot if the alarms or next events changed (caller holds the lock)"""
+        current = self.snapshot
+        if alarms is None or alarms == current.alarms:
+            alarms, enabled = current.alarms, current.enabled
+        else:
+            enabled = tuple(alarm for alarm in alarms if alarm.enabled)
+        next_ring = self.scheduler.next_event(RING)
+        next_wake = self.scheduler.next_event(WAKE)
+        if (alarms, enabled, next_ring, next_wake) != current[1:]:
+            self.snapshot = AlarmSnapshot(current.version + 1, alarms, enabled, next_ring, next_wake)
+
+    @property
+    def active_alarm(self):
+        """Get the alarm that is currently ringing, if any"""
+        return self.lifecycle.alarm if self.lifecycle.is_ringing() else None
 
     def check_alarms(self):
-        """Check if any alarms should be triggered"""
-        if self.active_alarm:
-            return  # Don't check for new alarms while one is active
-        
-        current_time = datetime.now()
-        current_weekday = current_time.weekday()
-        
-        for alarm in self.alarms:
-            if not alarm['enabled']:
-                continue
+        """Fire any alarm events that are due"""
+        with self._write_lock:
+            if self.lifecycle.is_ringing():
+                return  # Ring events wait until the current alarm is answered
+            
+            # Every event in this tick is judged against the same timestamp
+            current_time = self.clock.tick()
+            grace = self.missed_alarm_grace
             
-            # Check if alarm should trigger on current day
-            if alarm['days'] and current_weekday not in alarm['days']:
-                continue
+            # Events that came due while the last alarm rang were held back, not missed
+            held_since = self._held_since
+            expire_before = current_time - grace
+            if held_since is not None:
+                expire_before = min(expire_before, held_since - grace)
             
-            alarm_time = datetime.combine(current_time.date(), alarm['time'])
+            # One-shots that are too late to ring are dropped, not rung
+            for event in self.scheduler.one_shots.expire(expire_before):
+                if event.kind == TIMER:
+                    if self.store:
+                        self.store.record_timer_done(event.fire_time)
+                else:
+                    self.lifecycle.release_snooze((event.kind, event.fire_time))
+                    if self.lifecycle.state != SNOOZED or self.scheduler.one_shots.events(SNOOZE):
+                        continue
+                    # The snooze being waited for will never ring
+                    self.lifecycle.dismiss(reason="expired")
+                    if self.store:
+                        self.store.record_dismiss()
+            
+            while not self.lifecycle.is_ringing():
+                event = self.scheduler.pop_due(current_time)
+                if event is None:
+                    break
+                if event.kind == SNOOZE:
+                    self.lifecycle.release_snooze((event.kind, event.fire_time))
+                
+                held = held_since is not None and event.fire_time >= held_since - grace
+                if not held and current_time - event.alarm_time > grace:
+                    logger.warning(f"Skipping missed alarm event for {event.alarm_time}")
+                    continue
+                
+                if event.kind == TIMER and self.store:
+                    self.store.record_timer_done(event.fire_time)
+                
+                if held and event.kind == WAKE and event.alarm_time <= current_time:
+                    continue  # Too late to wake gradually; its ring was held too
+                if held and event.kind != WAKE:
+                    following = self.scheduler.next_event(RING)
+                    if following and following.fire_time <= current_time:
+                        # Several rings held behind one alarm sound once, for the latest
+                        logger.info(f"Coalescing held alarm for {event.alarm_time} into a later one")
+                        continue
+                
+                if event.kind == WAKE:
+                    self._start_gradual_wake(event.alarm, event.alarm_time, current_time)
+                else:
+                    self._trigger_alarm(event.alarm, event.alarm_time)
             
-            # Check if it's time for gradual wake-up
-            if alarm['gradual_wake']:
-                wake_start_time = alarm_time - self.gradual_wake_duration
-                if wake_start_time <= current_time <= alarm_time:
-                    self._start_gradual_wake(alarm, alarm_time)
+            if not self.lifecycle.is_ringing():
+                self._held_since = None
             
-            # Check if it's alarm time
-            if (current_time - alarm_time).total_seconds() < 60:  # Within 1 minute
-                self._trigger_alarm(alarm)
+            self._publish()
+            self._preload_next_sound()
+
+    def _preload_next_sound(self):
+        """Decode the next alarm's sound ahead of its fire time"""
+        event = self.scheduler.next_event(RING)
+        if event and event.alarm.sound != self._preloaded_sound:
+            self._preloaded_sound = event.alarm.sound
+            self.hardware.preload_sound(self._preloaded_sound)
 
-    def _start_gradual_wake(self, alarm, alarm_time):
+    def _start_gradual_wake(self, alarm, alarm_time, current_time):
         """Start gradual wake-up routine"""
         try:
-            # Calculate progress through wake-up period
-            current_time = datetime.now()
-            wake_start_time = alarm_time - self.gradual_wake_duration
-            progress = (current_time - wake_start_time).total_seconds() / \
-                      self.gradual_wake_duration.total_seconds()
+            profile = get_wake_profile(
+                alarm.wake_profile,
+                self.gradual_wake_duration.total_seconds()
+            )
             
-            # Gradually increase brightness
-            brightness = int(progress * 100)
-            self.hardware.set_led_brightness(brightness)
+            # Join the wake window where it currently is (e.g. after a settings change)
+            wake_start_time = alarm_time - self.gradual_wake_duration
+            elapsed = (current_time - wake_start_time).total_seconds()
             
-            # Gradually change color temperature (warm to cool)
-            r = int(255 * (1 - progress))  # Decrease red
-            b = int(255 * progress)        # Increase blue
-            g = int(128)                   # Keep some green
-            self.hardware.set_led_color(r, g, b, transition_time=1)
+            # The LED engine samples the precomputed curves from here on
+            self.lifecycle.pre_wake(alarm, alarm_time, profile, elapsed)
             
         except Exception as e:
             logger.error(f"Error during gradual wake: {str(e)}")
 
-    def _trigger_alarm(self, alarm):
+    def _trigger_alarm(self, alarm, alarm_time):
         """Trigger the alarm"""
         try:
-            self.active_alarm = alarm
-            
-            # Start alarm in separate thread
-            self.stop_thread = False
-            self.alarm_thread = threading.Thread(target=self._alarm_routine)
-            self.alarm_thread.start()
-            
-            logger.info("Alarm triggered successfully")
+            if self.lifecycle.ring(alarm, alarm_time):
+                if self._held_since is None:
+                    self._held_since = self.clock.now()
+                logger.info("Alarm triggered successfully")
         except Exception as e:
             logger.error(f"Failed to trigger alarm: {str(e)}")
-            self.active_alarm = None
-
-    def _alarm_routine(self):
-        """Run the alarm routine"""
-        try:
-            while not self.stop_thread:
-                # Set maximum brightness
-                self.hardware.set_led_brightness(100)
-                self.hardware.set_led_color(255, 255, 255)
-                
-                # Play alarm sound
-                self.hardware.play_sound(
-                    self.active_alarm['sound'],
-                    loop=True
-                )
-                
-                # Wait for stop or snooze
-                time.sleep(0.1)
-            
-        except Exception as e:
-            logger.error(f"Error in alarm routine: {str(e)}")
-        finally:
-            self.hardware.stop_sound()
-            self.hardware.set_led_brightness(0)
 
     def snooze(self):
         """Snooze the current alarm"""
-        if self.active_alarm and self.active_alarm['snooze_enabled']:
-            try:
-                self.stop_thread = True
-                if self.alarm_thread:
-                    self.alarm_thread.join()
-                
-                # Create new alarm time
-                current_time = datetime.now()
-                snooze_time = (current_time + self.snooze_duration).time()
-                
-                # Create temporary snooze alarm
-                snooze_alarm = self.active_alarm.copy()
-                snooze_alarm['time'] = snooze_time
-                snooze_alarm['gradual_wake'] = False  # Disable gradual wake for snooze
-                
-                # Replace active alarm with snooze alarm
-                self.active_alarm = None
-                self.alarms.append(snooze_alarm)
-                
-                logger.info("Alarm snoozed successfully")
-            except Exception as e:
-                logger.error(f"Failed to snooze alarm: {str(e)}")
+        with self._write_lock:
+            alarm = self.active_alarm
+            if alarm and alarm.snooze_enabled:
+                try:
+                    # Create new alarm time
+                    current_time = self.clock.now()
+                    snooze_time = current_time + self.snooze_duration
+                    
+                    # Create temporary snooze alarm
+                    snooze_alarm = alarm._replace(
+                        time=snooze_time.time(),
+                        gradual_wake=False  # Disable gradual wake for snooze
+                    )
+                    
+                    # Silence now and ring again from a one-shot snooze event
+                    key = self.scheduler.schedule_snooze(snooze_alarm, snooze_time)
+                    if self.lifecycle.snooze(key):
+                        if self.store:
+                            self.store.record_snooze(snooze_alarm.to_entry(), snooze_time)
+                        logger.info("Alarm snoozed successfully")
+                    else:
+                        self.scheduler.unschedule(key)
+                    self._publish()
+                except Exception as e:
+                    logger.error(f"Failed to snooze alarm: {str(e)}")
 
-    def stop_alarm(self):
-        """Stop the current alarm"""
-        if self.active_alarm:
+    def add_timer(self, minutes=None, at=None, sound=None):
+        """Ring once, `minutes` from now or at the datetime `at`.
+
+        Returns the fire time, or None if the timer was rejected.
+        """
+        with self._write_lock:
             try:
-                self.stop_thread = True
-                if self.alarm_thread:
-                    self.alarm_thread.join()
-                self.active_alarm = None
-                logger.info("Alarm stopped successfully")
-            except Exception as e:
-                logger.error(f"Failed to stop alarm: {str(e)}")
+                fire_time = at or self.clock.now() + timedelta(minutes=minutes)
+                fire_time = fire_time.replace(microsecond=0)
+                entry = {'time': fire_time.strftime("%H:%M"), 'gradual_wake': False}
+                if sound:
+                    entry['sound'] = sound
+                alarm = self.parser.parse(entry)
+                self.scheduler.schedule_timer(alarm, fire_time)
+                if self.store:
+                    self.store.record_timer(alarm.to_entry(), fire_time)
+                self._publish()
+                self._preload_next_sound()
+                logger.info(f"Timer set for {fire_time}")
+                return fire_time
+            except (TypeError, ValueError) as e:
+                logger.error(f"Failed to add timer: {str(e)}")
+                return None
+
+    def cancel_timer(self, fire_time):
+        """Cancel a pending timer; returns whether there was one"""
+        with self._write_lock:
+            if not self.scheduler.one_shots.remove((TIMER, fire_time)):
+                return False
+            if self.store:
+                self.store.record_timer_done(fire_time)
+            self._publish()
+            return True
+
+    def pending_timers(self):
+        """Fire times of the pending timers, earliest first"""
+        with self._write_lock:
+            return [event.fire_time for event in self.scheduler.one_shots.events(TIMER)]
+
+    def stop_alarm(self, persist=True):
+        """Stop the current alarm, including a pending snooze or gradual wake"""
+        with self._write_lock:
+            snoozes = self.scheduler.one_shots.events(SNOOZE)
+            if self.lifecycle.state in (PRE_WAKE, RINGING, SNOOZED) or snoozes:
+                try:
+                    self.lifecycle.dismiss()
+                    # A dismissal ends every pending snooze, whichever alarm it belongs
+                    # to, as the store's record_dismiss() does
+                    for event in snoozes:
+                        key = (event.kind, event.fire_time)
+                        self.lifecycle.release_snooze(key)
+                        self.scheduler.unschedule(key)
+                    if snoozes:
+                        self._publish()
+                    if persist and self.store:
+                        self.store.record_dismiss()
+                    logger.info("Alarm stopped successfully")
+                except Exception as e:
+                    logger.error(f"Failed to stop alarm: {str(e)}")
 
     def cleanup(self):
         """Clean up resources"""
-        self.stop_alarm() 
\ No newline at end of file
+        self.stop_alarm(persist=False)  # A pending snooze survives the restart
+        self.lifecycle.stop()
+        if self.store:
+            self.store.close() 
\ No newline at end of file
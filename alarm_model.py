@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sys
+from collections import namedtuple
+from datetime import time
+
+from recurrence import occurs_on, parse_recurrence
+from scheduler import RING, WAKE
+from wake_profile import DEFAULT_PROFILE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALARM_SOUND = os.path.join("sounds", "digital.mp3")
+EVERY_DAY = 0  # Empty weekday mask: the alarm repeats daily
+
+
+class Alarm(namedtuple('Alarm', [
+        'time', 'days', 'enabled', 'sound', 'gradual_wake', 'snooze_enabled', 'wake_profile',
+        'rule'], defaults=(None,))):
+    """Immutable alarm settings.
+
+    `days` is a weekday bitmask (bit 0 is Monday); 0 means every day.
+    `rule` is a recurrence.Recurrence for richer schedules, or None.
+    Alarms are hashable and compare by value, so equal settings share
+    scheduler entries.
+    """
+
+    __slots__ = ()
+
+    def on_day(self, weekday):
+        """Check whether the alarm rings on a weekday (0 is Monday)"""
+        return not self.days or self.days >> weekday & 1
+
+    def to_entry(self):
+        """Website-style entry for this alarm (the recurrence rule is not included)"""
+        return {
+            'time': self.time.strftime("%H:%M"),
+            'days': self.weekdays(),
+            'enabled': self.enabled,
+            'sound': self.sound,
+            'gradual_wake': self.gradual_wake,
+            'snooze_enabled': self.snooze_enabled,
+            'wake_profile': self.wake_profile,
+        }
+
+    def occurs_on(self, day, holidays=frozenset()):
+        """Check whether the alarm rings on a date"""
+        if self.rule is None:
+            return self.on_day(day.weekday())
+        return occurs_on(self.rule, day, holidays)
+
+    def weekdays(self):
+        """Weekdays as a list, empty for every day"""
+        return [day for day in range(7) if self.days >> day & 1]
+
+
+class AlarmSnapshot(namedtuple('AlarmSnapshot', [
+        'version', 'alarms', 'enabled', 'next_ring', 'next_wake'])):
+    """Immutable view of the alarm set and its next events.
+
+    `alarms` and `enabled` are tuples; `next_ring` and `next_wake` are
+    scheduler AlarmEvents or None. A new snapshot with a higher version
+    replaces the old one whenever any of them changes.
+    """
+
+    __slots__ = ()
+
+    def next_event(self, kind=None):
+        """The next event of a kind, or the earliest of both"""
+        if kind == RING:
+            return self.next_ring
+        if kind == WAKE:
+            return self.next_wake
+        events = [event for event in (self.next_ring, self.next_wake) if event]
+        return min(events, key=lambda event: event.fire_time) if events else None
+
+
+EMPTY_SNAPSHOT = AlarmSnapshot(0, (), (), None, None)
+
+
+def days_mask(days):
+    """Build a weekday bitmask from a list of weekday numbers"""
+    mask = 0
+    for day in days:
+        if isinstance(day, bool) or not isinstance(day, int) or not 0 <= day <= 6:
+            raise ValueError(f"invalid weekday {day!r}")
+        mask |= 1 << day
+    return mask
+
+
+class AlarmParser:
+    """Turns website alarm entries into Alarm objects.
+
+    Each entry is validated on its own, so one bad entry does not stop the
+    rest. Parsed times, weekday masks and sound paths are memoized, and
+    alarms parsed from identical entries are reused across updates. With a
+    SoundLibrary, sounds missing from it are replaced by the default sound.
+    """
+
+    FLAGS = ('enabled', 'gradual_wake', 'snooze_enabled')
+
+    def __init__(self, default_sound=DEFAULT_ALARM_SOUND, sounds_dir="sounds", library=None):
+        """Initialize the AlarmParser"""
+        self.default_sound = default_sound
+        self.sounds_dir = sounds_dir
+        self.library = library
+        self._library_generation = library.generation if library else None
+        self._times = {}  # "HH:MM" -> datetime.time
+        self._masks = {}  # tuple of weekdays -> bitmask
+        self._sounds = {}  # sound name -> interned path
+        self._previous = {}  # entry key -> Alarm from the last parse_all()
+
+        self.stats = {
+            'parsed': 0,
+            'reused': 0,
+            'invalid': 0,
+        }
+
+    def parse(self, entry):
+        """Build an Alarm from one entry, raising ValueError if it is invalid"""
+        if not isinstance(entry, dict):
+            raise ValueError("alarm entry is not an object")
+        if 'time' not in entry:
+            raise ValueError("missing 'time'")
+
+        flags = []
+        for name in self.FLAGS:
+            value = entry.get(name, True)
+            if not isinstance(value, bool):
+                raise ValueError(f"'{name}' must be true or false")
+            flags.append(value)
+
+        wake_profile = entry.get('wake_profile', DEFAULT_PROFILE)
+        if not isinstance(wake_profile, str):
+            raise ValueError("'wake_profile' must be a string")
+
+        enabled, gradual_wake, snooze_enabled = flags
+        days = self._parse_days(entry.get('days', []))
+        alarm = Alarm(
+            time=self._parse_time(entry['time']),
+            days=days,
+            enabled=enabled,
+            sound=self._resolve_sound(entry.get('sound', self.default_sound)),
+            gradual_wake=gradual_wake,
+            snooze_enabled=snooze_enabled,
+            wake_profile=sys.intern(wake_profile),
+            rule=parse_recurrence(entry, days),
+        )
+        self.stats['parsed'] += 1
+        return alarm
+
+    def parse_all(self, entries):
+        """Parse a full alarm list, reusing Alarms whose entries did not change.
+
+        Returns (alarms, errors) where errors lists (index, message) for the
+        entries that were skipped.
+        """
+        alarms = []
+        errors = []
+        current = {}
+        if self.library and self.library.generation != self._library_generation:
+            # Sound files came or went; resolve every sound again
+            self._library_generation = self.library.generation
+            self._sounds.clear()
+            self._previous = {}
+        for index, entry in enumerate(entries):
+            try:
+                key = _entry_key(entry)
+                alarm = self._previous.get(key)
+            except (AttributeError, TypeError):
+                key = alarm = None  # Not a flat entry; parse() reports why
+            if alarm is not None:
+                self.stats['reused'] += 1
+            else:
+                try:
+                    alarm = self.parse(entry)
+                except ValueError as e:
+                    self.stats['invalid'] += 1
+                    errors.append((index, str(e)))
+                    logger.error(f"Skipping invalid alarm {index}: {str(e)}")
+                    continue
+            if key is not None:
+                current[key] = alarm
+            alarms.append(alarm)
+
+        self._previous = current
+        return alarms, errors
+
+    def _parse_time(self, value):
+        if not isinstance(value, str):
+            raise ValueError(f"invalid time {value!r}, expected HH:MM")
+        parsed = self._times.get(value)
+        if parsed is None:
+            hour, sep, minute = value.partition(':')
+            if not sep or not (hour.isdigit() and minute.isdigit()) \
+                    or len(minute) != 2 or not 0 <= int(hour) <= 23 or not 0 <= int(minute) <= 59:
+                raise ValueError(f"invalid time {value!r}, expected HH:MM")
+            parsed = self._times[value] = time(int(hour), int(minute))
+        return parsed
+
+    def _parse_days(self, days):
+        if not isinstance(days, list) or not all(isinstance(day, int) for day in days):
+            raise ValueError("'days' must be a list of weekdays")
+        key = tuple(days)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._masks[key] = days_mask(days)
+        return mask
+
+    def _resolve_sound(self, sound):
+        if not isinstance(sound, str) or not sound:
+            raise ValueError("'sound' must be a file name")
+        path = self._sounds.get(sound)
+        if path is None:
+            resolved = sound if os.path.dirname(sound) else os.path.join(self.sounds_dir, sound)
+            path = sys.intern(os.path.normpath(resolved))
+            if self.library and not self.library.exists(path):
+                logger.warning(f"Sound {sound!r} is not in the sound library, using the default")
+                path = self.default_sound
+            self._sounds[sound] = path
+        return path
+
+
+def _entry_key(entry):
+    """Hashable canonical form of a raw alarm entry"""
+    return tuple(sorted(
+        (name, tuple(value) if type(value) is list else value)
+        for name, value in entry.items()
+    ))
+
+
+_default_parser = AlarmParser()
+
+
+def parse_alarm(alarm_data, default_sound=DEFAULT_ALARM_SOUND):
+    """Build an Alarm from a website entry, raising ValueError if it is invalid"""
+    if default_sound == _default_parser.default_sound:
+        return _default_parser.parse(alarm_data)
+    return AlarmParser(default_sound).parse(alarm_data)
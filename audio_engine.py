@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+
+import pygame
+
+try:
+    import numpy as np
+    import pygame.sndarray
+except ImportError:
+    np = None
+
+from wake_profile import EASINGS
+
+logger = logging.getLogger(__name__)
+
+AVAILABLE = np is not None  # The engine needs NumPy for pygame.sndarray
+
+CURVE_POINTS = 64  # Breakpoints used to approximate an easing curve
+
+
+class Envelope:
+    """Piecewise-linear gain curve over sample positions.
+
+    Gains are interpolated per sample, so ramps are smooth no matter how
+    large the mixing blocks are.
+    """
+
+    def __init__(self, positions, gains):
+        """Initialize the Envelope"""
+        self.positions = np.asarray(positions, dtype=np.float64)
+        self.gains = np.asarray(gains, dtype=np.float32)
+
+    @classmethod
+    def constant(cls, gain):
+        return cls([0.0], [gain])
+
+    @classmethod
+    def ramp(cls, start_gain, end_gain, samples, curve='linear'):
+        """Ramp from one gain to another over a number of samples"""
+        ease = EASINGS[curve]
+        progress = np.linspace(0.0, 1.0, CURVE_POINTS if curve != 'linear' else 2)
+        eased = np.array([ease(t) for t in progress], dtype=np.float32)
+        return cls(progress * max(1, samples), start_gain + (end_gain - start_gain) * eased)
+
+    @classmethod
+    def equal_power(cls, start_gain, end_gain, samples, rising=True):
+        """Sine (rising) or cosine (falling) ramp; a rising and a falling one sum to constant power"""
+        progress = np.linspace(0.0, 1.0, CURVE_POINTS)
+        quarter = progress * (np.pi / 2)
+        weight = np.sin(quarter) if rising else 1.0 - np.cos(quarter)
+        return cls(progress * max(1, samples), start_gain + (end_gain - start_gain) * weight)
+
+    @classmethod
+    def table(cls, gains, rate, sample_rate, offset=0.0):
+        """Follow a gain table sampled `rate` times a second, starting `offset` seconds in"""
+        positions = (np.arange(len(gains)) / rate - offset) * sample_rate
+        return cls(positions, gains)
+
+    def sample(self, start, count):
+        """Gains for `count` samples from position `start`"""
+        if len(self.positions) == 1:
+            return np.full(count, self.gains[0], dtype=np.float32)
+        return np.interp(
+            np.arange(start, start + count, dtype=np.float64), self.positions, self.gains
+        ).astype(np.float32)
+
+    def at(self, position):
+        return float(self.sample(position, 1)[0])
+
+    def final_gain(self):
+        return float(self.gains[-1])
+
+    def end(self):
+        return self.positions[-1]
+
+
+class _Voice:
+    """One sound being mixed: its samples, play position and gain envelope"""
+
+    def __init__(self, samples, loop, envelope):
+        self.samples = samples  # (frames, channels) int16 view of the decoded sound
+        self.loop = loop
+        self.envelope = envelope
+        self.position = 0  # Next frame of `samples`
+        self.clock = 0  # Frames mixed since the voice started; envelope time
+        self.stop_when_silent = False
+
+    def read(self, count):
+        """Next `count` frames as float32, wrapping when looping"""
+        length = len(self.samples)
+        end = self.position + count
+        if end <= length:
+            chunk = self.samples[self.position:end]
+        elif self.loop:
+            indices = np.arange(self.position, end) % length
+            chunk = self.samples[indices]
+        else:
+            chunk = self.samples[self.position:]
+        self.position = end % length if self.loop else min(end, length)
+        return chunk.astype(np.float32)
+
+    def finished(self):
+        if not self.loop and self.position >= len(self.samples):
+            return True
+        return self.stop_when_silent and self.clock >= self.envelope.end() \
+            and self.envelope.final_gain() <= 0.0
+
+
+class AudioEngine:
+    """Software mixer for layered sounds with per-sample gain envelopes.
+
+    Named voices (e.g. an ambient bed and the alarm) are mixed block by block
+    in NumPy and streamed gaplessly through one reserved mixer channel, with
+    one block playing and one queued. Fades and crossfades change the gain
+    envelopes, so they take effect within two blocks.
+    """
+
+    def __init__(self, sounds, block_seconds=0.05):
+        """Initialize the AudioEngine on an initialized pygame mixer"""
+        self.sounds = sounds
+        self.sample_rate, sample_format, self.channels = pygame.mixer.get_init()
+        if sample_format != -16:
+            raise ValueError(f"Unsupported mixer sample format {sample_format}")
+        self.block_frames = int(self.sample_rate * block_seconds)
+        self.master = 1.0
+
+        # Keep the output channel away from SoundCache.play()
+        pygame.mixer.set_reserved(1)
+        self.output = pygame.mixer.Channel(0)
+
+        self._voices = {}  # name -> _Voice
+        self._condition = threading.Condition()
+        self._running = True
+
+        self.stats = {
+            'blocks': 0,
+            'underruns': 0,
+            'render_time': 0.0,  # Seconds spent mixing
+            'peak_voices': 0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="audio-engine", daemon=True)
+        self._thread.start()
+
+    def play(self, name, path, loop=True, gain=1.0, fade_in=0.0, curve='linear'):
+        """Start a sound as a named voice, replacing any voice of that name"""
+        envelope = Envelope.ramp(0.0, gain, self._frames(fade_in), curve) if fade_in \
+            else Envelope.constant(gain)
+        return self.play_envelope(name, path, envelope, loop)
+
+    def play_envelope(self, name, path, envelope, loop=True):
+        """Start a sound whose gain follows an Envelope"""
+        samples = self._samples(path)
+        if samples is None:
+            return False
+        with self._condition:
+            self._voices[name] = _Voice(samples, loop, envelope)
+            self.stats['peak_voices'] = max(self.stats['peak_voices'], len(self._voices))
+            self._condition.notify_all()
+        return True
+
+    def ramp(self, name, gain, duration, curve='linear'):
+        """Move a voice's gain to `gain` over `duration` seconds from where it is now"""
+        with self._condition:
+            voice = self._voices.get(name)
+            if voice is None:
+                return False
+            start = voice.envelope.at(voice.clock)
+            envelope = Envelope.ramp(start, gain, self._frames(duration), curve)
+            envelope.positions += voice.clock
+            voice.envelope = envelope
+            return True
+
+    def stop(self, name, fade_out=0.0):
+        """Stop a voice, fading it out if requested"""
+        with self._condition:
+            voice = self._voices.get(name)
+            if voice is None:
+                return
+            if not fade_out:
+                del self._voices[name]
+                return
+            self._fade_out(voice, fade_out)
+
+    def stop_all(self, fade_out=0.0):
+        """Stop every voice"""
+        with self._condition:
+            if not fade_out:
+                self._voices.clear()
+                return
+            for voice in self._voices.values():
+                self._fade_out(voice, fade_out)
+
+    def crossfade(self, from_name, to_name, path, duration, loop=True, gain=1.0, envelope=None):
+        """Fade one voice out while another fades in, over the same samples.
+
+        Equal-power curves keep the combined loudness steady. `envelope`
+        replaces the fade-in, e.g. for a crescendo that starts mid-fade.
+        """
+        samples = self._samples(path)
+        if samples is None:
+            return False
+        frames = self._frames(duration)
+        with self._condition:
+            outgoing = self._voices.pop(from_name, None)
+            if outgoing is not None:
+                self._fade_out(outgoing, duration, equal_power=True)
+                self._voices[f"{from_name}:out"] = outgoing
+            self._voices[to_name] = _Voice(
+                samples, loop, envelope or Envelope.equal_power(0.0, gain, frames)
+            )
+            self.stats['peak_voices'] = max(self.stats['peak_voices'], len(self._voices))
+            self._condition.notify_all()
+        return True
+
+    def is_playing(self, name=None):
+        """Check whether a voice (or any voice) is playing"""
+        with self._condition:
+            return name in self._voices if name else bool(self._voices)
+
+    def set_master(self, volume):
+        """Set the output gain (0-1)"""
+        self.master = max(0.0, min(1.0, volume))
+
+    def render_block(self):
+        """Mix the next block of every voice into int16 samples"""
+        start = time.perf_counter()
+        frames = self.block_frames
+        mix = np.zeros((frames, self.channels), dtype=np.float32)
+        with self._condition:
+            for name, voice in list(self._voices.items()):
+                chunk = voice.read(frames)
+                gains = voice.envelope.sample(voice.clock, len(chunk))
+                mix[:len(chunk)] += chunk * gains[:, None]
+                voice.clock += frames
+                if voice.finished():
+                    del self._voices[name]
+        mix *= self.master
+        np.clip(mix, -32768, 32767, out=mix)
+        block = mix.astype(np.int16)
+        self.stats['render_time'] += time.perf_counter() - start
+        self.stats['blocks'] += 1
+        return block
+
+    def buffer_latency(self):
+        """Seconds between a gain change and hearing it: one block playing, one queued"""
+        return 2 * self.block_frames / self.sample_rate
+
+    def cpu_load(self):
+        """Fraction of real time spent mixing"""
+        audio_time = self.stats['blocks'] * self.block_frames / self.sample_rate
+        return self.stats['render_time'] / audio_time if audio_time else 0.0
+
+    def close(self):
+        """Stop the mixing thread and the output"""
+        with self._condition:
+            self._running = False
+            self._voices.clear()
+            self._condition.notify_all()
+        self._thread.join(1.0)
+        self.output.stop()
+
+    def _run(self):
+        """Keep one block queued behind the one playing"""
+        poll = self.block_frames / self.sample_rate / 4
+        while True:
+            with self._condition:
+                while self._running and not self._voices:
+                    self._condition.wait()
+                if not self._running:
+                    return
+            try:
+                if self.output.get_queue() is not None:
+                    time.sleep(poll)
+                    continue
+                sound = pygame.sndarray.make_sound(self.render_block())
+                if self.output.get_busy():
+                    self.output.queue(sound)
+                else:
+                    if self.stats['blocks'] > 1:
+                        self.stats['underruns'] += 1
+                    self.output.play(sound)
+            except Exception as e:
+                logger.error(f"Audio engine error: {str(e)}")
+                time.sleep(poll)
+
+    def _fade_out(self, voice, duration, equal_power=False):
+        """Replace a voice's envelope with a fade to silence (caller holds the lock)"""
+        start, frames = voice.envelope.at(voice.clock), self._frames(duration)
+        envelope = Envelope.equal_power(start, 0.0, frames, rising=False) if equal_power \
+            else Envelope.ramp(start, 0.0, frames)
+        envelope.positions += voice.clock
+        voice.envelope = envelope
+        voice.stop_when_silent = True
+
+    def _frames(self, seconds):
+        return int(seconds * self.sample_rate)
+
+    def _samples(self, path):
+        """Decoded samples of a sound as a (frames, channels) view"""
+        sound = self.sounds.get(path)
+        if sound is None:
+            return None
+        samples = pygame.sndarray.samples(sound)
+        return samples.reshape(-1, 1) if samples.ndim == 1 else samples
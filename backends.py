@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import importlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Backend name -> "module:attribute" of a factory, imported only when chosen
+BACKENDS = {
+    'hardware': {
+        'pi': 'hardware:HardwareController',
+        'simulated': 'simulated:SimulatedHardwareController',
+        'null': 'backends:NullHardwareController',
+    },
+    'display': {
+        'pygame': 'display:Display',
+        'offscreen': 'simulated:create_offscreen_display',
+        'null': 'backends:NullDisplay',
+    },
+}
+
+DEFAULTS = {
+    'hardware': 'pi',
+    'display': 'pygame',
+}
+
+
+def register_backend(kind, name, target):
+    """Register a factory ("module:attribute") for a backend kind"""
+    BACKENDS.setdefault(kind, {})[name] = target
+
+
+def backend_name(kind):
+    """Backend chosen for a kind, from SMARTALARM_<KIND> or the default"""
+    return os.environ.get(f"SMARTALARM_{kind.upper()}", DEFAULTS[kind])
+
+
+def load_backend(kind, name=None):
+    """Import and return the factory for a backend"""
+    name = name or backend_name(kind)
+    try:
+        target = BACKENDS[kind][name]
+    except KeyError:
+        raise ValueError(f"Unknown {kind} backend '{name}'")
+    module_name, attribute = target.split(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def create_backend(kind, name=None, **kwargs):
+    """Create the configured backend for a kind"""
+    name = name or backend_name(kind)
+    logger.info(f"Using {name} {kind} backend")
+    return load_backend(kind, name)(**kwargs)
+
+
+class NullHardwareController:
+    """Hardware backend that does nothing, for running without any devices"""
+
+    def __init__(self, **kwargs):
+        """Initialize the null hardware"""
+        self.pixels = None
+        self.leds = None
+        self.rtc = None
+        self.sound_volume = 0.5
+        self.init_times = {}
+
+    def set_led_brightness(self, brightness_level, transition_time=0):
+        pass
+
+    def set_led_color(self, r, g, b, transition_time=0):
+        pass
+
+    def set_led_gradient(self, start_color, end_color, transition_time=0):
+        pass
+
+    def pulse_leds(self, r, g, b, period=2.0):
+        pass
+
+    def start_wake_profile(self, profile, elapsed=0):
+        pass
+
+    def preload_sound(self, sound_file):
+        pass
+
+    def play_sound(self, sound_file, loop=False, crescendo=0):
+        pass
+
+    def stop_sound(self, fade_out=0):
+        pass
+
+    def set_volume(self, volume_level):
+        self.sound_volume = max(0, min(1.0, volume_level / 100))
+
+    def get_rtc_time(self):
+        return None
+
+    def set_rtc_time(self, datetime_obj):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+class NullDisplay:
+    """Display backend that renders nothing"""
+
+    def __init__(self, **kwargs):
+        """Initialize the null display"""
+        self.stats = {'frames': 0, 'last_frame_time': 0.0, 'last_present_time': 0.0}
+        self.prepared_time = None
+
+    def update(self, time=None, weather=None, next_alarm=None):
+        self.prepare(time, weather, next_alarm)
+        self.present()
+
+    def prepare(self, time=None, weather=None, next_alarm=None):
+        self.prepared_time = time
+
+    def present(self):
+        self.stats['frames'] += 1
+
+    def invalidate(self):
+        pass
+
+    def cleanup(self):
+        pass
@@ -0,0 +1,710 @@
+#!/usr/bin/env python3
+"""Headless benchmarks for the SmartAlarm hot paths.
+
+Runs against simulated hardware drivers and an offscreen SDL display, so it
+works on any machine with pygame installed. Results are printed as JSON:
+
+    python benchmark.py --output bench.json
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import os
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Importing pygame prints a banner to stdout, ahead of the JSON results
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from backends import create_backend
+from simulated import use_offscreen_sdl
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def _summarize(samples):
+    """Summarize a list of durations (seconds) in milliseconds"""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        'runs': len(samples),
+        'min_ms': ordered[0] * 1000,
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p95_ms': p95 * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def _time_calls(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return _summarize(samples)
+
+
+def _alarm_payload(count, seed=0):
+    """Build a website settings payload with `count` random alarms"""
+    rng = random.Random(seed)
+    alarms = []
+    for _ in range(count):
+        alarms.append({
+            'time': f"{rng.randrange(24):02d}:{rng.randrange(60):02d}",
+            'days': sorted(rng.sample(range(7), rng.randrange(8))),
+            'enabled': rng.random() > 0.1,
+            'gradual_wake': rng.random() > 0.5,
+        })
+    return {'alarms': alarms}
+
+
+def _manager(hardware):
+    """AlarmManager without a lifecycle watcher thread; call cleanup() when done"""
+    from alarm import AlarmManager
+    from lifecycle import AlarmLifecycle
+
+    return AlarmManager(hardware, lifecycle=AlarmLifecycle(hardware, watch=False))
+
+
+def bench_update_settings(hardware, sizes, repeat):
+    results = {}
+    for size in sizes:
+        payload = _alarm_payload(size)
+
+        # Managers are built ahead, so only the first parse and schedule is timed
+        managers = [_manager(hardware) for _ in range(repeat)]
+        fresh = iter(managers)
+        initial = _time_calls(lambda: next(fresh).update_settings(payload), repeat)
+        for manager in managers:
+            manager.cleanup()
+
+        manager = _manager(hardware)
+        manager.update_settings(payload)
+        unchanged = _alarm_payload(size)  # Equal content, new objects
+        results[str(size)] = {
+            'initial': initial,
+            'unchanged': _time_calls(lambda: manager.update_settings(unchanged), repeat),
+        }
+        manager.cleanup()
+    return results
+
+
+def _traced_bytes(build):
+    """Bytes still allocated by build() once it returns (its result is kept alive)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return allocated
+
+
+def bench_alarm_model(sizes, repeat):
+    from alarm_model import AlarmParser
+
+    results = {}
+    for size in sizes:
+        entries = _alarm_payload(size)['alarms']
+        # Same content as new objects, as a fresh settings payload would be
+        same_entries = _alarm_payload(size)['alarms']
+
+        parser = AlarmParser()
+        alarms, _ = parser.parse_all(entries)
+        as_dicts = lambda: [dict(alarm._asdict(), days=alarm.weekdays()) for alarm in alarms]
+
+        cold = _time_calls(lambda: AlarmParser().parse_all(entries), repeat)
+        warm = _time_calls(lambda: parser.parse_all(same_entries), repeat)
+        results[str(size)] = {
+            'cold_parse': cold,
+            'cold_alarms_per_second': size / (cold['mean_ms'] / 1000),
+            'warm_parse': warm,
+            'warm_alarms_per_second': size / (warm['mean_ms'] / 1000),
+            'bytes_per_alarm': _traced_bytes(lambda: AlarmParser().parse_all(entries)[0]) / size,
+            'dict_bytes_per_alarm': _traced_bytes(as_dicts) / size,
+        }
+    return results
+
+
+def bench_check_alarms(hardware, sizes, repeat):
+    results = {}
+    for size in sizes:
+        manager = _manager(hardware)
+        manager.update_settings(_alarm_payload(size))
+        # Measure evaluation only, not the hardware outputs of a ring
+        manager._trigger_alarm = lambda alarm, alarm_time: None
+        manager._start_gradual_wake = lambda alarm, alarm_time, current_time: None
+        results[str(size)] = _time_calls(manager.check_alarms, repeat)
+        manager.cleanup()
+    return results
+
+
+def bench_snapshots(hardware, seconds, writers=2, readers=4, size=200):
+    """Hammer AlarmManager with concurrent updates while readers check every snapshot"""
+    import threading
+
+    manager = _manager(hardware)
+    manager._trigger_alarm = lambda alarm, alarm_time: None
+    manager._start_gradual_wake = lambda alarm, alarm_time, current_time: None
+    payloads = [_alarm_payload(size, seed) for seed in range(4)]
+    stop = threading.Event()
+    writes = [0] * writers
+    reads = [0] * readers
+    violations = []
+
+    def write(index):
+        rng = random.Random(index)
+        while not stop.is_set():
+            if rng.random() < 0.8:
+                manager.update_settings(rng.choice(payloads), persist=False)
+            else:
+                manager.check_alarms()
+            writes[index] += 1
+
+    def read(index):
+        last_version = 0
+        while not stop.is_set():
+            snapshot = manager.snapshot
+            if snapshot.version < last_version:
+                violations.append(f"version went back from {last_version} to {snapshot.version}")
+            last_version = snapshot.version
+            if snapshot.enabled != tuple(alarm for alarm in snapshot.alarms if alarm.enabled):
+                violations.append(f"enabled view does not match alarms in version {snapshot.version}")
+            ring = snapshot.next_ring
+            if ring is not None and ring.alarm not in snapshot.enabled:
+                violations.append(f"next ring is not an enabled alarm in version {snapshot.version}")
+            reads[index] += 1
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)] + \
+        [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    result = {
+        'seconds': seconds,
+        'writes': sum(writes),
+        'reads': sum(reads),
+        'versions': manager.snapshot.version,
+        'violations': len(violations),
+        'first_violation': violations[0] if violations else None,
+        'read_call': _time_calls(manager.get_active_alarms, 1000),
+    }
+    manager.cleanup()
+    return result
+
+
+def bench_display(frames):
+    from display import Display
+    from scheduler import AlarmEvent, RING
+
+    display = Display()
+    weather = {'temperature': 21, 'condition': 'Clouds'}
+    alarm_time = datetime.now().replace(second=0, microsecond=0) + timedelta(hours=8)
+    next_alarm = AlarmEvent(alarm_time, RING, {}, alarm_time)
+
+    start = datetime.now().replace(second=0, microsecond=0)
+    minute_samples = []
+    idle_samples = []
+    swap_samples = []  # What remains at the minute boundary once the frame is prepared
+    for frame in range(frames):
+        now = start + timedelta(minutes=frame)
+        for samples in (minute_samples, idle_samples):
+            begin = time.perf_counter()
+            display.prepare(time=now, weather=weather, next_alarm=next_alarm)
+            prepared = time.perf_counter()
+            display.present()
+            samples.append(time.perf_counter() - begin)
+            if samples is minute_samples:
+                swap_samples.append(time.perf_counter() - prepared)
+
+    results = {
+        'minute_change': _summarize(minute_samples),
+        'unchanged': _summarize(idle_samples),
+        'minute_swap': _summarize(swap_samples),
+        'cache_hit_ratio': display.cache_hit_ratio(),
+    }
+    display.cleanup()
+    return results
+
+
+def bench_leds(hardware, repeat):
+    cycle = itertools.cycle([(255, 0, 0), (0, 255, 0), (0, 0, 255)])
+    engine = hardware.leds
+    engine.wait_idle(5)
+    before = dict(engine.stats)
+    shows_before = hardware.pixels.show_count
+    results = {
+        'instant': _time_calls(lambda: hardware.set_led_color(*next(cycle)), repeat),
+        'transition_100ms': _time_calls(
+            lambda: hardware.set_led_color(*next(cycle), transition_time=0.1),
+            max(1, repeat // 10)
+        ),
+        'brightness': _time_calls(lambda: hardware.set_led_brightness(50), repeat),
+    }
+    # Commands return before they are drawn: count frames once the engine has caught up
+    results['settled'] = engine.wait_idle(5)
+    results['commands'] = engine.stats['commands'] - before['commands']
+    results['frames'] = engine.stats['frames'] - before['frames']
+    results['show_calls'] = hardware.pixels.show_count - shows_before
+    return results
+
+
+def bench_sound(hardware, repeat):
+    results = {}
+    sounds_dir = 'sounds'
+    for name in sorted(os.listdir(sounds_dir)):
+        if not name.endswith('.mp3'):
+            continue
+        path = os.path.join(sounds_dir, name)
+
+        def start():
+            hardware.play_sound(path, loop=True)
+            hardware.stop_sound()
+
+        # First start decodes the file, later ones play from the sound cache
+        results[name] = {
+            'cold': _time_calls(start, 1),
+            'warm': _time_calls(start, repeat),
+        }
+    results['cached_bytes'] = hardware.sounds.cached_bytes
+    return results
+
+
+def bench_sound_library(repeat):
+    """Cost of building the sound index, and of loading and querying it afterwards"""
+    import tempfile
+    from sound_library import SoundLibrary
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_file = os.path.join(directory, 'sound_index.json')
+        start = time.perf_counter()
+        library = SoundLibrary('sounds', index_file)
+        library.refresh()
+        cold = time.perf_counter() - start
+
+        paths = [info.path for info in library.catalogue()]
+        return {
+            'sounds': len(paths),
+            'cold_index_ms': cold * 1000,
+            'warm_load': _time_calls(lambda: SoundLibrary('sounds', index_file), repeat),
+            'gain_lookup': _time_calls(lambda: [library.gain(path) for path in paths], repeat),
+            'gains': {os.path.basename(path): round(library.gain(path), 3) for path in paths},
+        }
+
+
+def bench_audio(hardware, blocks):
+    """Mixing cost of an ambient bed crossfading into a crescendo"""
+    from wake_profile import get_wake_profile
+
+    engine = hardware.audio
+    if engine is None:
+        return {'available': False}
+
+    hardware.start_wake_profile(get_wake_profile('sunrise', 60), elapsed=50)
+    hardware.play_sound(os.path.join('sounds', 'classic.mp3'), loop=True, crescendo=5)
+    block_seconds = engine.block_frames / engine.sample_rate
+    render = _time_calls(engine.render_block, blocks)
+    hardware.stop_sound()
+    return {
+        'available': True,
+        'sample_rate': engine.sample_rate,
+        'block_ms': block_seconds * 1000,
+        'render': render,
+        'cpu_load': render['mean_ms'] / 1000 / block_seconds,
+        'buffer_latency_ms': engine.buffer_latency() * 1000,
+        'underruns': engine.stats['underruns'],
+        'peak_voices': engine.stats['peak_voices'],
+    }
+
+
+def bench_settings_push(changes, alarms=20, heartbeat=30, idle_seconds=2.0):
+    """Propagation latency and daily traffic of pushed settings against a local stand-in"""
+    from settings_sync import SettingsPushClient
+    from simulated import SimulatedSettingsServer
+
+    payload = _alarm_payload(alarms)
+    server = SimulatedSettingsServer(payload, heartbeat=0.1)
+    server.start()
+    received = {}
+    client = SettingsPushClient(
+        f"{server.url}/stream", lambda settings: received.setdefault(client.version, time.time()),
+        idle_timeout=5, min_backoff=0.05, max_backoff=0.5
+    )
+    client.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not client.connected and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # Idle traffic is heartbeats only; scale the measured size to the production interval
+        before = client.stats['bytes_received'], client.stats['heartbeats']
+        time.sleep(idle_seconds)
+        heartbeat_bytes = (client.stats['bytes_received'] - before[0]) / \
+            max(1, client.stats['heartbeats'] - before[1])
+
+        published = {}
+        bytes_before = client.stats['bytes_received']
+        for index in range(changes):
+            if index == changes // 2:
+                server.drop_connections()  # The client must resume without losing changes
+            version = server.publish({'snooze_duration': 5 + index % 5})
+            published[str(version)] = server.history[-1][2]
+            time.sleep(0.02)
+        deadline = time.monotonic() + 5
+        while client.version != str(server.version) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        change_bytes = (client.stats['bytes_received'] - bytes_before) / changes
+    finally:
+        client.stop()
+        server.stop()
+
+    latencies = [received[version] - when for version, when in published.items() if version in received]
+    document_bytes = len(json.dumps(payload))
+    return {
+        'changes': changes,
+        'delivered': len(latencies),
+        'final_version_received': client.version == str(server.version),
+        'reconnects': client.stats['connects'] - 1,
+        'latency': _summarize(latencies) if latencies else None,
+        'bytes_per_change': change_bytes,
+        'bytes_per_heartbeat': heartbeat_bytes,
+        'idle_push_bytes_per_day': heartbeat_bytes * 86400 / heartbeat,
+        'poll_bytes_per_day': document_bytes * 1440,  # Full document every minute
+    }
+
+
+def bench_weather(repeat, clients=8):
+    """Weather cache hits, conditional revalidation, backoff and coalescing against a local stand-in"""
+    import threading
+    from simulated import SimulatedWeatherServer
+    from weather import CURRENT, FORECAST, WeatherService
+
+    city, key = '2950159', 'bench'
+    server = SimulatedWeatherServer()
+    server.set_weather(city, 21, "Clouds")
+    server.start()
+    cache_dir = tempfile.TemporaryDirectory()
+    service = WeatherService(server.url, os.path.join(cache_dir.name, "weather_cache.json"))
+    service.min_backoff = 60
+
+    def expire(kind):
+        with service._lock:
+            service._entries[(kind, city)]['updated'] -= service.ttl[kind] * 2
+
+    try:
+        cold = {kind: _time_calls(lambda: service.fetch(kind, city, key), 1) for kind in (CURRENT, FORECAST)}
+        forecast = service.get(FORECAST, city, key)
+
+        # Fresh entries are answered from memory without touching the server
+        requests_before = sum(server.requests.values())
+        hits = _time_calls(lambda: service.get(CURRENT, city, key), repeat * 20)
+        hit_requests = sum(server.requests.values()) - requests_before
+
+        # Unchanged weather revalidates with an empty 304
+        expire(CURRENT)
+        bytes_before = server.bytes_sent
+        revalidate = _time_calls(lambda: service.fetch(CURRENT, city, key), 1)
+        not_modified_bytes = server.bytes_sent - bytes_before
+
+        # Failures back off: the retry inside the backoff window is not sent
+        expire(CURRENT)
+        server.fail_next(1)
+        requests_before = sum(server.requests.values())
+        service.fetch(CURRENT, city, key)
+        served_during_outage = service.fetch(CURRENT, city, key) is not None
+        backoff_requests = sum(server.requests.values()) - requests_before
+        retry_in = service.get_metrics(CURRENT, city)['retry_in']
+        with service._lock:
+            service._next_attempt.clear()
+
+        # Concurrent stale readers share one request
+        server.set_weather(city, 18, "Rain")
+        expire(CURRENT)
+        server.delay = 0.2
+        requests_before = sum(server.requests.values())
+        threads = [threading.Thread(target=service.fetch, args=(CURRENT, city, key)) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        coalesced_requests = sum(server.requests.values()) - requests_before
+        updated = service.get(CURRENT, city, key)
+    finally:
+        server.stop()
+        cache_dir.cleanup()
+
+    return {
+        'cold_fetch': cold,
+        'forecast_hours': len(forecast['hourly']) if forecast else 0,
+        'forecast_days': len(forecast['daily']) if forecast else 0,
+        'cache_hit': hits,
+        'cache_hit_requests': hit_requests,
+        'revalidate_304': revalidate,
+        'not_modified_bytes': not_modified_bytes,
+        'backoff_requests': backoff_requests,
+        'served_during_outage': served_during_outage,
+        'backoff_retry_in_s': retry_in,
+        'concurrent_clients': clients,
+        'coalesced_requests': coalesced_requests,
+        'update_seen': bool(updated) and updated['condition'] == "Rain",
+        'server_responses': {str(status): count for status, count in server.requests.items()},
+        'service': service.get_metrics(),
+    }
+
+
+def bench_simulation(days):
+    """Replay the example scenario in virtual time under poll and push settings delivery"""
+    from simulation import Simulation, example_scenario
+
+    results = {}
+    for transport, poll_interval in (('poll', 60), ('push', 0)):
+        report = Simulation(example_scenario(days=days), poll_interval=poll_interval).run()
+        results[transport] = {
+            'simulated_days': days,
+            'wall_time_s': report['wall_time'],
+            'speedup': report['speedup'],
+            'lateness': report['lateness'],
+            'settings_delay_max_s': report['settings_delay_max_s'],
+            'timeline_events': len(report['timeline']),
+            **report['stats'],
+        }
+    return results
+
+
+def bench_one_shot_soak(days, timers_per_day=200, refreshes_per_day=96, samples=10):
+    """Soak timers, snoozes and settings refreshes in virtual time and sample memory use"""
+    from alarm import AlarmManager
+    from backends import NullHardwareController
+    from lifecycle import AlarmLifecycle
+    from simulation import VirtualClock
+
+    clock = VirtualClock(datetime(2026, 1, 5))
+    hardware = NullHardwareController()
+    lifecycle = AlarmLifecycle(hardware, now=clock.now, watch=False)
+    manager = AlarmManager(hardware, clock, lifecycle=lifecycle)
+    payloads = [_alarm_payload(20, seed) for seed in range(4)]
+    manager.update_settings(payloads[0], persist=False)
+
+    rng = random.Random(0)
+    step = timedelta(minutes=1)
+    steps = days * 1440
+    timer_chance, refresh_chance = timers_per_day / 1440, refreshes_per_day / 1440
+    rejected = 0
+    history = []
+    tracemalloc.start()
+    for index in range(steps):
+        clock.advance_to(clock.now() + step)
+        if rng.random() < timer_chance:
+            rejected += manager.add_timer(rng.randrange(1, 240)) is None
+        if rng.random() < refresh_chance:
+            manager.update_settings(rng.choice(payloads), persist=False)
+        if rng.random() < 0.1 and manager.pending_timers():
+            manager.cancel_timer(rng.choice(manager.pending_timers()))
+        manager.check_alarms()
+        if lifecycle.is_ringing():
+            # Snooze about half the rings, leave some to the ring timeout
+            if rng.random() < 0.5:
+                manager.snooze()
+            elif rng.random() < 0.8:
+                manager.stop_alarm()
+        lifecycle.check_timeout()
+        if (index + 1) % (steps // samples) == 0:
+            gc.collect()  # Sample live memory, not garbage awaiting collection
+            history.append({
+                'day': round((index + 1) / 1440, 1),
+                'one_shots': len(manager.scheduler.one_shots),
+                'one_shot_heap': manager.scheduler.one_shots.heap_size(),
+                'scheduler_heap': manager.scheduler.heap_size(),
+                'traced_bytes': tracemalloc.get_traced_memory()[0],
+            })
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    manager.cleanup()
+
+    # Bounded means the second half of the run needs no more room than the first
+    half = len(history) // 2
+    first, second = history[:half], history[half:]
+    return {
+        'simulated_days': days,
+        'one_shot_stats': manager.scheduler.one_shots.stats,
+        'timers_rejected': rejected,
+        'peak_traced_bytes': peak_bytes,
+        'bounded': all(
+            max(sample[field] for sample in second) <= 2 * max(sample[field] for sample in first)
+            for field in ('one_shots', 'one_shot_heap', 'scheduler_heap')
+        ),
+        'samples': history,
+    }
+
+
+def bench_fleet(sizes, workers, alarms_per_user=2, window_minutes=3, speed=60):
+    """Load the fleet scheduler and measure how late a burst of alarms fires"""
+    from zoneinfo import ZoneInfo
+    from fleet import FleetClock, FleetScheduler
+
+    zones = ['UTC', 'Europe/Berlin', 'America/New_York', 'Asia/Tokyo',
+             'Australia/Sydney', 'Asia/Kolkata', 'America/Los_Angeles']
+    rng = random.Random(0)
+    results = {}
+    for size in sizes:
+        # Every alarm falls in a window an hour ahead, replayed at `speed`x
+        window_start = (int(time.time()) // 60 + 60) * 60
+        users = []
+        for user_id in range(max(1, size // alarms_per_user)):
+            zone_name = rng.choice(zones)
+            zone = ZoneInfo(zone_name)
+            entries = []
+            for _ in range(alarms_per_user):
+                due = window_start + 60 * rng.randrange(window_minutes)
+                entries.append({
+                    'time': datetime.fromtimestamp(due, zone).strftime("%H:%M"),
+                    'gradual_wake': False,
+                })
+            users.append((user_id, zone_name, entries))
+        expected = len(users) * alarms_per_user
+
+        lateness = []
+        pushed_at = []  # Wall time of each push, as seen by the dispatcher
+
+        def push(event):
+            pushed_at.append(time.perf_counter())
+            lateness.append(fleet.clock.now() - event.due)
+
+        fleet = FleetScheduler(workers=workers, push=push)
+        fleet.start()
+
+        load_start = time.perf_counter()
+        for user_id, zone_name, entries in users:
+            fleet.set_user_alarms(user_id, zone_name, entries)
+        loaded = fleet.alarm_count()
+        load_time = time.perf_counter() - load_start
+
+        fleet.set_clock(FleetClock(start=window_start - speed, speed=speed))
+        deadline = time.time() + (window_minutes * 60 + speed) / speed + 10
+        while len(lateness) < expected and time.time() < deadline:
+            time.sleep(0.05)
+        fleet.stop()
+
+        late_ms = sorted(seconds / speed * 1000 for seconds in lateness)
+        # Alarms fire in one burst per minute: time the bursts, not the gaps between them
+        busy = sum(
+            later - earlier for earlier, later in zip(pushed_at, pushed_at[1:]) if later - earlier < 0.1
+        )
+        results[str(size)] = {
+            'alarms': loaded,
+            'workers': fleet.worker_count,
+            'load_time_s': load_time,
+            'load_throughput_per_s': loaded / load_time if load_time else None,
+            'fired': len(late_ms),
+            'missed': expected - len(late_ms),
+            'fire_busy_s': busy,
+            'fire_throughput_per_s': len(pushed_at) / busy if busy else None,
+            'lateness_p50_ms': late_ms[len(late_ms) // 2] if late_ms else None,
+            'lateness_p99_ms': late_ms[min(len(late_ms) - 1, int(len(late_ms) * 0.99))] if late_ms else None,
+            'lateness_max_ms': late_ms[-1] if late_ms else None,
+        }
+    return results
+
+
+def _version():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SmartAlarm headless benchmarks")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="comma separated alarm counts")
+    parser.add_argument('--repeat', type=int, default=50, help="runs per measurement")
+    parser.add_argument('--frames', type=int, default=120, help="display frames to render")
+    parser.add_argument('--stress-seconds', type=float, default=2.0,
+                        help="duration of the concurrent alarm snapshot stress test")
+    parser.add_argument('--simulated-days', type=int, default=91,
+                        help="days of alarm activity replayed by the simulation benchmark")
+    parser.add_argument('--soak-days', type=int, default=14,
+                        help="days of timers, snoozes and settings refreshes in the one-shot soak")
+    parser.add_argument('--fleet-sizes', default='1000,10000,100000',
+                        help="comma separated alarm counts for the fleet load test")
+    parser.add_argument('--fleet-workers', type=int, default=None,
+                        help="fleet worker processes (default: CPU count)")
+    parser.add_argument('--output', help="write JSON results to this file")
+    parser.add_argument('--skip', default='', help="comma separated sections to skip")
+    args = parser.parse_args(argv)
+
+    use_offscreen_sdl()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    skip = set(filter(None, args.skip.split(',')))
+    hardware = create_backend('hardware', 'simulated')
+
+    sections = {
+        'alarm_model': lambda: bench_alarm_model(sizes + [100000], max(1, args.repeat // 5)),
+        'update_settings': lambda: bench_update_settings(hardware, sizes, args.repeat),
+        'check_alarms': lambda: bench_check_alarms(hardware, sizes, args.repeat),
+        'snapshots': lambda: bench_snapshots(hardware, args.stress_seconds),
+        'display': lambda: bench_display(args.frames),
+        'leds': lambda: bench_leds(hardware, args.repeat),
+        'sound': lambda: bench_sound(hardware, max(1, args.repeat // 10)),
+        'sound_library': lambda: bench_sound_library(args.repeat),
+        'audio': lambda: bench_audio(hardware, args.repeat * 4),
+        'settings_push': lambda: bench_settings_push(args.repeat),
+        'weather': lambda: bench_weather(args.repeat),
+        'simulation': lambda: bench_simulation(args.simulated_days),
+        'one_shot_soak': lambda: bench_one_shot_soak(args.soak_days),
+        'fleet': lambda: bench_fleet(
+            [int(size) for size in args.fleet_sizes.split(',') if size], args.fleet_workers
+        ),
+    }
+
+    report = {
+        'version': _version(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'hardware_init': hardware.init_times,
+        'results': {},
+    }
+    for name, run in sections.items():
+        if name in skip:
+            continue
+        logger.info(f"Running {name} benchmark")
+        try:
+            report['results'][name] = run()
+        except Exception as e:
+            logger.error(f"Benchmark {name} failed: {str(e)}")
+            report['results'][name] = {'error': str(e)}
+
+    hardware.cleanup()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    sys.exit(main())
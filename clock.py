@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# Created by systemd-timesyncd while the system clock is NTP synchronized
+NTP_SYNC_FLAG = "/run/systemd/timesync/synchronized"
+
+# adjtimex() result while the kernel clock is unsynchronized (STA_UNSYNC set)
+TIME_ERROR = 5
+
+# RTC readings before this are a chip that lost power or was never set
+MIN_RTC_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _kernel_synchronized():
+    """Whether the kernel clock is synchronized, via adjtimex(2), or None if unknown.
+
+    Any NTP daemon that disciplines the kernel clock (chrony, ntpd,
+    systemd-timesyncd) clears STA_UNSYNC once it is synchronized.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        timex = ctypes.create_string_buffer(512)  # struct timex with modes = 0: read only
+        state = libc.adjtimex(timex)
+    except (AttributeError, OSError):
+        return None
+    if state < 0:
+        return None
+    return state != TIME_ERROR
+
+
+def _timedatectl_synchronized():
+    """Whether timedatectl reports NTP synchronization, or None if it is unavailable"""
+    try:
+        result = subprocess.run(
+            ['timedatectl', 'show', '--property=NTPSynchronized', '--value'],
+            capture_output=True, text=True, timeout=2
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    value = result.stdout.strip()
+    return value == 'yes' if result.returncode == 0 and value else None
+
+
+class ClockService:
+    """Wall clock disciplined against the DS3231 RTC.
+
+    The RTC is read only when the clock is synced. In between, time is
+    extrapolated from the monotonic clock, corrected by a drift rate estimated
+    from successive syncs, so queries never touch I2C. While the system clock
+    is NTP synchronized it is used as the reference and the RTC is corrected
+    from it; otherwise the RTC is the reference, which keeps alarms accurate
+    without a network.
+
+    Time is kept as UTC seconds and converted to local time on every query,
+    so DST changes apply immediately. The RTC holds UTC. A step of the
+    system clock (or a sync correction) larger than `step_threshold` moves
+    the reference instead of being read as drift.
+    """
+
+    def __init__(self, hardware, sync_interval=timedelta(hours=1),
+                 min_drift_baseline=timedelta(hours=1), ntp_flag=NTP_SYNC_FLAG,
+                 step_threshold=1.5):
+        """Initialize the ClockService"""
+        self.hardware = hardware
+        self.sync_interval = sync_interval
+        self.min_drift_baseline = min_drift_baseline  # Shortest span a drift estimate is taken over
+        self.ntp_flag = ntp_flag
+        self.edge_poll_interval = 0.01  # Seconds between RTC reads while waiting for a tick
+        self.max_rtc_error = 1.0  # Seconds the RTC may be off before it is rewritten
+        self.drift_smoothing = 0.3  # Weight of a new drift sample
+        self.step_threshold = step_threshold  # Seconds of error treated as a clock step
+
+        self._lock = threading.Lock()
+        self._base = None  # (reference UTC seconds, monotonic time) from the last sync
+        self._anchor = None  # (reference UTC seconds, monotonic time, source) drift is measured from
+        self._rate = 0.0  # Reference seconds gained per monotonic second
+        self._last_sync = None
+        self._source = None
+        self._wall_offset = None  # time.time() - time.monotonic() when last checked
+        self.tick_time = None  # Timestamp shared by everything in the current tick
+
+        self.stats = {
+            'i2c_reads': 0,
+            'syncs': 0,
+            'ticks': 0,
+            'source': None,
+            'drift_ppm': 0.0,
+            'last_correction': None,  # Seconds the extrapolated time was off at the last sync
+            'rtc_writes': 0,
+            'steps': 0,  # Wall-clock steps followed without counting them as drift
+        }
+
+        # A quick unaligned read so times are disciplined from the start
+        self.sync(align=False)
+
+    def now(self):
+        """Current local time, without reading the RTC"""
+        with self._lock:
+            if self._base is None:
+                return datetime.now()
+            mono = time.monotonic()
+            self._check_step(mono)
+            base_time, base_mono = self._base
+            return datetime.fromtimestamp(base_time + (mono - base_mono) * (1 + self._rate))
+
+    def tick(self):
+        """Start a scheduling tick and return the timestamp shared by all of it"""
+        self.tick_time = self.now()
+        self.stats['ticks'] += 1
+        return self.tick_time
+
+    def needs_sync(self):
+        """Check whether the sync interval has passed"""
+        return self._last_sync is None or \
+            time.monotonic() - self._last_sync >= self.sync_interval.total_seconds()
+
+    def ntp_synchronized(self):
+        """Check whether the system clock is currently NTP synchronized, by any daemon"""
+        synchronized = _kernel_synchronized()
+        if synchronized is None:
+            synchronized = _timedatectl_synchronized()
+        if synchronized is None:
+            synchronized = os.path.exists(self.ntp_flag)
+        return synchronized
+
+    def sync(self, align=True):
+        """Re-read the reference time and update the drift estimate.
+
+        With `align`, the RTC is polled until its seconds roll over so the
+        reading is accurate to a poll interval instead of a whole second.
+        """
+        reading = self._read_rtc_aligned() if align else self._read_rtc()
+        ntp = self.ntp_synchronized()
+        if reading is None and not ntp:
+            return False
+
+        if ntp:
+            mono = time.monotonic()
+            reference, source = time.time(), 'ntp'
+            if reading is not None:
+                self._correct_rtc(reading, reference - (mono - reading[1]))
+        else:
+            (reference, mono), source = reading, 'rtc'
+            if not align:
+                reference += 0.5  # Expected position within the second
+
+        with self._lock:
+            correction = None
+            if self._base is not None:
+                base_time, base_mono = self._base
+                correction = reference - (base_time + (mono - base_mono) * (1 + self._rate))
+                self.stats['last_correction'] = correction
+            if correction is not None and abs(correction) > self.step_threshold:
+                # The reference was stepped, not drifting: start a new baseline
+                logger.warning(f"Clock stepped by {correction:.1f} s, not counting it as drift")
+                self.stats['steps'] += 1
+                self._anchor = None
+            self._update_drift(reference, mono, source, precise=align or ntp)
+            self._base = (reference, mono)
+            self._last_sync = mono
+            self._source = source
+            self._wall_offset = time.time() - mono
+
+        self.stats['syncs'] += 1
+        self.stats['source'] = source
+        logger.info(
+            f"Clock synced from {source}, drift {self.stats['drift_ppm']:.1f} ppm, "
+            f"correction {self.stats['last_correction'] or 0.0:.3f} s"
+        )
+        return True
+
+    def _update_drift(self, reference, mono, source, precise):
+        """Fold a new sync into the drift rate (caller holds the lock)"""
+        if not precise:
+            return
+        if self._anchor is None or self._anchor[2] != source:
+            self._anchor = (reference, mono, source)
+            return
+
+        anchor_time, anchor_mono, _ = self._anchor
+        baseline = mono - anchor_mono
+        if baseline < self.min_drift_baseline.total_seconds():
+            return
+
+        rate = ((reference - anchor_time) - baseline) / baseline
+        self._rate += self.drift_smoothing * (rate - self._rate)
+        self.stats['drift_ppm'] = self._rate * 1e6
+        self._anchor = (reference, mono, source)
+
+    def _check_step(self, mono):
+        """Follow a step of the NTP-synced system clock at once (caller holds the lock)"""
+        offset = time.time() - mono
+        if self._wall_offset is None:
+            self._wall_offset = offset
+            return
+        step = offset - self._wall_offset
+        if abs(step) <= self.step_threshold:
+            return
+        self._wall_offset = offset
+        if self._source != 'ntp':
+            return  # The RTC is the reference; the system clock does not matter
+        logger.warning(f"System clock stepped by {step:.1f} s, following it")
+        self.stats['steps'] += 1
+        self._base = (self._base[0] + step, self._base[1])
+        self._anchor = None
+
+    def _read_rtc(self):
+        """Read the RTC (which holds UTC) once, returning (UTC seconds, monotonic time) or None"""
+        value = self.hardware.get_rtc_time()
+        mono = time.monotonic()
+        self.stats['i2c_reads'] += 1
+        if value is None:
+            return None
+        try:
+            reading = datetime(*tuple(value)[:6], tzinfo=timezone.utc)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Invalid RTC time {value}: {str(e)}")
+            return None
+        if reading < MIN_RTC_TIME:
+            logger.warning(f"Ignoring RTC time {reading}, the RTC has not been set")
+            return None
+        return reading.timestamp(), mono
+
+    def _read_rtc_aligned(self):
+        """Read the RTC at the moment its seconds roll over"""
+        first = self._read_rtc()
+        if first is None:
+            return None
+        deadline = time.monotonic() + 1.5
+        while time.monotonic() < deadline:
+            time.sleep(self.edge_poll_interval)
+            reading = self._read_rtc()
+            if reading is None:
+                return first
+            if reading[0] != first[0]:
+                # The tick happened somewhere within the last poll interval
+                return reading[0], reading[1] - self.edge_poll_interval / 2
+        logger.warning("RTC seconds did not advance, using an unaligned reading")
+        return first
+
+    def _correct_rtc(self, reading, system_time):
+        """Rewrite the RTC in UTC from the NTP synchronized system clock if it has wandered"""
+        error = reading[0] - system_time
+        if abs(error) > self.max_rtc_error:
+            logger.info(f"RTC is {error:.1f} s off, setting it from the system clock")
+            self.hardware.set_rtc_time(time.gmtime())
+            self.stats['rtc_writes'] += 1
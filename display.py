@@ -2,8 +2,12 @@
 
 import pygame
 import logging
+import time as timer
+from collections import OrderedDict
 from datetime import datetime
 
+from metrics import get_registry
+
 logger = logging.getLogger(__name__)
 
 class Display:
@@ -14,45 +18,121 @@ class Display:
     WHITE = (255, 255, 255)
     GRAY = (128, 128, 128)
     BLUE = (0, 0, 255)
+    TEXT_CACHE_SIZE = 64  # Rendered text surfaces kept in memory
 
     def __init__(self):
         """Initialize the display"""
         logger.info("Initializing display...")
-        
+
         try:
             # Initialize Pygame
             pygame.init()
             pygame.display.init()
-            
+
             # Set up the display
             self.screen = pygame.display.set_mode(
                 (self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT)
             )
             pygame.display.set_caption("Smart Alarm")
-            
+
+            # Frames are composed offscreen so the next one can be prepared
+            # ahead of time and swapped in with a blit and an update
+            self.canvas = pygame.Surface((self.DISPLAY_WIDTH, self.DISPLAY_HEIGHT))
+            self.canvas.fill(self.BLACK)
+            self.prepared_time = None  # Time shown by the frame waiting to be presented
+
             # Initialize fonts
-            self.large_font = pygame.font.Font(None, 120)  # Time display
-            self.medium_font = pygame.font.Font(None, 60)  # Date and weather
-            self.small_font = pygame.font.Font(None, 40)   # Additional info
-            
+            self.fonts = {
+                'large': pygame.font.Font(None, 120),  # Time display
+                'medium': pygame.font.Font(None, 60),  # Date and weather
+                'small': pygame.font.Font(None, 40),   # Additional info
+            }
+
+            # Rendered text surfaces keyed by (font, text, colour), least recently used first
+            self._text_cache = OrderedDict()
+
+            # What each screen region currently shows: name -> (cache key, rect)
+            self._regions = {}
+            self._dirty_rects = []
+            self._full_redraw = True
+
+            self.registry = get_registry()
+            self.stats = {
+                'frames': 0,
+                'last_frame_time': 0.0,
+                'cache_hits': 0,
+                'cache_misses': 0,
+                'last_dirty_rects': 0,
+                'last_present_time': 0.0,
+            }
+
             logger.info("Display initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize display: {str(e)}")
             raise
 
+    def _text_surface(self, font, text, color):
+        """Get a rendered text surface, rendering it only on a cache miss"""
+        key = (font, text, color)
+        surface = self._text_cache.get(key)
+        if surface is not None:
+            self._text_cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return surface
+
+        self.stats['cache_misses'] += 1
+        surface = self.fonts[font].render(text, True, color)
+        self._text_cache[key] = surface
+        if len(self._text_cache) > self.TEXT_CACHE_SIZE:
+            self._text_cache.popitem(last=False)
+        return surface
+
+    def _draw_text(self, region, font, text, color, center, per_glyph=False):
+        """Draw text into a named region if it differs from what is shown.
+
+        With `per_glyph` the text is composed from cached single characters,
+        for text that changes often but from a few repeating glyphs (the clock).
+        """
+        key = (font, text, color)
+        current = self._regions.get(region)
+        if current and current[0] == key and not self._full_redraw:
+            return
+
+        self._clear_region(region)
+        if per_glyph:
+            surfaces = [self._text_surface(font, char, color) for char in text]
+        else:
+            surfaces = [self._text_surface(font, text, color)]
+        rect = pygame.Rect(
+            0, 0, sum(surface.get_width() for surface in surfaces),
+            max(surface.get_height() for surface in surfaces)
+        )
+        rect.center = center
+        x = rect.x
+        for surface in surfaces:
+            self.canvas.blit(surface, (x, rect.y))
+            x += surface.get_width()
+        self._regions[region] = (key, rect)
+        self._dirty_rects.append(rect)
+
+    def _clear_region(self, region):
+        """Erase a region that is no longer shown"""
+        current = self._regions.pop(region, None)
+        if current:
+            self.canvas.fill(self.BLACK, current[1])
+            self._dirty_rects.append(current[1])
+
     def _render_time(self, time):
         """Render the time display"""
         time_str = time.strftime("%H:%M")
-        time_surface = self.large_font.render(time_str, True, self.WHITE)
-        time_rect = time_surface.get_rect(center=(self.DISPLAY_WIDTH//2, 120))
-        self.screen.blit(time_surface, time_rect)
+        self._draw_text(
+            'time', 'large', time_str, self.WHITE, (self.DISPLAY_WIDTH//2, 120), per_glyph=True
+        )
 
     def _render_date(self, time):
         """Render the date display"""
         date_str = time.strftime("%A, %B %d")
-        date_surface = self.medium_font.render(date_str, True, self.GRAY)
-        date_rect = date_surface.get_rect(center=(self.DISPLAY_WIDTH//2, 200))
-        self.screen.blit(date_surface, date_rect)
+        self._draw_text('date', 'medium', date_str, self.GRAY, (self.DISPLAY_WIDTH//2, 200))
 
     def _render_weather(self, weather):
         """Render weather information"""
@@ -60,64 +140,107 @@ class Display:
             try:
                 # Temperature
                 temp_str = f"{weather['temperature']}°C"
-                temp_surface = self.medium_font.render(temp_str, True, self.WHITE)
-                temp_rect = temp_surface.get_rect(center=(self.DISPLAY_WIDTH//2, 280))
-                self.screen.blit(temp_surface, temp_rect)
-                
-                # Condition
-                condition_surface = self.small_font.render(
-                    weather['condition'], True, self.GRAY
+                self._draw_text(
+                    'temperature', 'medium', temp_str, self.WHITE, (self.DISPLAY_WIDTH//2, 280)
                 )
-                condition_rect = condition_surface.get_rect(
-                    center=(self.DISPLAY_WIDTH//2, 330)
+
+                # Condition
+                self._draw_text(
+                    'condition', 'small', weather['condition'], self.GRAY,
+                    (self.DISPLAY_WIDTH//2, 330)
                 )
-                self.screen.blit(condition_surface, condition_rect)
             except Exception as e:
                 logger.error(f"Error rendering weather: {str(e)}")
 
-    def _render_alarms(self, active_alarms):
-        """Render active alarms"""
-        if active_alarms:
+    def _render_alarms(self, next_alarm):
+        """Render the next scheduled alarm"""
+        if next_alarm:
             try:
                 y_pos = 380
                 alarm_text = "Next Alarm: "
-                next_alarm = min(
-                    (alarm for alarm in active_alarms if alarm['enabled']),
-                    key=lambda x: x['time']
-                )
-                alarm_text += next_alarm['time'].strftime("%H:%M")
-                
-                alarm_surface = self.small_font.render(alarm_text, True, self.BLUE)
-                alarm_rect = alarm_surface.get_rect(center=(self.DISPLAY_WIDTH//2, y_pos))
-                self.screen.blit(alarm_surface, alarm_rect)
+                alarm_text += next_alarm.alarm_time.strftime("%H:%M")
+                self._draw_text('alarm', 'small', alarm_text, self.BLUE, (self.DISPLAY_WIDTH//2, y_pos))
             except Exception as e:
                 logger.error(f"Error rendering alarms: {str(e)}")
 
-    def update(self, time=None, weather=None, active_alarms=None):
+    def update(self, time=None, weather=None, next_alarm=None):
         """Update the display with current information"""
+        self.prepare(time, weather, next_alarm)
+        self.present()
+
+    def prepare(self, time=None, weather=None, next_alarm=None):
+        """Render a frame offscreen without showing it"""
         try:
-            # Clear the screen
-            self.screen.fill(self.BLACK)
-            
+            frame_start = timer.perf_counter()
+
+            if self._full_redraw:
+                self.canvas.fill(self.BLACK)
+
             # Render components
             if time:
                 self._render_time(time)
                 self._render_date(time)
-            
+            else:
+                self._clear_region('time')
+                self._clear_region('date')
+
             if weather:
                 self._render_weather(weather)
-            
-            if active_alarms:
-                self._render_alarms(active_alarms)
-            
-            # Update the display
-            pygame.display.flip()
+            else:
+                self._clear_region('temperature')
+                self._clear_region('condition')
+
+            if next_alarm:
+                self._render_alarms(next_alarm)
+            else:
+                self._clear_region('alarm')
+
+            self.prepared_time = time
+            self.stats['last_frame_time'] = timer.perf_counter() - frame_start
+            self.registry.observe('smartalarm_frame_render_seconds', self.stats['last_frame_time'])
         except Exception as e:
             logger.error(f"Error updating display: {str(e)}")
 
+    def present(self):
+        """Show the prepared frame, copying and pushing only the regions that changed"""
+        try:
+            present_start = timer.perf_counter()
+            if self._full_redraw:
+                self.screen.blit(self.canvas, (0, 0))
+                pygame.display.flip()
+            elif self._dirty_rects:
+                for rect in self._dirty_rects:
+                    self.screen.blit(self.canvas, rect, rect)
+                pygame.display.update(self._dirty_rects)
+
+            self.stats['frames'] += 1
+            self.stats['last_dirty_rects'] = len(self._dirty_rects)
+            self.stats['last_present_time'] = timer.perf_counter() - present_start
+            logger.debug(
+                f"Frame rendered in {self.stats['last_frame_time'] * 1000:.1f} ms, "
+                f"presented in {self.stats['last_present_time'] * 1000:.1f} ms, "
+                f"{len(self._dirty_rects)} dirty rects, "
+                f"cache hit ratio {self.cache_hit_ratio():.2f}"
+            )
+            self._dirty_rects = []
+            self._full_redraw = False
+        except Exception as e:
+            logger.error(f"Error presenting frame: {str(e)}")
+
+    def invalidate(self):
+        """Force the next update to redraw and push the whole screen"""
+        self._full_redraw = True
+
+    def cache_hit_ratio(self):
+        """Get the fraction of text renders served from the cache"""
+        lookups = self.stats['cache_hits'] + self.stats['cache_misses']
+        return self.stats['cache_hits'] / lookups if lookups else 0.0
+
     def cleanup(self):
         """Clean up display resources"""
         try:
-            pygame.quit()
+            # Leave the mixer to the hardware controller
+            pygame.font.quit()
+            pygame.display.quit()
         except Exception as e:
-            logger.error(f"Error during display cleanup: {str(e)}") 
\ No newline at end of file
+            logger.error(f"Error during display cleanup: {str(e)}")
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Central alarm scheduling for a fleet of devices.
+
+FleetScheduler evaluates many users' alarms in one place and emits
+"start wake" / "ring now" commands for a push channel to deliver. Users are
+sharded across worker processes by a stable hash of their id; each worker
+keeps its alarms in a heap ordered by the next UTC fire time.
+"""
+
+import heapq
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from alarm_model import parse_alarm
+from scheduler import RING, WAKE
+
+logger = logging.getLogger(__name__)
+
+# Command sent to a device
+FleetEvent = namedtuple('FleetEvent', ['user_id', 'alarm_index', 'kind', 'due', 'fired', 'alarm_time'])
+
+
+class FleetClock:
+    """Wall clock that can start at an arbitrary time and run faster than real time"""
+
+    def __init__(self, start=None, speed=1.0):
+        """Initialize the clock; `start` is a UTC timestamp"""
+        self.real_start = time.time()
+        self.start = self.real_start if start is None else start
+        self.speed = speed
+
+    def now(self):
+        return self.start + (time.time() - self.real_start) * self.speed
+
+    def real_delay(self, virtual_seconds):
+        """Real seconds until `virtual_seconds` of clock time pass"""
+        return virtual_seconds / self.speed
+
+
+class FleetShard:
+    """Heap of upcoming wake and ring events for a subset of users"""
+
+    def __init__(self, gradual_wake_duration=timedelta(minutes=30)):
+        """Initialize the shard"""
+        self.wake_seconds = gradual_wake_duration.total_seconds()
+        self._heap = []  # (fire_ts, seq, key, token, kind, alarm_ts)
+        self._alarms = {}  # key -> (alarm, zone, token)
+        self._users = {}  # user_id -> list of keys
+        self._zones = {}
+        self._counter = itertools.count()
+        self.compactions = 0
+
+    def __len__(self):
+        return len(self._alarms)
+
+    def heap_size(self):
+        """Heap entries, stale ones included"""
+        return len(self._heap)
+
+    def set_user(self, user_id, tz_name, entries, now):
+        """Replace a user's alarms"""
+        self.remove_user(user_id)
+        zone = self._zones.get(tz_name)
+        if zone is None:
+            zone = self._zones[tz_name] = ZoneInfo(tz_name)
+
+        keys = []
+        for index, entry in enumerate(entries):
+            try:
+                alarm = parse_alarm(entry)
+            except ValueError as e:
+                logger.error(f"Skipping invalid alarm {index} of user {user_id}: {str(e)}")
+                continue
+            if not alarm.enabled:
+                continue
+            key = (user_id, index)
+            keys.append(key)
+            self._schedule(key, alarm, zone, now)
+        self._users[user_id] = keys
+
+    def remove_user(self, user_id):
+        """Forget a user's alarms; their heap entries become stale"""
+        for key in self._users.pop(user_id, ()):
+            self._alarms.pop(key, None)
+        self._maybe_compact()
+
+    def next_fire_time(self):
+        """UTC timestamp of the next live event, or None"""
+        heap = self._heap
+        while heap:
+            key, token = heap[0][2], heap[0][3]
+            entry = self._alarms.get(key)
+            if entry and entry[2] == token:
+                return heap[0][0]
+            heapq.heappop(heap)
+        return None
+
+    def pop_due(self, now, limit=None):
+        """Remove and return events due at `now` as FleetEvent field tuples"""
+        fired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now and (limit is None or len(fired) < limit):
+            fire_ts, _, key, token, kind, alarm_ts = heapq.heappop(heap)
+            entry = self._alarms.get(key)
+            if not entry or entry[2] != token:
+                continue
+            fired.append((key[0], key[1], kind, fire_ts, now, alarm_ts))
+            if kind == RING:
+                alarm, zone, _ = entry
+                self._schedule(key, alarm, zone, alarm_ts + 1)
+        return fired
+
+    def _schedule(self, key, alarm, zone, after):
+        """Queue the next occurrence of an alarm at or after the UTC timestamp `after`"""
+        token = next(self._counter)
+        self._alarms[key] = (alarm, zone, token)
+
+        alarm_ts = self._next_occurrence(alarm, zone, after)
+        if alarm_ts is None:
+            return
+        if alarm.gradual_wake:
+            wake_ts = max(alarm_ts - self.wake_seconds, after)
+            heapq.heappush(self._heap, (wake_ts, next(self._counter), key, token, WAKE, alarm_ts))
+        heapq.heappush(self._heap, (alarm_ts, next(self._counter), key, token, RING, alarm_ts))
+
+    def _maybe_compact(self):
+        """Drop stale heap entries once they outnumber the live ones"""
+        # Each live alarm holds at most a wake and a ring entry
+        if len(self._heap) <= 4 * len(self._alarms) + 64:
+            return
+        self._heap = [item for item in self._heap
+            if self._alarms.get(item[2], (None, None, None))[2] == item[3]]
+        heapq.heapify(self._heap)
+        self.compactions += 1
+
+    @staticmethod
+    def _next_occurrence(alarm, zone, after):
+        """First local alarm time at or after `after`, as a UTC timestamp"""
+        local_date = datetime.fromtimestamp(after, zone).date()
+        # Weekday alarms recur within a week; rules may be sparser
+        for offset in range(8 if alarm.rule is None else 400):
+            day = local_date + timedelta(days=offset)
+            if not alarm.occurs_on(day):
+                continue
+            alarm_ts = datetime.combine(day, alarm.time, tzinfo=zone).timestamp()
+            if alarm_ts >= after:
+                return alarm_ts
+        return None
+
+
+def _shard_worker(commands, events, clock, gradual_wake_minutes, max_wait, chunk_size):
+    """Worker process: apply commands and emit due events until told to stop"""
+    shard = FleetShard(timedelta(minutes=gradual_wake_minutes))
+    while True:
+        now = clock.now()
+        next_fire = shard.next_fire_time()
+        wait = max_wait if next_fire is None else min(max_wait, clock.real_delay(next_fire - now))
+
+        try:
+            command = commands.get(timeout=max(0.0, wait))
+        except queue.Empty:
+            command = None
+
+        while command is not None:
+            op = command[0]
+            if op == 'stop':
+                events.put(('stopped', len(shard)))
+                return
+            if op == 'set':
+                now = clock.now()
+                for user_id, tz_name, entries in command[1]:
+                    shard.set_user(user_id, tz_name, entries, now)
+            elif op == 'remove':
+                for user_id in command[1]:
+                    shard.remove_user(user_id)
+            elif op == 'clock':
+                clock = command[1]
+            elif op == 'count':
+                events.put(('count', len(shard)))
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                command = None
+
+        # Send bursts in chunks so the dispatcher can start pushing early
+        now = clock.now()
+        fired = shard.pop_due(now, chunk_size)
+        while fired:
+            events.put(('events', fired))
+            fired = shard.pop_due(now, chunk_size)
+
+
+class FleetScheduler:
+    """Schedules many users' alarms across worker processes"""
+
+    def __init__(self, workers=None, push=None, clock=None, gradual_wake_minutes=30,
+                 max_wait=0.25, batch_size=1000, chunk_size=500):
+        """Initialize the FleetScheduler.
+
+        `push` is called with each FleetEvent from a dispatcher thread.
+        """
+        self.worker_count = workers or multiprocessing.cpu_count()
+        self.push = push
+        self.clock = clock or FleetClock()
+        self.gradual_wake_minutes = gradual_wake_minutes
+        self.max_wait = max_wait  # Longest a worker sleeps before re-checking its heap
+        self.batch_size = batch_size  # Users per 'set' command sent to a worker
+        self.chunk_size = chunk_size  # Events per message sent back from a worker
+
+        self._commands = []
+        self._events = multiprocessing.Queue()
+        self._workers = []
+        self._pending = [[] for _ in range(self.worker_count)]
+        self._dispatcher = None
+        self._replies = queue.Queue()
+
+        self.stats = {
+            'events': 0,
+            'users': 0,
+        }
+
+    def start(self):
+        """Start the worker processes and the dispatcher thread"""
+        for index in range(self.worker_count):
+            commands = multiprocessing.Queue()
+            worker = multiprocessing.Process(
+                target=_shard_worker,
+                args=(
+                    commands, self._events, self.clock,
+                    self.gradual_wake_minutes, self.max_wait, self.chunk_size
+                ),
+                name=f"fleet-shard-{index}",
+                daemon=True,
+            )
+            worker.start()
+            self._commands.append(commands)
+            self._workers.append(worker)
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="fleet-dispatch", daemon=True)
+        self._dispatcher.start()
+        logger.info(f"Fleet scheduler started with {self.worker_count} workers")
+
+    def shard_for(self, user_id):
+        """Stable shard index for a user"""
+        return zlib.crc32(str(user_id).encode()) % self.worker_count
+
+    def set_user_alarms(self, user_id, tz_name, alarm_entries):
+        """Queue a replacement of one user's alarms (website alarm entries)"""
+        shard = self.shard_for(user_id)
+        self._pending[shard].append((user_id, tz_name, alarm_entries))
+        self.stats['users'] += 1
+        if len(self._pending[shard]) >= self.batch_size:
+            self._flush_shard(shard)
+
+    def remove_user(self, user_id):
+        """Stop scheduling a user's alarms"""
+        self.flush()
+        self._commands[self.shard_for(user_id)].put(('remove', [user_id]))
+
+    def flush(self):
+        """Send any batched alarm updates to the workers"""
+        for shard in range(self.worker_count):
+            self._flush_shard(shard)
+
+    def set_clock(self, clock):
+        """Switch every worker to a new clock (e.g. an accelerated one for load tests)"""
+        self.flush()
+        self.clock = clock
+        for commands in self._commands:
+            commands.put(('clock', clock))
+
+    def alarm_count(self, timeout=30):
+        """Total alarms held by all workers"""
+        self.flush()
+        for commands in self._commands:
+            commands.put(('count',))
+        return sum(self._replies.get(timeout=timeout) for _ in self._commands)
+
+    def stop(self, timeout=5):
+        """Stop the workers and the dispatcher"""
+        for commands in self._commands:
+            commands.put(('stop',))
+        for _ in self._workers:
+            try:
+                self._replies.get(timeout=timeout)
+            except queue.Empty:
+                break
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._events.put(('shutdown', None))
+        if self._dispatcher:
+            self._dispatcher.join(timeout)
+        logger.info("Fleet scheduler stopped")
+
+    def _flush_shard(self, shard):
+        if self._pending[shard]:
+            self._commands[shard].put(('set', self._pending[shard]))
+            self._pending[shard] = []
+
+    def _dispatch(self):
+        """Forward fired events to the push callback"""
+        while True:
+            kind, payload = self._events.get()
+            if kind == 'shutdown':
+                return
+            if kind in ('count', 'stopped'):
+                self._replies.put(payload)
+                continue
+            for fields in payload:
+                event = FleetEvent._make(fields)
+                self.stats['events'] += 1
+                if self.push:
+                    try:
+                        self.push(event)
+                    except Exception as e:
+                        logger.error(f"Failed to push alarm event for {event.user_id}: {str(e)}")
@@ -1,108 +1,237 @@
 #!/usr/bin/env python3
 
-import time
-import board
-import neopixel
-import RPi.GPIO as GPIO
-import busio
-import adafruit_ds3231
 import pygame
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import audio_engine
+from led_engine import LedEngine
+from sound_cache import SoundCache
+from sound_library import SoundLibrary
 
 logger = logging.getLogger(__name__)
 
 class HardwareController:
+    """Raspberry Pi hardware: NeoPixel strip, DS3231 RTC and pygame audio.
+
+    The Pi driver modules are imported when each component starts, so this
+    module can be imported anywhere. Subclasses replace the _create_*
+    methods to run the same logic against other drivers.
+    """
+
     # GPIO pins configuration
     SPEAKER_PIN = 18
     LED_PIN = 12
     LED_COUNT = 8
-    I2C_SDA = board.SDA
-    I2C_SCL = board.SCL
 
-    def __init__(self):
+    STOP_FADE = 0.3  # Seconds to fade sound out instead of cutting it off
+
+    def __init__(self, parallel=True):
         """Initialize hardware components"""
         logger.info("Initializing hardware components...")
         
+        self.pixels = None
+        self.leds = None
+        self.rtc = None
+        self.gpio = None
+        self.sound_volume = 0.5
+        self.sound_channel = None
+        self.sounds = SoundCache()
+        self.library = SoundLibrary(self.sounds.sounds_dir)  # Read from its index, no decoding
+        self.sound_gain = 1.0  # Loudness normalization of the playing sound
+        self.audio = None  # AudioEngine when NumPy is available
+        self.init_times = {}  # Component -> seconds spent initializing
+        
         # Setup GPIO
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
+        self._timed('gpio', self._init_gpio)
         
+        # LEDs, RTC and audio do not depend on each other
+        components = {
+            'leds': self._init_leds,
+            'rtc': self._init_rtc,
+            'audio': self._init_audio,
+        }
+        if parallel:
+            with ThreadPoolExecutor(len(components), thread_name_prefix="hw-init") as pool:
+                for future in [pool.submit(self._timed, name, init) for name, init in components.items()]:
+                    future.result()
+        else:
+            for name, init in components.items():
+                self._timed(name, init)
+
+    def _timed(self, name, init):
+        start = time.monotonic()
+        try:
+            init()
+        finally:
+            self.init_times[name] = time.monotonic() - start
+
+    def _create_pixels(self):
+        """Open the NeoPixel strip"""
+        import board
+        import neopixel
+        return neopixel.NeoPixel(
+            board.D12,  # GPIO12
+            self.LED_COUNT,
+            brightness=0.5,
+            auto_write=False
+        )
+
+    def _create_rtc(self):
+        """Open the DS3231 RTC on the I2C bus"""
+        import board
+        import busio
+        import adafruit_ds3231
+        i2c = busio.I2C(board.SCL, board.SDA)
+        return adafruit_ds3231.DS3231(i2c)
+
+    def _init_gpio(self):
+        try:
+            import RPi.GPIO as GPIO
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
+            self.gpio = GPIO
+        except Exception as e:
+            logger.error(f"Failed to initialize GPIO: {str(e)}")
+
+    def _init_leds(self):
         # Initialize RGB LED strip
         try:
-            self.pixels = neopixel.NeoPixel(
-                board.D12,  # GPIO12
-                self.LED_COUNT,
-                brightness=0.5,
-                auto_write=False
-            )
-            self.pixels.fill((0, 0, 0))
-            self.pixels.show()
+            pixels = self._create_pixels()
+            pixels.fill((0, 0, 0))
+            pixels.show()
+            self.pixels = pixels
+            self.leds = LedEngine(pixels)
         except Exception as e:
             logger.error(f"Failed to initialize LED strip: {str(e)}")
-            self.pixels = None
 
+    def _init_rtc(self):
         # Initialize RTC
         try:
-            i2c = busio.I2C(self.I2C_SCL, self.I2C_SDA)
-            self.rtc = adafruit_ds3231.DS3231(i2c)
+            self.rtc = self._create_rtc()
         except Exception as e:
             logger.error(f"Failed to initialize RTC: {str(e)}")
-            self.rtc = None
 
+    def _init_audio(self):
         # Initialize audio
         try:
             pygame.mixer.init()
-            self.sound_volume = 0.5
             pygame.mixer.music.set_volume(self.sound_volume)
         except Exception as e:
             logger.error(f"Failed to initialize audio: {str(e)}")
+            return
+
+        # Measure new or changed sounds without holding up startup
+        self.library.refresh_async()
 
-    def set_led_brightness(self, brightness_level):
-        """Set LED strip brightness (0-100)"""
-        if self.pixels:
+        # Mix layered sounds in software; without it sounds play one at a time
+        if audio_engine.AVAILABLE:
             try:
-                normalized_brightness = max(0, min(1.0, brightness_level / 100))
-                self.pixels.brightness = normalized_brightness
-                self.pixels.show()
+                self.audio = audio_engine.AudioEngine(self.sounds)
+                self.audio.set_master(self.sound_volume)
+            except Exception as e:
+                logger.error(f"Failed to start audio engine: {str(e)}")
+
+    def set_led_brightness(self, brightness_level, transition_time=0):
+        """Set LED strip brightness (0-100) with optional ramp"""
+        if self.leds:
+            try:
+                self.leds.set_brightness(brightness_level, transition_time)
             except Exception as e:
                 logger.error(f"Failed to set LED brightness: {str(e)}")
 
     def set_led_color(self, r, g, b, transition_time=0):
         """Set LED strip color with optional transition"""
-        if self.pixels:
+        if self.leds:
             try:
-                if transition_time == 0:
-                    self.pixels.fill((r, g, b))
-                    self.pixels.show()
-                else:
-                    # Gradual transition
-                    current = self.pixels[0]
-                    steps = 50
-                    r_step = (r - current[0]) / steps
-                    g_step = (g - current[1]) / steps
-                    b_step = (b - current[2]) / steps
-                    
-                    for i in range(steps):
-                        new_r = int(current[0] + (r_step * i))
-                        new_g = int(current[1] + (g_step * i))
-                        new_b = int(current[2] + (b_step * i))
-                        self.pixels.fill((new_r, new_g, new_b))
-                        self.pixels.show()
-                        time.sleep(transition_time / steps)
+                self.leds.fill((r, g, b), transition_time)
             except Exception as e:
                 logger.error(f"Failed to set LED color: {str(e)}")
 
-    def play_sound(self, sound_file, loop=False):
-        """Play a sound file"""
+    def set_led_gradient(self, start_color, end_color, transition_time=0):
+        """Fade the LED strip to a gradient from the first to the last pixel"""
+        if self.leds:
+            try:
+                self.leds.gradient(start_color, end_color, transition_time)
+            except Exception as e:
+                logger.error(f"Failed to set LED gradient: {str(e)}")
+
+    def pulse_leds(self, r, g, b, period=2.0):
+        """Breathe the LED strip in one color until the next color change"""
+        if self.leds:
+            try:
+                self.leds.pulse((r, g, b), period)
+            except Exception as e:
+                logger.error(f"Failed to pulse LEDs: {str(e)}")
+
+    def start_wake_profile(self, profile, elapsed=0):
+        """Play a precomputed wake profile on the LED strip and its ambient sound"""
+        if self.leds:
+            try:
+                self.leds.play_profile(profile, elapsed)
+            except Exception as e:
+                logger.error(f"Failed to start wake profile: {str(e)}")
+
+        if self.audio and profile.ambient_sound:
+            try:
+                # The bed follows the profile's volume table sample by sample
+                path = self._sound_path(profile.ambient_sound)
+                gain = self.library.gain(path)
+                envelope = audio_engine.Envelope.table(
+                    [volume * gain for volume in profile.volume], profile.rate,
+                    self.audio.sample_rate, elapsed
+                )
+                self.audio.play_envelope('ambient', path, envelope)
+            except Exception as e:
+                logger.error(f"Failed to start ambient sound: {str(e)}")
+
+    def preload_sound(self, sound_file):
+        """Decode a sound into memory in the background so it can start instantly"""
+        try:
+            self.sounds.preload_async(sound_file)
+        except Exception as e:
+            logger.error(f"Failed to preload sound: {str(e)}")
+
+    def play_sound(self, sound_file, loop=False, crescendo=0):
+        """Play a sound file, rising to full volume over `crescendo` seconds.
+
+        The sound is played at its loudness-normalized gain. With the audio
+        engine, a playing ambient sound crossfades into it.
+        """
+        gain = self.library.gain(sound_file)
+        if self.audio:
+            try:
+                frames = int(crescendo * self.audio.sample_rate)
+                envelope = audio_engine.Envelope.ramp(0.0, gain, frames, 'ease_in') if crescendo \
+                    else None
+                if self.audio.crossfade('ambient', 'alarm', sound_file, crescendo or self.STOP_FADE,
+                                        loop, gain, envelope):
+                    return
+            except Exception as e:
+                logger.error(f"Failed to play sound: {str(e)}")
+
         try:
-            pygame.mixer.music.load(sound_file)
-            pygame.mixer.music.play(-1 if loop else 0)
+            self.stop_sound()
+            self.sound_gain = min(1.0, gain)  # Channel volume cannot amplify
+            self.sound_channel = self.sounds.play(sound_file, loop, self.sound_volume * self.sound_gain)
+            if self.sound_channel is None:
+                # Not decodable into memory; stream it instead
+                pygame.mixer.music.load(sound_file)
+                pygame.mixer.music.set_volume(self.sound_volume * self.sound_gain)
+                pygame.mixer.music.play(-1 if loop else 0)
         except Exception as e:
             logger.error(f"Failed to play sound: {str(e)}")
 
-    def stop_sound(self):
-        """Stop playing sound"""
+    def stop_sound(self, fade_out=0):
+        """Stop playing sound, fading out over `fade_out` seconds where supported"""
         try:
+            if self.audio:
+                self.audio.stop_all(fade_out)
+            if self.sound_channel:
+                self.sound_channel.stop()
+                self.sound_channel = None
             pygame.mixer.music.stop()
         except Exception as e:
             logger.error(f"Failed to stop sound: {str(e)}")
@@ -111,10 +240,18 @@ class HardwareController:
         """Set sound volume (0-100)"""
         try:
             self.sound_volume = max(0, min(1.0, volume_level / 100))
-            pygame.mixer.music.set_volume(self.sound_volume)
+            pygame.mixer.music.set_volume(self.sound_volume * self.sound_gain)
+            if self.audio:
+                self.audio.set_master(self.sound_volume)
+            if self.sound_channel:
+                self.sound_channel.set_volume(self.sound_volume * self.sound_gain)
         except Exception as e:
             logger.error(f"Failed to set volume: {str(e)}")
 
+    def _sound_path(self, sound):
+        """Resolve a bare sound name against the sounds directory"""
+        return sound if os.path.dirname(sound) else os.path.join(self.sounds.sounds_dir, sound)
+
     def get_rtc_time(self):
         """Get current time from RTC"""
         if self.rtc:
@@ -136,10 +273,16 @@ class HardwareController:
     def cleanup(self):
         """Clean up hardware resources"""
         try:
+            if self.leds:
+                self.leds.stop()
             if self.pixels:
                 self.pixels.fill((0, 0, 0))
                 self.pixels.show()
+            if self.audio:
+                self.audio.close()
+            self.sounds.clear()
             pygame.mixer.quit()
-            GPIO.cleanup()
+            if self.gpio:
+                self.gpio.cleanup()
         except Exception as e:
             logger.error(f"Error during cleanup: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BLACK = (0, 0, 0)
+
+
+def build_gamma_table(gamma=2.2, levels=101):
+    """Precompute output values for every brightness level and 8-bit input.
+
+    table[level][value] is the gamma corrected channel value for `value`
+    shown at `level` percent brightness.
+    """
+    table = []
+    for level in range(levels):
+        scale = level / (levels - 1)
+        table.append(bytes(
+            int(round(255 * ((value / 255) ** gamma) * scale)) for value in range(256)
+        ))
+    return table
+
+
+def _lerp_color(start, end, progress):
+    return tuple(int(a + (b - a) * progress) for a, b in zip(start, end))
+
+
+class _Transition:
+    """Per-pixel linear transition between two frames"""
+
+    def __init__(self, start, end, started, duration):
+        self.start = start
+        self.end = end
+        self.started = started
+        self.duration = duration
+
+    def frame(self, now):
+        if self.duration <= 0:
+            return self.end
+        progress = min(1.0, (now - self.started) / self.duration)
+        return [_lerp_color(a, b, progress) for a, b in zip(self.start, self.end)]
+
+    def finished(self, now):
+        return now - self.started >= self.duration
+
+
+class _Pulse:
+    """Sinusoidal breathing between two intensities of one colour"""
+
+    def __init__(self, color, count, started, period, low, high):
+        self.color = color
+        self.count = count
+        self.started = started
+        self.period = period
+        self.low = low
+        self.high = high
+
+    def frame(self, now):
+        phase = (now - self.started) / self.period
+        level = self.low + (self.high - self.low) * (0.5 - 0.5 * math.cos(2 * math.pi * phase))
+        return [tuple(int(c * level) for c in self.color)] * self.count
+
+    def finished(self, now):
+        return False
+
+
+class _Ramp:
+    """Linear brightness ramp"""
+
+    def __init__(self, start, end, started, duration):
+        self.start = start
+        self.end = end
+        self.started = started
+        self.duration = duration
+
+    def level(self, now):
+        if self.duration <= 0:
+            return self.end
+        progress = min(1.0, (now - self.started) / self.duration)
+        return self.start + (self.end - self.start) * progress
+
+    def finished(self, now):
+        return now - self.started >= self.duration
+
+
+class _ProfilePlayback:
+    """Samples a precomputed wake profile for both colour and brightness"""
+
+    def __init__(self, profile, count, started):
+        self.profile = profile
+        self.count = count
+        self.started = started
+
+    def frame(self, now):
+        return [self.profile.colors[self.profile.index(now - self.started)]] * self.count
+
+    def level(self, now):
+        return self.profile.brightness[self.profile.index(now - self.started)]
+
+    def finished(self, now):
+        return now - self.started >= self.profile.duration
+
+
+class LedEngine:
+    """Background thread that owns the NeoPixel buffer.
+
+    Callers submit effects and return immediately. The engine renders the
+    latest requested state once per frame, so any number of changes between
+    two frames cost at most one show().
+    """
+
+    def __init__(self, pixels, max_fps=60, gamma=2.2):
+        """Initialize the LED engine"""
+        self.pixels = pixels
+        self.count = len(pixels)
+        self.frame_interval = 1.0 / max_fps
+        self.gamma_table = build_gamma_table(gamma)
+
+        # Brightness and gamma are applied here, not by the driver
+        self.pixels.brightness = 1.0
+
+        self._condition = threading.Condition()
+        self._effect = _Transition([BLACK] * self.count, [BLACK] * self.count, 0, 0)
+        self._brightness = _Ramp(50, 50, 0, 0)
+        self._dirty = True
+        self._drawing = False
+        self._running = True
+        self._last_output = None
+
+        self.stats = {
+            'frames': 0,
+            'shows': 0,
+            'commands': 0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="led-engine", daemon=True)
+        self._thread.start()
+
+    def fill(self, color, duration=0):
+        """Fade every pixel to one colour"""
+        self.set_pixels([tuple(color)] * self.count, duration)
+
+    def gradient(self, start_color, end_color, duration=0):
+        """Fade to a linear gradient running along the strip"""
+        steps = max(1, self.count - 1)
+        colors = [_lerp_color(start_color, end_color, i / steps) for i in range(self.count)]
+        self.set_pixels(colors, duration)
+
+    def set_pixels(self, colors, duration=0):
+        """Fade each pixel to its own colour"""
+        with self._condition:
+            now = time.monotonic()
+            current = self._effect.frame(now)
+            self._effect = _Transition(list(current), list(colors), now, duration)
+            self._notify()
+
+    def pulse(self, color, period=2.0, low=0.2, high=1.0):
+        """Breathe a colour until another effect replaces it"""
+        with self._condition:
+            self._effect = _Pulse(tuple(color), self.count, time.monotonic(), period, low, high)
+            self._notify()
+
+    def play_profile(self, profile, elapsed=0):
+        """Follow a wake profile's colour and brightness tables, starting `elapsed` seconds in"""
+        with self._condition:
+            playback = _ProfilePlayback(profile, self.count, time.monotonic() - elapsed)
+            self._effect = playback
+            self._brightness = playback
+            self._notify()
+
+    def set_brightness(self, level, duration=0):
+        """Ramp overall brightness (0-100)"""
+        level = max(0, min(100, level))
+        with self._condition:
+            now = time.monotonic()
+            self._brightness = _Ramp(self._brightness.level(now), level, now, duration)
+            self._notify()
+
+    def current_color(self):
+        """Get the colour of the first pixel as currently rendered"""
+        with self._condition:
+            return self._effect.frame(time.monotonic())[0]
+
+    def wait_idle(self, timeout=None):
+        """Block until every submitted command is on the strip and no effect is running"""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not (self._dirty or self._drawing or self._animating(time.monotonic())),
+                timeout
+            )
+
+    def stop(self, timeout=1.0):
+        """Stop the engine thread after flushing the current state"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _notify(self):
+        self.stats['commands'] += 1
+        self._dirty = True
+        self._condition.notify_all()
+
+    def _animating(self, now):
+        return not (self._effect.finished(now) and self._brightness.finished(now))
+
+    def _run(self):
+        next_frame = time.monotonic()
+        while True:
+            with self._condition:
+                # Sleep until there is something to draw
+                while self._running and not self._dirty and not self._animating(time.monotonic()):
+                    self._condition.wait()
+
+                now = time.monotonic()
+                if now < next_frame:
+                    # Cap the refresh rate; later commands merge into this frame
+                    self._condition.wait(next_frame - now)
+                    now = time.monotonic()
+
+                running = self._running
+                self._dirty = False
+                self._drawing = True
+                colors = self._effect.frame(now)
+                level = int(round(self._brightness.level(now)))
+
+            self._show(colors, level)
+            next_frame = now + self.frame_interval
+            with self._condition:
+                self._drawing = False
+                self._condition.notify_all()  # Wake wait_idle() callers
+            if not running:
+                break
+
+    def _show(self, colors, level):
+        """Write a frame through the gamma table, skipping unchanged frames"""
+        lut = self.gamma_table[level]
+        output = [(lut[r], lut[g], lut[b]) for r, g, b in colors]
+        self.stats['frames'] += 1
+        if output == self._last_output:
+            return
+        try:
+            for index, color in enumerate(output):
+                self.pixels[index] = color
+            self.pixels.show()
+            self.stats['shows'] += 1
+            self._last_output = output
+        except Exception as e:
+            logger.error(f"Failed to show LED frame: {str(e)}")
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+# Alarm states
+IDLE = 'idle'
+PRE_WAKE = 'pre-wake'
+RINGING = 'ringing'
+SNOOZED = 'snoozed'
+DISMISSED = 'dismissed'
+
+ALLOWED_TRANSITIONS = {
+    IDLE: {PRE_WAKE, RINGING, SNOOZED},  # SNOOZED only when restoring a saved snooze
+    PRE_WAKE: {PRE_WAKE, RINGING, DISMISSED},
+    RINGING: {SNOOZED, DISMISSED},
+    SNOOZED: {PRE_WAKE, RINGING, DISMISSED},
+    DISMISSED: {IDLE},
+}
+
+RING_CRESCENDO = 20  # Seconds for a gradual-wake alarm sound to reach full volume
+
+
+class AlarmLifecycle:
+    """State machine for the alarm that currently owns the lights and speaker.
+
+    Hardware outputs are set once, on entry to each state. Transitions are
+    signalled through a condition variable, so snooze and dismiss take
+    effect as soon as they are requested and a watcher thread can end a
+    ring that nobody answers. Without the watcher (e.g. under a virtual
+    clock) the owner calls check_timeout() instead.
+    """
+
+    def __init__(self, hardware, ring_timeout=timedelta(minutes=30), history=256, now=datetime.now,
+                 watch=True):
+        """Initialize the AlarmLifecycle"""
+        self.hardware = hardware
+        self.now = now  # Wall clock used to measure lateness and the ring timeout
+        self.ring_timeout = ring_timeout
+
+        self.state = IDLE
+        self.alarm = None
+        self.scheduled_time = None  # When the current alarm was meant to ring
+        # Pending snoozes: scheduler key -> alarm. They outlive the SNOOZED state, since
+        # another alarm may pre-wake or ring meanwhile, and end on dismiss or when they fire
+        self.snoozes = {}
+
+        self.registry = get_registry()
+        
+        # Recent transitions, oldest first
+        self.transitions = deque(maxlen=history)
+
+        self._condition = threading.Condition()
+        self._listeners = []  # Called with the new state after every transition
+        self.ring_deadline = None  # When an unanswered ring is dismissed
+        self._running = True
+        self._watcher = None
+        if watch:
+            self._watcher = threading.Thread(target=self._watch, name="alarm-lifecycle", daemon=True)
+            self._watcher.start()
+
+    def pre_wake(self, alarm, alarm_time, profile, elapsed):
+        """Start the gradual wake for an upcoming alarm"""
+        with self._condition:
+            return self._transition(PRE_WAKE, alarm, alarm_time, profile=profile, elapsed=elapsed)
+
+    def ring(self, alarm, scheduled_time):
+        """Start ringing"""
+        with self._condition:
+            return self._transition(RINGING, alarm, scheduled_time)
+
+    def snooze(self, snooze_key):
+        """Silence the ringing alarm until its snooze event fires"""
+        requested = time.monotonic()
+        with self._condition:
+            if self.state != RINGING or not self.alarm.snooze_enabled:
+                return False
+            self.snoozes[snooze_key] = self.alarm
+            return self._transition(SNOOZED, self.alarm, self.scheduled_time, requested)
+
+    def restore_snooze(self, alarm, scheduled_time, snooze_key):
+        """Resume a snooze that was pending before a restart"""
+        with self._condition:
+            if self.state != IDLE:
+                return False
+            self.snoozes[snooze_key] = alarm
+            return self._transition(SNOOZED, alarm, scheduled_time, reason="restored")
+
+    def dismiss(self, reason="user"):
+        """Stop the alarm; returns the keys of the pending snoozes that should be cancelled"""
+        requested = time.monotonic()
+        with self._condition:
+            if self.state not in (PRE_WAKE, RINGING, SNOOZED):
+                return []
+            snooze_keys = list(self.snoozes)
+            self.snoozes.clear()
+            self._transition(
+                DISMISSED, self.alarm, self.scheduled_time, requested, reason=reason
+            )
+            self._transition(IDLE, None, None)
+            return snooze_keys
+
+    def release_snooze(self, snooze_key):
+        """Forget a snooze that has rung or expired; returns whether it was pending"""
+        with self._condition:
+            return self.snoozes.pop(snooze_key, None) is not None
+
+    def is_ringing(self):
+        """Check whether an alarm is currently ringing"""
+        return self.state == RINGING
+
+    def add_listener(self, callback):
+        """Call `callback(state)` after every transition, on the thread that made it"""
+        self._listeners.append(callback)
+
+    def wait_for(self, states, timeout=None):
+        """Block until the state is one of `states`; returns whether it got there"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.state in states, timeout)
+
+    def check_timeout(self):
+        """Dismiss a ring that has outlived the ring timeout; returns whether it did"""
+        with self._condition:
+            if self.ring_deadline is None or self.now() < self.ring_deadline:
+                return False
+            self._expire_ring()
+            return True
+
+    def stop(self):
+        """Stop the watcher thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._watcher:
+            self._watcher.join(1.0)
+
+    def _transition(self, state, alarm, scheduled_time, requested=None, **details):
+        """Move to a new state and apply its outputs (caller holds the lock)"""
+        previous = self.state
+        if state not in ALLOWED_TRANSITIONS[previous]:
+            logger.warning(f"Ignoring alarm transition {previous} -> {state}")
+            return False
+
+        requested = requested or time.monotonic()
+        self.state = state
+        self.alarm = alarm
+        self.scheduled_time = scheduled_time
+        self.ring_deadline = self.now() + self.ring_timeout if state == RINGING else None
+
+        try:
+            self._apply_outputs(state, alarm, details)
+        except Exception as e:
+            logger.error(f"Failed to apply outputs for {state}: {str(e)}")
+
+        now = self.now()
+        record = {
+            'state': state,
+            'previous': previous,
+            'at': now,
+            'alarm': alarm,
+            'scheduled': scheduled_time,
+            'lateness': (now - scheduled_time).total_seconds()
+                        if state == RINGING and scheduled_time else None,
+            'latency': time.monotonic() - requested,  # From request to outputs applied
+            'reason': details.get('reason'),
+        }
+        self.transitions.append(record)
+        if record['lateness'] is not None:
+            self.registry.observe('smartalarm_alarm_lateness_seconds', record['lateness'])
+            logger.info(f"Alarm {previous} -> {state}, {record['lateness']:.3f} s late")
+        else:
+            logger.info(f"Alarm {previous} -> {state} in {record['latency'] * 1000:.1f} ms")
+
+        self._condition.notify_all()
+        for callback in self._listeners:
+            try:
+                callback(state)
+            except Exception as e:
+                logger.error(f"Alarm transition listener failed: {str(e)}")
+        return True
+
+    def _apply_outputs(self, state, alarm, details):
+        """Set the lights and speaker for a state, once"""
+        if state == PRE_WAKE:
+            self.hardware.start_wake_profile(details['profile'], details['elapsed'])
+        elif state == RINGING:
+            self.hardware.set_led_brightness(100)
+            self.hardware.set_led_color(255, 255, 255)
+            self.hardware.play_sound(
+                alarm.sound, loop=True, crescendo=RING_CRESCENDO if alarm.gradual_wake else 0
+            )
+        elif state in (SNOOZED, DISMISSED):
+            # The controller knows its fade (HardwareController.STOP_FADE); others cut off
+            self.hardware.stop_sound(fade_out=getattr(self.hardware, 'STOP_FADE', 0))
+            self.hardware.set_led_brightness(0)
+
+    def _watch(self):
+        """End rings that exceed the ring timeout"""
+        with self._condition:
+            while self._running:
+                if self.ring_deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = (self.ring_deadline - self.now()).total_seconds()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                self._expire_ring()
+
+    def _expire_ring(self):
+        """Dismiss the unanswered ring (caller holds the lock)"""
+        logger.warning("Alarm rang without response, dismissing")
+        self._transition(DISMISSED, self.alarm, self.scheduled_time, reason="timeout")
+        self._transition(IDLE, None, None)
@@ -1,17 +1,23 @@
 #!/usr/bin/env python3
 
-import time
+import asyncio
+import os
+import signal
 import sys
-import json
-import requests
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime, timedelta
 import logging
 
 # Local module imports
-from display import Display
 from alarm import AlarmManager
+from store import AlarmStore
+from backends import create_backend
+from metrics import MetricsServer, get_registry
+from scheduler import RING
 from weather import WeatherManager
-from hardware import HardwareController
+from settings_sync import SettingsPushClient, SettingsSyncClient
 
 # Configure logging
 logging.basicConfig(
@@ -26,80 +32,348 @@ class SmartAlarm:
         
         # Initialize components
         try:
-            self.hardware = HardwareController()
-            self.display = Display()
-            self.alarm_manager = AlarmManager(self.hardware)
-            self.weather_manager = WeatherManager()
-            
             # Configuration
-            self.update_interval = 60  # Update display every 60 seconds
+            self.update_interval = 60  # Poll settings every 60 seconds while the push stream is down (the display follows minute boundaries)
             self.weather_update_interval = 1800  # Update weather every 30 minutes
-            self.last_weather_update = 0
+            self.network_deadline = 15  # Seconds a fetch may take before it is abandoned
+            self.display_deadline = 5  # Seconds a frame may take before it is abandoned
+            self.frame_prepare_lead = 1.0  # Seconds before a minute boundary its frame is rendered
+            self.frame_swap_lead = 0.02  # Seconds early the loop wakes to hand the swap to the display thread
+            self.swap_offsets = deque(maxlen=1440)  # Seconds each frame swap landed after its boundary
+            
+            # Instrumentation: a local Prometheus endpoint and/or a periodic JSON dump
+            self.metrics = get_registry()
+            self.metrics_port = int(os.environ.get('SMARTALARM_METRICS_PORT', 0)) or None
+            self.metrics_dump = os.environ.get('SMARTALARM_METRICS_DUMP')
+            self.metrics_dump_interval = 60  # Seconds between JSON dumps
+            self.metrics_server = None
+            
+            # Blocking work runs off the event loop. Alarm state and hardware share
+            # one thread; each network source gets its own so a hang stays isolated.
+            self.alarm_executor = ThreadPoolExecutor(1, thread_name_prefix="alarm")
+            self.display_executor = ThreadPoolExecutor(1, thread_name_prefix="display")
+            self.settings_executor = ThreadPoolExecutor(1, thread_name_prefix="settings")
+            self.weather_executor = ThreadPoolExecutor(1, thread_name_prefix="weather")
+            self.clock_executor = ThreadPoolExecutor(1, thread_name_prefix="clock")
+            self.executors = [
+                self.alarm_executor, self.display_executor,
+                self.settings_executor, self.weather_executor, self.clock_executor
+            ]
+            
+            # Bring components up in parallel, each on the thread that will own it,
+            # so the clock face is drawn while drivers are still initializing
+            self.startup_times = {}  # Component -> seconds after startup began
+            self._startup_began = time.monotonic()
+            display = self.display_executor.submit(self._start_display)
+            weather = self.weather_executor.submit(self._timed_start, 'weather', WeatherManager)
+            alarms = self.alarm_executor.submit(self._start_alarms)
+            
+            # TODO: Replace with actual API endpoint
+            self.settings_client = SettingsSyncClient(
+                'https://your-xhosting-website.com/api/alarm-settings'
+            )
+            self.settings_push = SettingsPushClient(
+                'https://your-xhosting-website.com/api/alarm-settings/stream',
+                self._on_pushed_settings
+            )
+            
+            self.display = display.result()
+            self.weather_manager = weather.result()
+            self.hardware, self.alarm_manager = alarms.result()
+            self.clock = self.alarm_manager.clock
+            self.metrics.register_collector(self._component_metrics)
+            self.startup_times['ready'] = time.monotonic() - self._startup_began
             
             logger.info("All components initialized successfully")
+            logger.info("Startup times: " + ", ".join(
+                f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.startup_times.items()
+            ))
         except Exception as e:
             logger.error(f"Failed to initialize components: {str(e)}")
             sys.exit(1)
 
+    def _timed_start(self, name, factory, *args):
+        """Create a component, recording when it became available"""
+        component = factory(*args)
+        self.startup_times[name] = time.monotonic() - self._startup_began
+        return component
+
+    def _start_display(self):
+        """Create the display and draw the first frame"""
+        display = self._timed_start('display', create_backend, 'display')
+        display.update(time=datetime.now(), weather=None, next_alarm=None)
+        self.startup_times['first_frame'] = time.monotonic() - self._startup_began
+        return display
+
+    def _start_alarms(self):
+        """Create the hardware and the alarm manager that drives it"""
+        hardware = self._timed_start('hardware', create_backend, 'hardware')
+        alarm_manager = self._timed_start('alarms', AlarmManager, hardware, None, AlarmStore())
+        
+        # Ring from the saved schedule until the website answers
+        alarm_manager.restore()
+        self.startup_times['restored'] = time.monotonic() - self._startup_began
+        return hardware, alarm_manager
+
+    def _component_metrics(self):
+        """Counters the components keep themselves, read when metrics are scraped"""
+        samples = []
+        leds = getattr(self.hardware, 'leds', None)
+        if leds:
+            samples.append(('counter', 'smartalarm_led_shows_total', {}, leds.stats['shows']))
+            samples.append(('counter', 'smartalarm_led_frames_total', {}, leds.stats['frames']))
+        sounds = getattr(self.hardware, 'sounds', None)
+        if sounds:
+            samples.append(('counter', 'smartalarm_sound_cache_hits_total', {}, sounds.stats['hits']))
+            samples.append(('counter', 'smartalarm_sound_cache_misses_total', {}, sounds.stats['misses']))
+        audio = getattr(self.hardware, 'audio', None)
+        if audio:
+            samples.append(('counter', 'smartalarm_audio_blocks_total', {}, audio.stats['blocks']))
+            samples.append(('counter', 'smartalarm_audio_underruns_total', {}, audio.stats['underruns']))
+            samples.append(('gauge', 'smartalarm_audio_cpu_load', {}, audio.cpu_load()))
+            samples.append(('gauge', 'smartalarm_audio_buffer_latency_seconds', {}, audio.buffer_latency()))
+        samples.append((
+            'counter', 'smartalarm_settings_bytes_total', {'transport': 'push'},
+            self.settings_push.stats['bytes_received']
+        ))
+        samples.append((
+            'counter', 'smartalarm_settings_bytes_total', {'transport': 'poll'},
+            self.settings_client.stats['bytes_fetched']
+        ))
+        samples.append(('gauge', 'smartalarm_settings_push_connected', {}, int(self.settings_push.connected)))
+        weather = self.weather_manager.get_metrics()
+        samples.append(('counter', 'smartalarm_weather_fetch_failures_total', {}, weather['failures']))
+        samples.append(('counter', 'smartalarm_weather_fetches_coalesced_total', {}, weather['coalesced']))
+        if weather['last_fetch_latency'] is not None:
+            samples.append((
+                'gauge', 'smartalarm_weather_fetch_latency_seconds', {}, weather['last_fetch_latency']
+            ))
+        if weather.get('age_seconds') is not None:
+            samples.append(('gauge', 'smartalarm_weather_age_seconds', {}, weather['age_seconds']))
+            samples.append(('gauge', 'smartalarm_weather_fresh', {}, int(weather['fresh'])))
+        samples.append(('counter', 'smartalarm_rtc_i2c_reads_total', {}, self.clock.stats['i2c_reads']))
+        samples.append(('gauge', 'smartalarm_clock_drift_ppm', {}, self.clock.stats['drift_ppm']))
+        samples.append(('counter', 'smartalarm_display_frames_total', {}, self.display.stats['frames']))
+        return samples
+
     def fetch_website_data(self):
-        """Fetch alarm settings and configurations from the xhosting website"""
-        try:
-            # TODO: Replace with actual API endpoint
-            response = requests.get('https://your-xhosting-website.com/api/alarm-settings')
-            return response.json()
-        except Exception as e:
-            logger.error(f"Failed to fetch website data: {str(e)}")
-            return None
+        """Fetch alarm settings and configurations from the xhosting website.
+        
+        Returns None when the settings have not changed since the last fetch.
+        """
+        return self.settings_client.fetch()
 
-    def update_display(self):
-        """Update the display with current information"""
+    def prepare_display(self, frame_time, next_alarm=None):
+        """Render the frame for `frame_time` offscreen"""
         try:
-            current_time = datetime.now()
             weather_data = self.weather_manager.get_current_weather()
-            
-            # Update display with current information
-            self.display.update(
-                time=current_time,
+            self.display.prepare(
+                time=frame_time,
                 weather=weather_data,
-                active_alarms=self.alarm_manager.get_active_alarms()
+                next_alarm=next_alarm
             )
         except Exception as e:
             logger.error(f"Failed to update display: {str(e)}")
 
-    def run(self):
-        """Main loop of the SmartAlarm system"""
-        logger.info("Starting SmartAlarm main loop")
+    def present_display(self, boundary):
+        """Wait for the minute boundary on the display thread, then swap the frame in"""
+        remaining = (boundary - self.clock.now()).total_seconds()
+        while remaining > 0:
+            time.sleep(remaining)
+            remaining = (boundary - self.clock.now()).total_seconds()
         
+        self.display.present()
+        offset = (self.clock.now() - boundary).total_seconds()
+        self.swap_offsets.append(offset)
+        self.metrics.observe('smartalarm_frame_swap_offset_seconds', offset)
+        logger.debug(f"Frame for {boundary:%H:%M} swapped in {offset * 1000:.1f} ms after the boundary")
+        return offset
+
+    async def _call(self, executor, func, *args, deadline=None):
+        """Run a blocking call in an executor, abandoning it after the deadline"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), deadline)
+
+    async def _every(self, name, interval, step):
+        """Run step() on a fixed cadence until cancelled"""
+        loop = asyncio.get_running_loop()
         while True:
+            started = loop.time()
             try:
-                current_time = time.time()
-                
-                # Check and update weather if needed
-                if current_time - self.last_weather_update >= self.weather_update_interval:
-                    self.weather_manager.update_weather()
-                    self.last_weather_update = current_time
-                
-                # Fetch latest settings from website
-                website_data = self.fetch_website_data()
-                if website_data:
-                    self.alarm_manager.update_settings(website_data)
-                
-                # Check and trigger alarms
-                self.alarm_manager.check_alarms()
-                
-                # Update display
-                self.update_display()
+                with self.metrics.timer('smartalarm_loop_stage_seconds', stage=name):
+                    await step()
+            except asyncio.TimeoutError:
+                self.metrics.inc('smartalarm_loop_stage_errors_total', stage=name, error="deadline")
+                logger.error(f"{name} task missed its deadline")
+            except Exception as e:
+                self.metrics.inc('smartalarm_loop_stage_errors_total', stage=name, error="exception")
+                logger.error(f"Error in {name} task: {str(e)}")
+            await asyncio.sleep(max(0, interval - (loop.time() - started)))
+
+    async def _sync_settings(self):
+        """Poll settings from the website, unless the push stream is delivering them"""
+        if self.settings_push.connected:
+            return
+        website_data = await self._call(
+            self.settings_executor, self.fetch_website_data, deadline=self.network_deadline
+        )
+        if website_data:
+            await self._apply_settings(website_data)
+
+    async def _apply_settings(self, website_data):
+        """Hand new settings to the weather and alarm managers"""
+        self.weather_manager.update_settings(website_data)
+        await self._call(self.alarm_executor, self.alarm_manager.update_settings, website_data)
+        self.alarms_changed.set()
+
+    def _on_pushed_settings(self, website_data):
+        """Apply settings from the push stream (called on its thread, which waits)"""
+        asyncio.run_coroutine_threadsafe(
+            self._apply_settings(website_data), self.loop
+        ).result(self.network_deadline)
+
+    async def _refresh_weather(self):
+        """Refresh the weather cache"""
+        await self._call(
+            self.weather_executor, self.weather_manager.update_weather,
+            deadline=self.network_deadline
+        )
+
+    async def _sync_clock(self):
+        """Re-read the RTC so the clock's drift estimate stays current"""
+        await self._call(self.clock_executor, self.clock.sync)
+
+    async def _sleep_until(self, when):
+        """Sleep until a wall-clock time, measured against the disciplined clock"""
+        await asyncio.sleep(max(0.0, (when - self.clock.now()).total_seconds()))
+
+    async def _run_display(self):
+        """Swap in a pre-rendered frame on every wall-clock minute boundary.
+        
+        Each wait is computed from the clock rather than a fixed interval,
+        so the loop's own run time never accumulates as drift.
+        """
+        while True:
+            try:
+                now = self.clock.now()
+                boundary = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
                 
-                # Sleep for the update interval
-                time.sleep(self.update_interval)
+                await self._sleep_until(boundary - timedelta(seconds=self.frame_prepare_lead))
+                with self.metrics.timer('smartalarm_loop_stage_seconds', stage="display"):
+                    # A snapshot read: the frame does not wait behind alarm work
+                    next_alarm = self.alarm_manager.next_event(RING)
+                    await self._call(
+                        self.display_executor, self.prepare_display, boundary, next_alarm,
+                        deadline=self.display_deadline
+                    )
                 
-            except KeyboardInterrupt:
-                logger.info("Shutting down SmartAlarm system...")
-                self.hardware.cleanup()
-                sys.exit(0)
+                await self._sleep_until(boundary - timedelta(seconds=self.frame_swap_lead))
+                await self._call(
+                    self.display_executor, self.present_display, boundary,
+                    deadline=self.display_deadline
+                )
+            except asyncio.TimeoutError:
+                logger.error("display task missed its deadline")
+            except Exception as e:
+                logger.error(f"Error in display task: {str(e)}")
+                await asyncio.sleep(1)
+    
+    def swap_offset_summary(self):
+        """Summary of how far frame swaps landed from their minute boundaries, in ms"""
+        if not self.swap_offsets:
+            return None
+        ordered = sorted(self.swap_offsets)
+        return {
+            'frames': len(ordered),
+            'median_ms': ordered[len(ordered) // 2] * 1000,
+            'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
+
+    async def _dump_metrics(self):
+        """Write the metrics snapshot to disk"""
+        await self._call(self.settings_executor, self.metrics.dump_json, self.metrics_dump)
+
+    async def _run_alarms(self):
+        """Check alarms whenever the next event is due or the alarm set changes"""
+        while True:
+            try:
+                with self.metrics.timer('smartalarm_loop_stage_seconds', stage="alarms"):
+                    await self._call(self.alarm_executor, self.alarm_manager.check_alarms)
+                delay = self.alarm_manager.seconds_until_next_event()
+                if delay is not None:
+                    self.metrics.set('smartalarm_next_event_seconds', delay)
             except Exception as e:
-                logger.error(f"Error in main loop: {str(e)}")
-                time.sleep(5)  # Wait before retrying
+                self.metrics.inc('smartalarm_loop_stage_errors_total', stage="alarms", error="exception")
+                logger.error(f"Error in alarm task: {str(e)}")
+                delay = None
+            
+            delay = self.update_interval if delay is None else min(delay, self.update_interval)
+            self.alarms_changed.clear()
+            try:
+                await asyncio.wait_for(self.alarms_changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_alarm_transition(self, state):
+        """Wake the alarm task, e.g. when a ring it waits behind is answered on another thread"""
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.alarms_changed.set)
+
+    async def run_async(self):
+        """Run the network, alarm and display tasks until asked to stop"""
+        logger.info("Starting SmartAlarm main loop")
+        
+        loop = self.loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        self.alarms_changed = asyncio.Event()
+        self.alarm_manager.lifecycle.add_listener(self._on_alarm_transition)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        
+        tasks = [
+            asyncio.create_task(self._every("settings", self.update_interval, self._sync_settings)),
+            asyncio.create_task(self._every("weather", self.weather_update_interval, self._refresh_weather)),
+            asyncio.create_task(self._run_alarms()),
+            asyncio.create_task(self._every(
+                "clock", self.clock.sync_interval.total_seconds(), self._sync_clock
+            )),
+            asyncio.create_task(self._run_display()),
+        ]
+        if self.metrics_dump:
+            tasks.append(asyncio.create_task(
+                self._every("metrics", self.metrics_dump_interval, self._dump_metrics)
+            ))
+        if self.metrics_port:
+            self.metrics_server = MetricsServer(self.metrics, port=self.metrics_port)
+            self.metrics_server.start()
+        self.settings_push.start()
+        
+        try:
+            await stop.wait()
+        finally:
+            logger.info("Shutting down SmartAlarm system...")
+            logger.info(f"Frame swap offsets: {self.swap_offset_summary()}")
+            self.settings_push.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            await self._call(self.alarm_executor, self.alarm_manager.cleanup)
+            await self._call(self.display_executor, self.display.cleanup)
+            await self._call(self.alarm_executor, self.hardware.cleanup)
+            self.settings_client.close()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            
+            for executor in self.executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        """Main entry point of the SmartAlarm system"""
+        asyncio.run(self.run_async())
 
 if __name__ == "__main__":
     smart_alarm = SmartAlarm()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; +Inf is implied
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LATENESS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+HELP = {
+    'smartalarm_loop_stage_seconds': "Time spent in one main loop stage",
+    'smartalarm_loop_stage_errors_total': "Main loop stage runs that failed or missed their deadline",
+    'smartalarm_next_event_seconds': "Seconds until the next scheduled alarm event, when last checked",
+    'smartalarm_http_request_seconds': "Duration of outgoing HTTP requests",
+    'smartalarm_frame_render_seconds': "Time to render one display frame",
+    'smartalarm_frame_swap_offset_seconds': "How long after the minute boundary the new frame was shown",
+    'smartalarm_alarm_lateness_seconds': "How late alarms started ringing after their scheduled time",
+    'smartalarm_settings_propagation_seconds': "Time from a settings change on the website to its arrival",
+    'smartalarm_settings_bytes_total': "Settings bytes received, by transport",
+    'smartalarm_settings_push_connected': "Whether the settings push stream is connected",
+    'smartalarm_weather_age_seconds': "Age of the cached current weather",
+    'smartalarm_weather_fresh': "Whether the cached current weather is within its TTL",
+    'smartalarm_weather_fetch_latency_seconds': "Duration of the last weather API request",
+    'smartalarm_weather_fetch_failures_total': "Weather API requests that failed",
+    'smartalarm_weather_fetches_coalesced_total': "Weather fetches that joined a request already in flight",
+    'smartalarm_led_shows_total': "LED strip writes",
+    'smartalarm_led_frames_total': "LED engine frames computed",
+    'smartalarm_sound_cache_hits_total': "Alarm sounds started from the decoded cache",
+    'smartalarm_sound_cache_misses_total': "Alarm sounds decoded on demand",
+    'smartalarm_audio_blocks_total': "Audio blocks mixed by the audio engine",
+    'smartalarm_audio_underruns_total': "Times the audio output ran dry before the next block was queued",
+    'smartalarm_audio_cpu_load': "Fraction of real time spent mixing audio",
+    'smartalarm_audio_buffer_latency_seconds': "Delay from an audio gain change to hearing it",
+    'smartalarm_rtc_i2c_reads_total': "DS3231 reads over I2C",
+    'smartalarm_clock_drift_ppm': "Estimated drift of the monotonic clock against the reference",
+    'smartalarm_display_frames_total': "Display frames rendered",
+}
+
+
+class _NullTimer:
+    """Timer used while metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram:
+    """Cumulative latency histogram"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Initialize the Histogram"""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs, ending with +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms for the main loop.
+
+    Recording is a dict lookup and an increment under a lock. When disabled,
+    every recording call returns immediately. Collectors are called only
+    when metrics are rendered, so component stats cost nothing per frame.
+    """
+
+    def __init__(self, enabled=True):
+        """Initialize the MetricsRegistry"""
+        self.enabled = enabled
+        self.buckets = {
+            'smartalarm_alarm_lateness_seconds': LATENESS_BUCKETS,
+            'smartalarm_settings_propagation_seconds': LATENESS_BUCKETS,
+        }
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []  # Callables returning [(kind, name, labels, value)]
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """Context manager that observes its duration"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def register_collector(self, collector):
+        """Add a callable polled at render time for (kind, name, labels, value) samples"""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict"""
+        counters, gauges, histograms = self._collect()
+        return {
+            'timestamp': time.time(),
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in counters.items()
+            ],
+            'gauges': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in gauges.items()
+            ],
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': {str(bound): count for bound, count in histogram.cumulative()},
+                }
+                for (name, labels), histogram in histograms.items()
+            ],
+        }
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        counters, gauges, histograms = self._collect()
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for kind, samples in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in sorted(samples.items()):
+                describe(name, kind)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            describe(name, 'histogram')
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        """Write a snapshot to a file atomically"""
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_file = f"{path}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_file, path)
+        except OSError as e:
+            logger.error(f"Failed to write metrics dump: {str(e)}")
+
+    def _collect(self):
+        """Copy the recorded metrics and add collector samples"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {
+                key: _copy_histogram(histogram) for key, histogram in self._histograms.items()
+            }
+
+        for collector in self._collectors:
+            try:
+                for kind, name, labels, value in collector():
+                    key = (name, tuple(sorted(labels.items())))
+                    (counters if kind == 'counter' else gauges)[key] = value
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+        return counters, gauges, histograms
+
+
+def _copy_histogram(histogram):
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.sum = histogram.sum
+    copy.count = histogram.count
+    return copy
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving /metrics (Prometheus) and /metrics.json"""
+
+    def __init__(self, registry, host="127.0.0.1", port=9100):
+        """Initialize the MetricsServer"""
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Serve metrics from a background thread"""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.render_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self._server.daemon_threads = True
+            self.port = self._server.server_address[1]
+            self._thread = threading.Thread(
+                target=self._server.serve_forever, name="metrics-http", daemon=True
+            )
+            self._thread.start()
+            logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            logger.error(f"Failed to start metrics server: {str(e)}")
+            self._server = None
+
+    def stop(self):
+        """Stop serving"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Get the process-wide MetricsRegistry (disabled by SMARTALARM_METRICS=0)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry(os.environ.get('SMARTALARM_METRICS', '1') != '0')
+        return _registry
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OneShotStore:
+    """Bounded set of one-shot alarm events (snoozes, timers) keyed by absolute time.
+
+    Events live in a dict keyed by (kind, fire_time), with a heap of fire
+    times as the expiry index. Fired, cancelled and expired events leave the
+    dict at once; their heap slots are dropped when they reach the top, or
+    all together once stale slots outnumber live ones, so memory stays
+    proportional to `max_entries`.
+    """
+
+    def __init__(self, max_entries=32):
+        """Initialize the OneShotStore"""
+        self.max_entries = max_entries
+        self._events = {}  # (kind, fire_time) -> AlarmEvent
+        self._heap = []  # (fire_time, kind); may hold stale slots
+
+        self.stats = {
+            'added': 0,
+            'fired': 0,
+            'cancelled': 0,
+            'expired': 0,
+            'rejected': 0,
+            'peak': 0,
+            'compactions': 0,
+        }
+
+    def add(self, event):
+        """Store an AlarmEvent, replacing one of the same kind and time; returns its key"""
+        key = (event.kind, event.fire_time)
+        if key not in self._events:
+            if len(self._events) >= self.max_entries:
+                self.stats['rejected'] += 1
+                raise ValueError(f"too many pending one-shot alarms (limit {self.max_entries})")
+            heapq.heappush(self._heap, key[::-1])
+        self._events[key] = event
+        self.stats['added'] += 1
+        self.stats['peak'] = max(self.stats['peak'], len(self._events))
+        return key
+
+    def remove(self, key):
+        """Cancel an event; returns whether it was pending"""
+        if self._events.pop(key, None) is None:
+            return False
+        self.stats['cancelled'] += 1
+        self._maybe_compact()
+        return True
+
+    def peek(self):
+        """The earliest pending event, or None"""
+        heap = self._heap
+        while heap:
+            fire_time, kind = heap[0]
+            event = self._events.get((kind, fire_time))
+            if event is not None:
+                return event
+            heapq.heappop(heap)
+        return None
+
+    def pop(self):
+        """Remove and return the earliest pending event, or None"""
+        event = self.peek()
+        if event is not None:
+            heapq.heappop(self._heap)
+            del self._events[(event.kind, event.fire_time)]
+            self.stats['fired'] += 1
+        return event
+
+    def expire(self, before):
+        """Remove and return the events due before `before`"""
+        expired = []
+        while True:
+            event = self.peek()
+            if event is None or event.fire_time >= before:
+                break
+            heapq.heappop(self._heap)
+            del self._events[(event.kind, event.fire_time)]
+            expired.append(event)
+        if expired:
+            self.stats['expired'] += len(expired)
+            logger.warning(f"Dropped {len(expired)} expired one-shot alarms")
+        return expired
+
+    def events(self, kind=None):
+        """Pending events in fire time order, optionally of one kind"""
+        return sorted(
+            (event for event in self._events.values() if kind is None or event.kind == kind),
+            key=lambda event: event.fire_time
+        )
+
+    def heap_size(self):
+        """Slots in the expiry index, stale ones included"""
+        return len(self._heap)
+
+    def __len__(self):
+        return len(self._events)
+
+    def _maybe_compact(self):
+        """Rebuild the expiry index once most of its slots are stale"""
+        if len(self._heap) > 2 * len(self._events) + 16:
+            self._heap = [key[::-1] for key in self._events]
+            heapq.heapify(self._heap)
+            self.stats['compactions'] += 1
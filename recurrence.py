@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+
+import itertools
+import logging
+from bisect import bisect_left, insort
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DAILY = 'DAILY'
+WEEKLY = 'WEEKLY'
+WEEKDAY_CODES = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+DEFAULT_START = date(1970, 1, 5)  # A Monday, so intervals line up with weeks
+
+# RRULE subset: freq (DAILY/WEEKLY or None for listed dates only), interval,
+# weekday bitmask (BYDAY), start (DTSTART), until, extra dates (RDATE),
+# excluded dates (EXDATE), skip_holidays and an IANA time zone name.
+Recurrence = namedtuple('Recurrence', [
+    'freq', 'interval', 'weekdays', 'start', 'until', 'dates', 'exdates', 'skip_holidays', 'tz'
+])
+
+
+def _parse_date(value, field):
+    try:
+        return date.fromisoformat(value) if '-' in value else \
+            datetime.strptime(value[:8], "%Y%m%d").date()
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid date {value!r} in '{field}'")
+
+
+def parse_recurrence(entry, weekdays=0):
+    """Build a Recurrence from a website alarm entry, or None for a plain weekly alarm.
+
+    Recognised fields: 'rrule' (e.g. "FREQ=DAILY;INTERVAL=2;UNTIL=20261231"),
+    'start', 'dates', 'except', 'skip_holidays' and 'timezone'. A `weekdays`
+    mask from 'days' is used when the rule has no BYDAY.
+    """
+    fields = ('rrule', 'start', 'dates', 'except', 'skip_holidays', 'timezone')
+    if not any(field in entry for field in fields):
+        return None
+
+    freq, interval, until = (WEEKLY if weekdays else DAILY), 1, None
+    rrule = entry.get('rrule')
+    if rrule is not None:
+        if not isinstance(rrule, str):
+            raise ValueError("'rrule' must be a string")
+        for part in filter(None, rrule.upper().split(';')):
+            name, sep, value = part.partition('=')
+            if not sep:
+                raise ValueError(f"invalid rrule part {part!r}")
+            if name == 'FREQ':
+                if value not in (DAILY, WEEKLY):
+                    raise ValueError(f"unsupported rrule FREQ {value!r}")
+                freq = value
+            elif name == 'INTERVAL':
+                if not value.isdigit() or int(value) < 1:
+                    raise ValueError(f"invalid rrule INTERVAL {value!r}")
+                interval = int(value)
+            elif name == 'BYDAY':
+                try:
+                    weekdays = sum(1 << WEEKDAY_CODES.index(code) for code in set(value.split(',')))
+                except ValueError:
+                    raise ValueError(f"invalid rrule BYDAY {value!r}")
+            elif name == 'UNTIL':
+                until = _parse_date(value, 'rrule')
+            else:
+                raise ValueError(f"unsupported rrule part {name!r}")
+    elif 'dates' in entry and 'days' not in entry:
+        freq = None  # Only the listed dates
+
+    start = entry.get('start')
+    dates = entry.get('dates', [])
+    exdates = entry.get('except', [])
+    if not isinstance(dates, list) or not isinstance(exdates, list):
+        raise ValueError("'dates' and 'except' must be lists of dates")
+
+    skip_holidays = entry.get('skip_holidays', False)
+    if not isinstance(skip_holidays, bool):
+        raise ValueError("'skip_holidays' must be true or false")
+
+    tz = entry.get('timezone')
+    if tz is not None:
+        try:
+            ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, TypeError, ValueError):
+            raise ValueError(f"unknown time zone {tz!r}")
+
+    return Recurrence(
+        freq=freq,
+        interval=interval,
+        weekdays=weekdays,
+        start=_parse_date(start, 'start') if start is not None else DEFAULT_START,
+        until=until,
+        dates=frozenset(_parse_date(value, 'dates') for value in dates),
+        exdates=frozenset(_parse_date(value, 'except') for value in exdates),
+        skip_holidays=skip_holidays,
+        tz=tz,
+    )
+
+
+def occurs_on(rule, day, holidays=frozenset()):
+    """Check whether a rule fires on a date"""
+    if day in rule.exdates or (rule.skip_holidays and day in holidays):
+        return False
+    if day in rule.dates:
+        return True
+    if rule.freq is None or day < rule.start or (rule.until and day > rule.until):
+        return False
+
+    if rule.freq == DAILY:
+        if (day - rule.start).days % rule.interval:
+            return False
+        return not rule.weekdays or bool(rule.weekdays >> day.weekday() & 1)
+
+    # WEEKLY: every `interval` weeks counted from the week containing start
+    week_start = rule.start - timedelta(days=rule.start.weekday())
+    if (day - week_start).days // 7 % rule.interval:
+        return False
+    weekdays = rule.weekdays or 1 << rule.start.weekday()
+    return bool(weekdays >> day.weekday() & 1)
+
+
+class RecurrenceEngine:
+    """Rolling index of alarm occurrences over the next `horizon_days`.
+
+    Each alarm keeps a sorted list of its occurrence times, and all of them
+    are merged into one sorted index, so "next occurrence" and "occurrences
+    in a window" are binary searches. The window advances a day at a time,
+    generating only the newly covered days, and changing one alarm or the
+    holiday list touches only the affected alarms. Queries that reach
+    outside the window generate the uncovered days on the fly.
+    """
+
+    def __init__(self, horizon_days=14, holidays=()):
+        """Initialize the RecurrenceEngine"""
+        self.horizon_days = horizon_days
+        self.holidays = frozenset(holidays)
+        self.search_days = 400  # How far past the window a rare alarm is looked for
+
+        self._ids = itertools.count()
+        self._alarms = {}  # alarm -> (id, sorted occurrence datetimes)
+        self._by_id = {}  # id -> alarm
+        self._index = []  # sorted (datetime, id) across all alarms
+        self._zones = {}
+        self.window_start = None  # First date covered
+        self.window_end = None  # First date not covered
+
+        self.stats = {
+            'generated_days': 0,
+            'slow_searches': 0,
+            'unindexed_queries': 0,
+        }
+
+    # Above this many index changes at once, sort in bulk instead of inserting one by one
+    BULK = 64
+
+    def __len__(self):
+        return len(self._index)
+
+    def sync(self, alarms, today):
+        """Index exactly these alarms, adding and removing only the differences"""
+        self._ensure_window(today)
+        wanted = set(alarms)
+        removed = [alarm for alarm in self._alarms if alarm not in wanted]
+        if len(removed) > self.BULK:
+            # Rebuilding is cheaper than many deletions from the middle
+            removed_ids = {self._alarms.pop(alarm)[0] for alarm in removed}
+            for alarm_id in removed_ids:
+                del self._by_id[alarm_id]
+            self._index = [entry for entry in self._index if entry[1] not in removed_ids]
+        else:
+            for alarm in removed:
+                self.remove(alarm)
+
+        entries = []
+        for alarm in wanted:
+            if alarm not in self._alarms:
+                entries += self._register(alarm)
+        self._insert(entries)
+
+    def add(self, alarm):
+        """Index an alarm's occurrences within the window"""
+        if alarm not in self._alarms:
+            self._insert(self._register(alarm))
+
+    def remove(self, alarm):
+        """Drop an alarm from the index"""
+        entry = self._alarms.pop(alarm, None)
+        if entry is None:
+            return
+        alarm_id, times = entry
+        del self._by_id[alarm_id]
+        for when in times:
+            position = bisect_left(self._index, (when, alarm_id))
+            if position < len(self._index) and self._index[position] == (when, alarm_id):
+                del self._index[position]
+
+    def set_holidays(self, holidays):
+        """Replace the holiday calendar, re-indexing alarms that skip holidays.
+
+        Returns whether any indexed alarm was affected.
+        """
+        holidays = frozenset(holidays)
+        if holidays == self.holidays:
+            return False
+        self.holidays = holidays
+        affected = [alarm for alarm in self._alarms if alarm.rule and alarm.rule.skip_holidays]
+        for alarm in affected:
+            self.remove(alarm)
+            self.add(alarm)
+        return bool(affected)
+
+    def next_occurrence(self, alarm, after):
+        """First occurrence of an alarm at or after `after`, or None"""
+        self._ensure_window(after.date())
+        entry = self._alarms.get(alarm)
+        if entry is None:
+            self.add(alarm)
+            entry = self._alarms[alarm]
+
+        if after.date() < self.window_start:
+            # Before the window (the window never moves back): generate those days
+            self.stats['unindexed_queries'] += 1
+            for when in self._generate(alarm, after.date(), self.window_start):
+                if when >= after:
+                    return when
+
+        times = entry[1]
+        position = bisect_left(times, after)
+        if position < len(times):
+            return times[position]
+
+        # Nothing within the window: look further ahead day by day
+        self.stats['slow_searches'] += 1
+        start = max(after.date(), self.window_end - timedelta(days=1))
+        for when in self._generate(alarm, start, start + timedelta(days=self.search_days)):
+            if when >= after:
+                return when
+        return None
+
+    def between(self, start, end):
+        """(datetime, alarm) pairs for occurrences in [start, end), in time order"""
+        self._ensure_window(start.date())
+        index = self._index
+        first = bisect_left(index, (start, -1))
+        last = bisect_left(index, (end, -1))
+        entries = index[first:last]
+
+        # Days outside the window are not indexed: generate them
+        outside = []
+        if start.date() < self.window_start:
+            outside += self._generate_all(start.date(), min(end.date() + timedelta(days=1), self.window_start))
+        if end.date() >= self.window_end:
+            outside += self._generate_all(max(start.date(), self.window_end), end.date() + timedelta(days=1))
+        outside = [entry for entry in outside if start <= entry[0] < end]
+        if outside:
+            self.stats['unindexed_queries'] += 1
+            entries = sorted(entries + outside)
+        return [(when, self._by_id[alarm_id]) for when, alarm_id in entries]
+
+    def next_after(self, after):
+        """(datetime, alarm) of the earliest indexed occurrence at or after `after`"""
+        self._ensure_window(after.date())
+        if after.date() < self.window_start:
+            self.stats['unindexed_queries'] += 1
+            earlier = [entry for entry in self._generate_all(after.date(), self.window_start)
+                       if entry[0] >= after]
+            if earlier:
+                when, alarm_id = min(earlier)
+                return when, self._by_id[alarm_id]
+
+        position = bisect_left(self._index, (after, -1))
+        if position < len(self._index):
+            when, alarm_id = self._index[position]
+            return when, self._by_id[alarm_id]
+        return None
+
+    def _ensure_window(self, today):
+        """Advance the window so it starts at `today`; it never moves back"""
+        if self.window_start is None:
+            self.window_start = today
+            self.window_end = today + timedelta(days=self.horizon_days)
+            return
+        if today <= self.window_start:
+            return
+
+        # Drop occurrences before the new start
+        cutoff = datetime.combine(today, datetime.min.time())
+        del self._index[:bisect_left(self._index, (cutoff, -1))]
+        for alarm, (alarm_id, times) in self._alarms.items():
+            del times[:bisect_left(times, cutoff)]
+
+        # Generate only the days that just entered the window
+        new_start = max(self.window_end, today)
+        self.window_start = today
+        self.window_end = today + timedelta(days=self.horizon_days)
+        entries = []
+        for alarm, (alarm_id, times) in self._alarms.items():
+            for when in self._generate(alarm, new_start, self.window_end):
+                if not times or when > times[-1]:
+                    times.append(when)
+                else:
+                    insort(times, when)
+                entries.append((when, alarm_id))
+        self._insert(entries)
+
+    def _register(self, alarm):
+        """Generate an alarm's occurrences and return its new index entries"""
+        alarm_id = next(self._ids)
+        times = self._generate(alarm, self.window_start, self.window_end)
+        self._alarms[alarm] = (alarm_id, times)
+        self._by_id[alarm_id] = alarm
+        return [(when, alarm_id) for when in times]
+
+    def _insert(self, entries):
+        """Merge new entries into the sorted index"""
+        if len(entries) > self.BULK:
+            # Timsort finds the existing sorted run, so this is close to linear
+            self._index += entries
+            self._index.sort()
+        else:
+            for entry in entries:
+                insort(self._index, entry)
+
+    def _generate_all(self, start, end):
+        """Unindexed (datetime, id) entries of every alarm for dates in [start, end)"""
+        if start >= end:
+            return []
+        return [(when, alarm_id) for alarm, (alarm_id, times) in self._alarms.items()
+                for when in self._generate(alarm, start, end)]
+
+    def _generate(self, alarm, start, end):
+        """Local occurrence datetimes of an alarm for dates in [start, end)"""
+        rule = alarm.rule
+        zone = None
+        if rule and rule.tz:
+            zone = self._zones.get(rule.tz)
+            if zone is None:
+                zone = self._zones[rule.tz] = ZoneInfo(rule.tz)
+
+        times = []
+        day = start
+        while day < end:
+            if alarm.occurs_on(day, self.holidays):
+                when = datetime.combine(day, alarm.time)
+                if zone is not None:
+                    # Wall time in the rule's zone; times skipped by DST move forward
+                    when = when.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+                times.append(when)
+            day += timedelta(days=1)
+        self.stats['generated_days'] += (end - start).days
+        times.sort()
+        return times
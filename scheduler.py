@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import heapq
+import itertools
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from oneshot import OneShotStore
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+WAKE = 'wake'      # Start of the gradual wake-up window
+RING = 'ring'      # Alarm time
+SNOOZE = 'snooze'  # Snooze expiry
+TIMER = 'timer'    # One-shot timer ("alarm in N minutes")
+
+ONE_SHOT_KINDS = (SNOOZE, TIMER)
+
+AlarmEvent = namedtuple('AlarmEvent', ['fire_time', 'kind', 'alarm', 'alarm_time'])
+
+
+class AlarmScheduler:
+    """Priority queue of upcoming alarm events.
+
+    Events are kept in one heap per kind so the next ring time can be read
+    without scanning. Removed or rescheduled alarms are invalidated lazily:
+    their heap entries stay in place and are dropped when they reach the top,
+    or compacted away once they outnumber the live ones. Snoozes and timers
+    ring once and live in a separate OneShotStore, so settings syncs leave
+    them alone.
+    """
+
+    def __init__(self, gradual_wake_duration, recurrence=None, max_one_shots=32):
+        """Initialize the AlarmScheduler.
+
+        `recurrence` is an optional RecurrenceEngine that answers next
+        occurrence queries from its precomputed index.
+        """
+        self.gradual_wake_duration = gradual_wake_duration
+        self.recurrence = recurrence
+        self._heaps = {WAKE: [], RING: []}
+        self._entries = {}  # key -> (alarm, token)
+        self._counter = itertools.count()
+        self.one_shots = OneShotStore(max_one_shots)
+
+    def sync(self, alarms, now=None, force=False):
+        """Reschedule only the alarms that were added, removed or changed"""
+        now = now or datetime.now()
+        wanted = {}
+        for alarm in alarms:
+            if alarm.enabled:
+                wanted.setdefault(('alarm', alarm), alarm)
+
+        removed = [key for key in self._entries
+                   if key[0] == 'alarm' and (force or key not in wanted)]
+        for key in removed:
+            self.unschedule(key)
+
+        added = 0
+        for key, alarm in wanted.items():
+            if key not in self._entries:
+                self._schedule_occurrence(key, alarm, now)
+                added += 1
+
+        if removed or added:
+            self._maybe_compact()
+            logger.debug(f"Scheduler synced: {added} added, {len(removed)} removed")
+
+    def set_gradual_wake_duration(self, duration, alarms, now=None):
+        """Change the wake window and reschedule every recurring alarm"""
+        if duration != self.gradual_wake_duration:
+            self.gradual_wake_duration = duration
+            self.sync(alarms, now, force=True)
+
+    def schedule_snooze(self, alarm, fire_time):
+        """Schedule a one-shot snooze ring at an absolute time"""
+        return self.one_shots.add(AlarmEvent(fire_time, SNOOZE, alarm, fire_time))
+
+    def schedule_timer(self, alarm, fire_time):
+        """Schedule a one-shot timer ring at an absolute time"""
+        return self.one_shots.add(AlarmEvent(fire_time, TIMER, alarm, fire_time))
+
+    def unschedule(self, key):
+        """Forget an alarm or one-shot; its queued events become stale"""
+        if key[0] in ONE_SHOT_KINDS:
+            self.one_shots.remove(key)
+        else:
+            self._entries.pop(key, None)
+
+    def next_event(self, kind=None):
+        """Return the next pending AlarmEvent, optionally of one kind (one-shots ring)"""
+        events = []
+        if kind in (None, WAKE):
+            top = self._peek(WAKE)
+            if top:
+                events.append(top[-1])
+        if kind in (None, RING):
+            top = self._peek(RING)
+            if top:
+                events.append(top[-1])
+            one_shot = self.one_shots.peek()
+            if one_shot:
+                events.append(one_shot)
+        return min(events, key=lambda event: event.fire_time) if events else None
+
+    def seconds_until_next_event(self, now=None):
+        """Seconds until the next event fires, or None if nothing is queued"""
+        event = self.next_event()
+        if event is None:
+            return None
+        now = now or datetime.now()
+        return max(0.0, (event.fire_time - now).total_seconds())
+
+    def pop_due(self, now=None):
+        """Remove and return the earliest event that is due, or None"""
+        now = now or datetime.now()
+        event = self.next_event()
+        if event is None or event.fire_time > now:
+            return None
+
+        if event.kind in ONE_SHOT_KINDS:
+            return self.one_shots.pop()
+
+        key = heapq.heappop(self._heaps[event.kind])[2]
+        if event.kind == RING:
+            # Recurring alarm: queue the occurrence after this one
+            alarm, _ = self._entries[key]
+            self._schedule_occurrence(key, alarm, event.alarm_time + timedelta(seconds=1))
+
+        return event
+
+    def heap_size(self):
+        """Queued events of recurring alarms, stale ones included"""
+        return sum(len(heap) for heap in self._heaps.values())
+
+    def __len__(self):
+        return len(self._entries) + len(self.one_shots)
+
+    def _peek(self, kind):
+        """Return the top live heap entry of a kind, dropping stale ones"""
+        heap = self._heaps[kind]
+        while heap:
+            _, _, key, token, _ = heap[0]
+            entry = self._entries.get(key)
+            if entry and entry[1] == token:
+                return heap[0]
+            heapq.heappop(heap)
+        return None
+
+    def _maybe_compact(self):
+        """Drop stale heap entries once they outnumber the live ones"""
+        if self.heap_size() <= 4 * len(self._entries) + 64:
+            return
+        for kind, heap in self._heaps.items():
+            self._heaps[kind] = [
+                item for item in heap
+                if self._entries.get(item[2], (None, None))[1] == item[3]
+            ]
+            heapq.heapify(self._heaps[kind])
+
+    def _push(self, kind, fire_time, key, token, alarm, alarm_time):
+        event = AlarmEvent(fire_time, kind, alarm, alarm_time)
+        heapq.heappush(
+            self._heaps[kind],
+            (fire_time, next(self._counter), key, token, event)
+        )
+
+    def _schedule_occurrence(self, key, alarm, after):
+        """Queue wake and ring events for the next occurrence at or after `after`"""
+        token = next(self._counter)
+        self._entries[key] = (alarm, token)
+
+        alarm_time = self._next_occurrence(alarm, after)
+        if alarm_time is None:
+            return
+
+        if alarm.gradual_wake:
+            wake_start = alarm_time - self.gradual_wake_duration
+            self._push(WAKE, max(wake_start, after), key, token, alarm, alarm_time)
+        self._push(RING, alarm_time, key, token, alarm, alarm_time)
+
+    def _next_occurrence(self, alarm, after):
+        """Find the first alarm datetime at or after `after`"""
+        if self.recurrence is not None:
+            return self.recurrence.next_occurrence(alarm, after)
+        for offset in range(8):
+            day = after.date() + timedelta(days=offset)
+            if not alarm.on_day(day.weekday()):
+                continue
+            alarm_time = datetime.combine(day, alarm.time)
+            if alarm_time >= after:
+                return alarm_time
+        return None
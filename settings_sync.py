@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsSyncClient:
+    """Fetches alarm settings with connection reuse and HTTP revalidation"""
+
+    def __init__(self, url, connect_timeout=3.05, read_timeout=5, total_timeout=10,
+                 pool_size=2):
+        """Initialize the SettingsSyncClient"""
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout  # Hard cap on one fetch, body included
+
+        # Keep-alive session with a small connection pool
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Revalidation state
+        self.etag = None
+        self.last_modified = None
+        self.settings = None
+
+        self.registry = get_registry()
+        self.stats = {
+            'requests': 0,
+            'bytes_fetched': 0,
+            'not_modified': 0,
+            'errors': 0,
+            'parse_time': 0.0,
+            'last_fetch_time': 0.0,
+        }
+
+    def fetch(self):
+        """Fetch settings from the website.
+
+        Returns the decoded settings when they changed since the last call,
+        or None when the server answered 304 or the request failed.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        start = time.monotonic()
+        self.stats['requests'] += 1
+        outcome = 'error'
+        try:
+            response = self.session.get(
+                self.url, headers=headers, timeout=self.timeout, stream=True
+            )
+
+            with response:
+                if response.status_code == 304:
+                    self.stats['not_modified'] += 1
+                    outcome = 'not_modified'
+                    return None
+
+                response.raise_for_status()
+                body = self._read_body(response, start + self.total_timeout)
+            self.stats['bytes_fetched'] += len(body)
+
+            parse_start = time.monotonic()
+            settings = json.loads(body)
+            self.stats['parse_time'] += time.monotonic() - parse_start
+
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+            outcome = 'ok'
+
+            if settings == self.settings:
+                return None
+            self.settings = settings
+            return settings
+
+        except requests.exceptions.RequestException as e:
+            self.stats['errors'] += 1
+            logger.error(f"Failed to fetch website data: {str(e)}")
+        except ValueError as e:
+            self.stats['errors'] += 1
+            logger.error(f"Failed to parse website data: {str(e)}")
+        finally:
+            self.stats['last_fetch_time'] = time.monotonic() - start
+            self.registry.observe(
+                'smartalarm_http_request_seconds', self.stats['last_fetch_time'],
+                target='settings', outcome=outcome
+            )
+        return None
+
+    @staticmethod
+    def _read_body(response, deadline):
+        """Read the response body, giving up once the deadline passes"""
+        chunks = []
+        for chunk in response.iter_content(chunk_size=8192):
+            if time.monotonic() > deadline:
+                raise requests.exceptions.Timeout("Settings fetch exceeded its time budget")
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+
+class SettingsPushClient:
+    """Receives settings changes from the website over Server-Sent Events.
+
+    Each event is one settings version: a 'settings' event carries the full
+    document and a 'patch' event only the top-level keys changed since the
+    version named in its 'base'. The event id is the version. The stream
+    reconnects with jittered exponential backoff and resumes from the last
+    version seen via Last-Event-ID. Comment lines are heartbeats, and a
+    stream silent for `idle_timeout` seconds is treated as dead.
+
+    `on_settings` is called on the client's thread with each new version.
+    While `connected` is False the caller should fall back to polling.
+    """
+
+    def __init__(self, url, on_settings, idle_timeout=75, connect_timeout=3.05,
+                 min_backoff=1, max_backoff=300):
+        """Initialize the SettingsPushClient"""
+        self.url = url
+        self.on_settings = on_settings
+        self.timeout = (connect_timeout, idle_timeout)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(max_retries=0))
+        self.session.mount('https://', HTTPAdapter(max_retries=0))
+
+        self.version = None  # Id of the last applied event
+        self.settings = None
+        self.connected = False
+        self.supported = True  # Cleared when the server has no event stream
+        self._stop = threading.Event()
+        self._response = None
+        self._thread = None
+
+        self.registry = get_registry()
+        self.stats = {
+            'connects': 0,
+            'disconnects': 0,
+            'events': 0,
+            'heartbeats': 0,
+            'resyncs': 0,  # Patches that did not follow the last version
+            'bytes_received': 0,
+            'last_latency': None,  # Seconds from publication to receipt
+        }
+
+    def start(self):
+        """Connect and listen from a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="settings-push", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Disconnect and stop listening"""
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(2)
+        self.session.close()
+
+    def _run(self):
+        backoff = self.min_backoff
+        while not self._stop.is_set():
+            try:
+                if self._listen():
+                    backoff = self.min_backoff  # The stream worked; start the backoff over
+            except requests.exceptions.RequestException as e:
+                if not self._stop.is_set():
+                    logger.warning(f"Settings stream disconnected: {str(e)}")
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Bad settings event, reconnecting: {str(e)}")
+            except Exception as e:
+                # stop() closes the response under the reading thread
+                if not self._stop.is_set():
+                    logger.error(f"Settings stream failed: {str(e)}")
+            finally:
+                if self.connected:
+                    self.stats['disconnects'] += 1
+                self.connected = False
+                self._response = None
+
+            if not self.supported:
+                logger.warning("Website has no settings stream, polling only")
+                return
+            self._stop.wait(random.uniform(backoff / 2, backoff))
+            backoff = min(self.max_backoff, backoff * 2)
+
+    def _listen(self):
+        """Read one connection until it ends; returns whether it was established"""
+        headers = {'Accept': 'text/event-stream', 'Cache-Control': 'no-cache'}
+        if self.version is not None:
+            headers['Last-Event-ID'] = self.version
+
+        response = self.session.get(self.url, headers=headers, timeout=self.timeout, stream=True)
+        self._response = response
+        with response:
+            if response.status_code in (404, 405, 501):
+                self.supported = False
+                return False
+            response.raise_for_status()
+            if not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                self.supported = False
+                return False
+
+            self.connected = True
+            self.stats['connects'] += 1
+            logger.info(f"Settings stream connected (resuming after version {self.version})")
+
+            event, data, event_id = 'message', [], None
+            # chunk_size=None hands over each chunk as it arrives
+            for line in response.iter_lines(chunk_size=None):
+                if self._stop.is_set():
+                    break
+                self.stats['bytes_received'] += len(line) + 1
+                if not line:
+                    if data:
+                        self._dispatch(event, "\n".join(data), event_id)
+                    event, data, event_id = 'message', [], None
+                    continue
+
+                name, _, value = line.decode('utf-8').partition(':')
+                value = value[1:] if value.startswith(' ') else value
+                if not name:
+                    self.stats['heartbeats'] += 1
+                elif name == 'event':
+                    event = value
+                elif name == 'data':
+                    data.append(value)
+                elif name == 'id':
+                    event_id = value
+                elif name == 'retry' and value.isdigit():
+                    self.min_backoff = int(value) / 1000
+        return True
+
+    def _dispatch(self, event, data, event_id):
+        """Apply one settings event"""
+        if event not in ('settings', 'patch'):
+            return
+        payload = json.loads(data)
+        self.stats['events'] += 1
+
+        if event == 'patch':
+            if self.settings is None or payload.get('base') != self.version:
+                # Missed a version: reconnect without a resume point for a full document
+                self.stats['resyncs'] += 1
+                base, self.version = self.version, None
+                raise ValueError(f"patch on version {payload.get('base')}, have {base}")
+            settings = dict(self.settings)
+            settings.update(payload['settings'])
+        else:
+            settings = payload['settings']
+
+        published = payload.get('published')
+        if published is not None:
+            self.stats['last_latency'] = max(0.0, time.time() - published)
+            self.registry.observe('smartalarm_settings_propagation_seconds', self.stats['last_latency'])
+
+        self.settings = settings
+        self.version = event_id
+        try:
+            self.on_settings(settings)
+        except Exception as e:
+            logger.error(f"Failed to apply pushed settings: {str(e)}")
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+
+import calendar
+import os
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from hardware import HardwareController
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedPixels:
+    """In-memory stand-in for a neopixel.NeoPixel strip"""
+
+    # Approximate wire time of one WS2812 pixel (24 bits at 800 kHz)
+    PIXEL_WRITE_TIME = 0.00003
+
+    def __init__(self, pin, count, brightness=1.0, auto_write=True, emulate_timing=True):
+        """Initialize the simulated strip"""
+        self.pin = pin
+        self.count = count
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self.emulate_timing = emulate_timing
+        self._pixels = [(0, 0, 0)] * count
+        self.show_count = 0
+        self.shown = list(self._pixels)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self._pixels[index]
+
+    def __setitem__(self, index, color):
+        self._pixels[index] = tuple(color)
+        if self.auto_write:
+            self.show()
+
+    def fill(self, color):
+        self._pixels = [tuple(color)] * self.count
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        """Latch the buffer, taking as long as a real strip would"""
+        self.show_count += 1
+        self.shown = list(self._pixels)
+        if self.emulate_timing:
+            time.sleep(self.PIXEL_WRITE_TIME * self.count)
+
+
+class SimulatedRTC:
+    """Stand-in for adafruit_ds3231.DS3231 that follows the system clock in UTC"""
+
+    def __init__(self, i2c=None):
+        """Initialize the simulated RTC"""
+        self.offset = 0.0
+        self.read_count = 0
+
+    @property
+    def datetime(self):
+        self.read_count += 1
+        return time.gmtime(time.time() + self.offset)
+
+    @datetime.setter
+    def datetime(self, value):
+        self.offset = calendar.timegm(tuple(value)) - time.time()
+
+
+def use_offscreen_sdl():
+    """Point SDL at its dummy video and audio drivers (call before pygame.init)"""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+
+class SimulatedHardwareController(HardwareController):
+    """HardwareController running against in-memory pixels and RTC"""
+
+    def __init__(self, parallel=True, emulate_timing=True):
+        """Initialize simulated hardware"""
+        self.emulate_timing = emulate_timing
+        use_offscreen_sdl()
+        super().__init__(parallel)
+
+    def _init_gpio(self):
+        self.gpio = None
+
+    def _create_pixels(self):
+        return SimulatedPixels(
+            'D12', self.LED_COUNT, brightness=0.5, auto_write=False,
+            emulate_timing=self.emulate_timing
+        )
+
+    def _create_rtc(self):
+        return SimulatedRTC()
+
+
+def create_offscreen_display():
+    """Create a Display that renders into SDL's dummy video driver"""
+    use_offscreen_sdl()
+    from display import Display
+    return Display()
+
+
+class SimulatedSettingsServer:
+    """Local stand-in for the website's settings API.
+
+    GET /settings returns the full document with an ETag, for polling.
+    GET /stream is a Server-Sent Events stream of versioned changes in the
+    format SettingsPushClient expects, resuming from Last-Event-ID.
+    """
+
+    def __init__(self, settings, heartbeat=15, host="127.0.0.1", port=0):
+        """Initialize the simulated settings server"""
+        self.settings = dict(settings)
+        self.heartbeat = heartbeat
+        self.host = host
+        self.port = port
+        self.version = 0
+        self.history = []  # (version, changed keys, publish time), oldest first
+        self.bytes_sent = {'poll': 0, 'push': 0}
+        self._condition = threading.Condition()
+        self._generation = 0  # Bumped to make open streams hang up
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def publish(self, changes):
+        """Apply a settings change and push it to connected clients"""
+        with self._condition:
+            self.settings.update(changes)
+            self.version += 1
+            self.history.append((self.version, dict(changes), time.time()))
+            del self.history[:-100]
+            self._condition.notify_all()
+        return self.version
+
+    def drop_connections(self):
+        """Close every open stream, as a network blip would"""
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def start(self):
+        """Serve from a background thread"""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path == '/settings':
+                    self._send_settings()
+                elif self.path == '/stream':
+                    self._stream()
+                else:
+                    self.send_error(404)
+
+            def _send_settings(self):
+                with server._condition:
+                    etag = f'"{server.version}"'
+                    body = json.dumps(server.settings).encode()
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    body = b''
+                else:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    self.wfile.write(body)
+                server.bytes_sent['poll'] += len(body)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                last_id = self.headers.get('Last-Event-ID')
+                with server._condition:
+                    generation = server._generation
+                    first = server.history[0][0] if server.history else server.version + 1
+                    if last_id and last_id.isdigit() and first - 1 <= int(last_id) <= server.version:
+                        sent = int(last_id)  # Resume with the patches the client missed
+                    else:
+                        sent = server.version
+                        self._event('settings', sent, {'settings': server.settings})
+
+                try:
+                    while True:
+                        with server._condition:
+                            if sent == server.version and generation == server._generation:
+                                server._condition.wait(server.heartbeat)
+                            if generation != server._generation:
+                                break
+                            pending = [entry for entry in server.history if entry[0] > sent]
+                        if not pending:
+                            self._write(b": ping\n\n")
+                        for version, changes, published in pending:
+                            self._event('patch', version, {
+                                'base': str(sent), 'published': published, 'settings': changes
+                            })
+                            sent = version
+                    self.wfile.write(b"0\r\n\r\n")
+                except OSError:
+                    pass
+                self.close_connection = True
+
+            def _event(self, event, version, payload):
+                data = json.dumps(payload, separators=(',', ':'))
+                self._write(f"event: {event}\nid: {version}\ndata: {data}\n\n".encode())
+
+            def _write(self, chunk):
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+                server.bytes_sent['push'] += len(chunk)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="settings-server", daemon=True).start()
+
+    def stop(self):
+        """Stop serving and hang up open streams"""
+        self.drop_connections()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class SimulatedWeatherServer:
+    """Local stand-in for the OpenWeatherMap current weather and forecast API.
+
+    GET /weather and /forecast take `id` and `appid` like the real API and
+    answer with ETags, returning 304 to a matching If-None-Match. Requests
+    can be slowed down or made to fail to exercise coalescing and backoff.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0):
+        """Initialize the simulated weather server"""
+        self.host = host
+        self.port = port
+        self.delay = delay  # Seconds each request takes
+        self.failures = 0  # Upcoming requests to answer with 503
+        self.weather = {}  # city id -> (temperature, condition)
+        self.version = 0
+        self.requests = {}  # status code -> count
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def set_weather(self, city_id, temperature, condition="Clouds"):
+        """Change a city's weather, invalidating its ETags"""
+        with self._lock:
+            self.weather[str(city_id)] = (temperature, condition)
+            self.version += 1
+
+    def fail_next(self, count):
+        """Answer the next `count` requests with 503"""
+        with self._lock:
+            self.failures = count
+
+    def start(self):
+        """Serve from a background thread"""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path, _, query = self.path.partition('?')
+                params = dict(parse_qsl(query))
+                time.sleep(server.delay)
+                with server._lock:
+                    failing = server.failures > 0
+                    if failing:
+                        server.failures -= 1
+                    temperature, condition = server.weather.get(params.get('id'), (15, "Clear"))
+                    etag = f'"{params.get("id")}-{server.version}"'
+                if path not in ('/weather', '/forecast'):
+                    self._send(404, b'')
+                elif not params.get('appid'):
+                    self._send(401, b'')
+                elif failing:
+                    self._send(503, b'')
+                elif self.headers.get('If-None-Match') == etag:
+                    self._send(304, b'', etag)
+                else:
+                    payload = server._current(temperature, condition) if path == '/weather' \
+                        else server._forecast(temperature, condition)
+                    self._send(200, json.dumps(payload).encode(), etag)
+
+            def _send(self, status, body, etag=None):
+                self.send_response(status)
+                if etag:
+                    self.send_header('ETag', etag)
+                if status != 304:
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.requests[status] = server.requests.get(status, 0) + 1
+                    server.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="weather-server", daemon=True).start()
+
+    def stop(self):
+        """Stop serving"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @staticmethod
+    def _current(temperature, condition):
+        return {
+            'main': {'temp': temperature, 'humidity': 60},
+            'weather': [{'main': condition, 'description': condition.lower(), 'icon': '03d'}],
+            'wind': {'speed': 3.1},
+        }
+
+    @staticmethod
+    def _forecast(temperature, condition):
+        """Five days in 3 hour steps, warmest mid-afternoon"""
+        start = int(time.time()) // 10800 * 10800
+        items = []
+        for step in range(40):
+            hour = (step * 3) % 24
+            items.append({
+                'dt': start + step * 10800,
+                'main': {'temp': temperature + (4 if 12 <= hour <= 15 else -2)},
+                'weather': [{'main': condition, 'icon': '03d'}],
+                'pop': 0.1 * (step % 5),
+            })
+        return {'list': items}
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""Replay alarm scenarios against a virtual clock.
+
+A scenario is a JSON object:
+
+    {
+      "start": "2026-03-02T00:00:00",
+      "days": 14,
+      "settings": {...website settings...},
+      "responder": {"delay": 45, "snoozes": 1},
+      "events": [
+        {"at": "2026-03-04T22:00:00", "settings": {...}},
+        {"at": 172800, "outage": 7200},
+        {"at": "2026-03-05T06:59:00", "dismiss": true},
+        {"at": "2026-03-06T13:30:00", "timer": 20}
+      ]
+    }
+
+"at" is an ISO time or seconds after "start"; "timer" sets a one-shot
+alarm that many minutes ahead. The responder answers every
+ring after "delay" seconds, snoozing up to "snoozes" times before
+dismissing; without one, rings run until the ring timeout.
+
+The replay fails (exit status 1) if an occurrence never rang, a ring came
+from nowhere (e.g. a snooze outliving its dismissal) or the alarm task
+would have busy-looped.
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from alarm import AlarmManager
+from backends import NullDisplay, NullHardwareController
+from lifecycle import AlarmLifecycle, IDLE, RINGING, SNOOZED
+from scheduler import RING
+
+logger = logging.getLogger(__name__)
+
+# One recorded output: virtual time, source ('led', 'audio', 'display',
+# 'settings' or 'alarm'), action and details
+TimelineEvent = namedtuple('TimelineEvent', ['at', 'source', 'action', 'details'])
+
+
+class VirtualClock:
+    """Stand-in for ClockService whose time only moves when advanced"""
+
+    def __init__(self, start, sync_interval=timedelta(hours=1)):
+        """Initialize the VirtualClock"""
+        self.current = start
+        self.sync_interval = sync_interval
+        self.tick_time = None
+        self.stats = {
+            'i2c_reads': 0,
+            'syncs': 0,
+            'ticks': 0,
+            'source': 'virtual',
+            'drift_ppm': 0.0,
+            'last_correction': None,
+            'rtc_writes': 0,
+        }
+
+    def now(self):
+        return self.current
+
+    def tick(self):
+        self.tick_time = self.current
+        self.stats['ticks'] += 1
+        return self.tick_time
+
+    def needs_sync(self):
+        return False
+
+    def sync(self, align=True):
+        return True
+
+    def advance_to(self, when):
+        """Move time forward to `when` (never backwards)"""
+        self.current = max(self.current, when)
+
+
+class RecordingHardware(NullHardwareController):
+    """Null hardware that logs every LED and audio output to a timeline"""
+
+    def __init__(self, clock, timeline, **kwargs):
+        """Initialize the recording hardware"""
+        super().__init__(**kwargs)
+        self.clock = clock
+        self.timeline = timeline
+
+    def _record(self, source, action, **details):
+        self.timeline.append(TimelineEvent(self.clock.now(), source, action, details))
+
+    def set_led_brightness(self, brightness_level, transition_time=0):
+        self._record('led', 'brightness', level=brightness_level)
+
+    def set_led_color(self, r, g, b, transition_time=0):
+        self._record('led', 'color', rgb=(r, g, b))
+
+    def start_wake_profile(self, profile, elapsed=0):
+        self._record('led', 'wake_profile', profile=profile.name, elapsed=round(elapsed, 3))
+
+    def play_sound(self, sound_file, loop=False, crescendo=0):
+        self._record('audio', 'play', sound=sound_file, loop=loop, crescendo=crescendo)
+
+    def stop_sound(self, fade_out=0):
+        self._record('audio', 'stop')
+
+
+class RecordingDisplay(NullDisplay):
+    """Null display that logs a frame whenever the next alarm it shows changes"""
+
+    def __init__(self, timeline, **kwargs):
+        """Initialize the recording display"""
+        super().__init__(**kwargs)
+        self.timeline = timeline
+        self.shown = None
+
+    def prepare(self, time=None, weather=None, next_alarm=None):
+        super().prepare(time, weather, next_alarm)
+        shown = next_alarm.alarm_time if next_alarm else None
+        if shown != self.shown:
+            self.shown = shown
+            self.timeline.append(TimelineEvent(
+                time, 'display', 'next_alarm', {'alarm_time': shown.isoformat() if shown else None}
+            ))
+
+
+class Simulation:
+    """Drives an AlarmManager through a scenario in virtual time.
+
+    The loop mirrors the main loop's alarm task: it jumps straight to the
+    next moment anything can happen (the delay the alarm task would sleep,
+    from AlarmManager.seconds_until_next_event, a scenario event, a
+    response, a ring timeout or a settings poll) and checks alarms there,
+    so weeks of activity replay in seconds with the same decisions the
+    device would make.
+    """
+
+    def __init__(self, scenario, poll_interval=60, wake_latency=0.0):
+        """Initialize the Simulation.
+
+        `poll_interval` is how often settings are fetched (0 models push
+        delivery); `wake_latency` is added to every alarm check to model
+        a loaded event loop.
+        """
+        self.start = datetime.fromisoformat(scenario['start'])
+        self.end = self.start + timedelta(days=scenario.get('days', 7))
+        self.poll_interval = poll_interval
+        self.wake_latency = timedelta(seconds=wake_latency)
+        self.responder = scenario.get('responder')
+
+        self.timeline = []
+        self.clock = VirtualClock(self.start)
+        self.hardware = RecordingHardware(self.clock, self.timeline)
+        self.display = RecordingDisplay(self.timeline)
+        # Transitions are drained every step, so the default history bound is plenty
+        lifecycle = AlarmLifecycle(self.hardware, now=self.clock.now, watch=False)
+        self.manager = AlarmManager(self.hardware, self.clock, lifecycle=lifecycle)
+
+        # Heap of (time, index, event); the index keeps ties in scenario order
+        self.events = [
+            (self._time(event['at']), index, event) for index, event in enumerate(scenario.get('events', []))
+        ]
+        if scenario.get('settings'):
+            self.events.append((self.start, -1, {'settings': scenario['settings']}))
+        heapq.heapify(self.events)
+
+        self.pending_settings = []  # (published time, settings) waiting for the network
+        self.outage_until = self.start
+        self.response = None  # (time, action) the responder will take
+        self.snoozes = 0  # Snoozes of the current alarm so far
+
+        self.expected = set()  # (occurrence datetime, alarm) for every occurrence that should ring
+        self.fired = set()  # (scheduled time, alarm) of rings that did ring
+        self.timers = set()  # Fire times of the timers the scenario set
+        self.fresh_rings = []  # (scheduled time, alarm) of rings that were not resumed snoozes
+        self.lateness = []
+        self.settings_delays = []
+        self.stats = {
+            'steps': 0,
+            'rings': 0,
+            'snoozes': 0,
+            'dismissals': 0,
+            'timeouts': 0,
+            'settings_applied': 0,
+            'spins': 0,  # Steps where the alarm task would have re-checked at once, forever
+        }
+
+    def run(self):
+        """Replay the whole scenario; returns the report"""
+        started = time.perf_counter()
+        now = self.start
+        while now < self.end:
+            self.clock.advance_to(now)
+            self._apply_events(now)
+            self._apply_response(now)
+            self.manager.lifecycle.check_timeout()
+            self.manager.check_alarms()
+            self._collect_transitions()
+            self.display.update(time=now, next_alarm=self.manager.next_event(RING))
+            self.stats['steps'] += 1
+
+            later = self._next_step(now)
+            self.expected.update(self.manager.occurrences_between(now, later))
+            now = later
+
+        self.manager.cleanup()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, wall_time):
+        """Timeline and statistics of the replay"""
+        missed = sorted(when for when, alarm in self.expected - self.fired)
+        # Rings from idle that were neither an occurrence nor a timer, e.g. a snooze outliving its dismissal
+        stray = sorted(when for when, alarm in self.fresh_rings
+                       if (when, alarm) not in self.expected and when not in self.timers)
+        ordered = sorted(self.lateness)
+        return {
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'wall_time': wall_time,
+            'speedup': (self.end - self.start).total_seconds() / wall_time if wall_time else None,
+            'stats': dict(self.stats, expected=len(self.expected), missed=len(missed), stray_rings=len(stray)),
+            'passed': not missed and not stray and not self.stats['spins'],
+            'missed': [when.isoformat() for when in missed],
+            'stray_rings': [when.isoformat() for when in stray],
+            'lateness': {
+                'max_s': ordered[-1],
+                'mean_s': sum(ordered) / len(ordered),
+                'p95_s': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            } if ordered else None,
+            'settings_delay_max_s': max(self.settings_delays, default=None),
+            'timeline': [
+                {'at': event.at.isoformat(), 'source': event.source, 'action': event.action, **event.details}
+                for event in self.timeline
+            ],
+        }
+
+    def _time(self, value):
+        if isinstance(value, (int, float)):
+            return self.start + timedelta(seconds=value)
+        return datetime.fromisoformat(value)
+
+    def _next_step(self, now):
+        """The next moment anything can happen"""
+        candidates = [self.end, now + timedelta(days=1)]
+        if self.events:
+            candidates.append(self.events[0][0])
+        if self.response:
+            candidates.append(self.response[0])
+        if self.manager.lifecycle.ring_deadline:
+            candidates.append(self.manager.lifecycle.ring_deadline)
+        # The same sleep the main loop's alarm task computes after check_alarms()
+        delay = self.manager.seconds_until_next_event(now)
+        if delay == 0:
+            self.stats['spins'] += 1  # The device would spin; step on to find out how long
+        elif delay is not None:
+            candidates.append(now + timedelta(seconds=delay) + self.wake_latency)
+        if self.pending_settings:
+            candidates.append(self._next_delivery(now))
+        return max(min(candidates), now + timedelta(microseconds=1))
+
+    def _next_delivery(self, now):
+        """When pending settings next reach the device"""
+        available = max(now, self.outage_until)
+        if not self.poll_interval:
+            return available
+        since_start = (available - self.start).total_seconds()
+        polls = -(-since_start // self.poll_interval)  # Round up to the next poll
+        return self.start + timedelta(seconds=polls * self.poll_interval)
+
+    def _apply_events(self, now):
+        while self.events and self.events[0][0] <= now:
+            when, _, event = heapq.heappop(self.events)
+            if 'settings' in event:
+                self.pending_settings.append((when, event['settings']))
+                self.timeline.append(TimelineEvent(when, 'settings', 'published', {}))
+            if 'outage' in event:
+                self.outage_until = max(self.outage_until, when + timedelta(seconds=event['outage']))
+                self.timeline.append(TimelineEvent(
+                    when, 'settings', 'outage', {'until': self.outage_until.isoformat()}
+                ))
+            if 'timer' in event:
+                self.timers.add(self.manager.add_timer(event['timer']))
+            if event.get('snooze'):
+                self.manager.snooze()
+            if event.get('dismiss'):
+                self.manager.stop_alarm()
+
+        if self.pending_settings and now >= self.outage_until and \
+                (not self.poll_interval or now >= self._next_delivery(now)):
+            for published, settings in self.pending_settings:
+                self.manager.update_settings(settings, persist=False)
+                self.settings_delays.append((now - published).total_seconds())
+                self.stats['settings_applied'] += 1
+                self.timeline.append(TimelineEvent(now, 'settings', 'applied', {}))
+            self.pending_settings = []
+
+    def _apply_response(self, now):
+        if self.response and self.response[0] <= now:
+            _, action = self.response
+            self.response = None
+            if action == 'snooze':
+                self.manager.snooze()
+            else:
+                self.manager.stop_alarm()
+
+    def _collect_transitions(self):
+        """Turn new lifecycle transitions into statistics and responses"""
+        transitions = self.manager.lifecycle.transitions
+        while transitions:
+            record = transitions.popleft()
+            self.timeline.append(TimelineEvent(
+                record['at'], 'alarm', record['state'],
+                {'scheduled': record['scheduled'].isoformat() if record['scheduled'] else None,
+                 'reason': record['reason']}
+            ))
+            state = record['state']
+            if state == RINGING:
+                self.stats['rings'] += 1
+                self.lateness.append(record['lateness'])
+                self.fired.add((record['scheduled'], record['alarm']))
+                if record['previous'] == IDLE:
+                    self.fresh_rings.append((record['scheduled'], record['alarm']))
+                if record['previous'] != SNOOZED:
+                    self.snoozes = 0
+                if self.responder:
+                    action = 'snooze' if self.snoozes < self.responder.get('snoozes', 0) else 'dismiss'
+                    self.response = (
+                        record['at'] + timedelta(seconds=self.responder.get('delay', 30)), action
+                    )
+            elif state == SNOOZED:
+                self.stats['snoozes'] += 1
+                self.snoozes += 1
+            elif state == 'dismissed':
+                self.stats['dismissals'] += 1
+                if record['reason'] == 'timeout':
+                    self.stats['timeouts'] += 1
+
+
+def example_scenario(start="2026-03-02T00:00:00", days=14):
+    """Two weeks of weekday and weekend alarms, an edit, an outage and a snoozing sleeper"""
+    return {
+        'start': start,
+        'days': days,
+        'settings': {
+            'gradual_wake_duration': 20,
+            'snooze_duration': 9,
+            'alarms': [
+                {'time': '06:45', 'days': [0, 1, 2, 3, 4], 'gradual_wake': True},
+                {'time': '09:00', 'days': [5, 6], 'gradual_wake': False},
+            ],
+        },
+        'responder': {'delay': 40, 'snoozes': 1},
+        'events': [
+            # Mid-week the weekday alarm moves earlier, during a two hour outage
+            {'at': 2 * 86400 + 21 * 3600, 'outage': 7200},
+            {'at': 2 * 86400 + 21 * 3600 + 600, 'settings': {'alarms': [
+                {'time': '06:15', 'days': [0, 1, 2, 3, 4], 'gradual_wake': True},
+                {'time': '09:00', 'days': [5, 6], 'gradual_wake': False},
+            ]}},
+        ],
+    }
+
+
+def overlap_scenario(start="2026-03-02T00:00:00", days=7):
+    """Alarms that collide: two in the same minute, and a gradual wake that starts mid-ring.
+
+    The sleeper takes seven minutes to answer, so the second 07:00 alarm and
+    the 07:25 alarm's wake come due while the first one rings, and the
+    second alarm rings while the first is snoozed.
+    """
+    return {
+        'start': start,
+        'days': days,
+        'settings': {
+            'gradual_wake_duration': 20,
+            'snooze_duration': 9,
+            'alarms': [
+                {'time': '07:00', 'days': [0, 1, 2, 3, 4, 5, 6], 'gradual_wake': False},
+                {'time': '07:00', 'days': [0, 1, 2, 3, 4], 'gradual_wake': False},
+                {'time': '07:25', 'days': [0, 1, 2, 3, 4, 5, 6], 'gradual_wake': True},
+            ],
+        },
+        'responder': {'delay': 420, 'snoozes': 1},
+    }
+
+
+SCENARIOS = {
+    'example': example_scenario,
+    'overlap': overlap_scenario,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay an alarm scenario in virtual time")
+    parser.add_argument('scenario', nargs='?', default='example',
+                        help=f"scenario JSON file or built-in scenario ({', '.join(SCENARIOS)})")
+    parser.add_argument('--poll-interval', type=float, default=60,
+                        help="seconds between settings polls, 0 for push delivery")
+    parser.add_argument('--wake-latency', type=float, default=0.0,
+                        help="seconds added to every alarm check")
+    parser.add_argument('--output', help="write the full report (with timeline) to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.scenario in SCENARIOS:
+        scenario = SCENARIOS[args.scenario]()
+    else:
+        with open(args.scenario) as f:
+            scenario = json.load(f)
+
+    report = Simulation(scenario, args.poll_interval, args.wake_latency).run()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    summary = {key: value for key, value in report.items() if key != 'timeline'}
+    summary['timeline_events'] = len(report['timeline'])
+    print(json.dumps(summary, indent=2))
+    return 0 if report['passed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
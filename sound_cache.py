@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import pygame
+
+logger = logging.getLogger(__name__)
+
+
+class SoundCache:
+    """Decoded alarm sounds kept in memory, evicted least recently used first"""
+
+    def __init__(self, sounds_dir="sounds", max_bytes=96 * 1024 * 1024):
+        """Initialize the SoundCache"""
+        self.sounds_dir = sounds_dir
+        self.max_bytes = max_bytes
+        self._sounds = OrderedDict()  # path -> (pygame.mixer.Sound, decoded bytes)
+        self._loading = {}  # path -> threading.Event for in-flight decodes
+        self._lock = threading.Lock()
+        self.cached_bytes = 0
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'decode_time': 0.0,
+            'last_start_latency': None,
+        }
+
+    def preload(self, path):
+        """Decode a sound into memory now, if it is not already cached"""
+        with self._lock:
+            if path in self._sounds:
+                self._sounds.move_to_end(path)
+                return self._sounds[path][0]
+            loading = self._loading.get(path)
+            if loading is None:
+                loading = self._loading[path] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            # Another thread is already decoding this file
+            loading.wait()
+            with self._lock:
+                entry = self._sounds.get(path)
+            return entry[0] if entry else None
+
+        try:
+            start = time.perf_counter()
+            sound = pygame.mixer.Sound(path)
+            self.stats['decode_time'] += time.perf_counter() - start
+            size = self._decoded_size(sound)
+
+            with self._lock:
+                self._sounds[path] = (sound, size)
+                self.cached_bytes += size
+                self._evict(keep=path)
+            logger.info(f"Preloaded {path} ({size // 1024} KiB decoded)")
+            return sound
+        except Exception as e:
+            logger.error(f"Failed to preload sound {path}: {str(e)}")
+            return None
+        finally:
+            with self._lock:
+                self._loading.pop(path, None)
+            loading.set()
+
+    def preload_async(self, path):
+        """Decode a sound in the background"""
+        threading.Thread(target=self.preload, args=(path,), daemon=True).start()
+
+    def get(self, path):
+        """Get a decoded sound, decoding it on a miss"""
+        with self._lock:
+            entry = self._sounds.get(path)
+            if entry:
+                self._sounds.move_to_end(path)
+                self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+        return self.preload(path)
+
+    def play(self, path, loop=False, volume=None):
+        """Start a sound from memory, returning its channel"""
+        start = time.perf_counter()
+        sound = self.get(path)
+        if sound is None:
+            return None
+        channel = sound.play(loops=-1 if loop else 0)
+        if channel and volume is not None:
+            channel.set_volume(volume)
+        self.stats['last_start_latency'] = time.perf_counter() - start
+        logger.debug(f"Started {path} in {self.stats['last_start_latency'] * 1000:.1f} ms")
+        return channel
+
+    def clear(self):
+        """Drop every decoded sound"""
+        with self._lock:
+            self._sounds.clear()
+            self.cached_bytes = 0
+
+    def _evict(self, keep):
+        """Drop least recently used sounds until under the memory cap"""
+        while self.cached_bytes > self.max_bytes and len(self._sounds) > 1:
+            path = next(iter(self._sounds))
+            if path == keep:
+                self._sounds.move_to_end(path)
+                continue
+            _, size = self._sounds.pop(path)
+            self.cached_bytes -= size
+            self.stats['evictions'] += 1
+            logger.info(f"Evicted {path} from sound cache")
+
+    @staticmethod
+    def _decoded_size(sound):
+        """Estimate the PCM size of a decoded sound"""
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        return int(sound.get_length() * frequency * channels * abs(sample_format) // 8)
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import pygame
+
+try:
+    import numpy as np
+    import pygame.sndarray
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SOUND_EXTENSIONS = ('.mp3', '.ogg', '.wav')
+INDEX_VERSION = 1
+
+# One indexed sound file. `peak` and `loudness` are in dBFS and None until the
+# file has been analyzed (or when NumPy is missing); `duration` is in seconds.
+SoundInfo = namedtuple('SoundInfo', [
+    'name', 'path', 'size', 'mtime', 'digest', 'duration', 'sample_rate', 'channels', 'peak', 'loudness'
+])
+
+ANALYSIS_FIELDS = ('duration', 'sample_rate', 'channels', 'peak', 'loudness')
+
+# MPEG audio sample rates by version bits, then rate index
+MP3_SAMPLE_RATES = {
+    0b11: (44100, 48000, 32000),  # MPEG 1
+    0b10: (22050, 24000, 16000),  # MPEG 2
+    0b00: (11025, 12000, 8000),  # MPEG 2.5
+}
+
+
+class SoundLibrary:
+    """Catalogue of the sounds directory with per-file loudness metadata.
+
+    The catalogue is read from an on-disk index and a directory listing, so
+    it is available at startup without decoding anything. refresh() decodes
+    only files whose size or mtime changed and whose content hash is not
+    already indexed, then rewrites the index. Playback gains bring every
+    sound to the same gated RMS loudness without pushing peaks into clipping.
+    """
+
+    def __init__(self, sounds_dir="sounds", index_file=os.path.join("data", "sound_index.json"),
+                 target_loudness=-20.0, headroom=-1.0, max_gain=2.0):
+        """Initialize the SoundLibrary"""
+        self.sounds_dir = sounds_dir
+        self.index_file = index_file
+        self.target_loudness = target_loudness  # dBFS every sound is brought to
+        self.headroom = headroom  # dBFS the loudest sample may reach after gain
+        self.max_gain = max_gain
+
+        self._lock = threading.Lock()
+        self._entries = {}  # normalized path -> SoundInfo
+        self._indexed = {}  # content digest -> analysis values from the index file
+        self.generation = 0  # Bumped whenever the set of files changes
+
+        self.stats = {
+            'analyzed': 0,
+            'reused': 0,  # Changed files recognised by their content hash
+            'analysis_time': 0.0,
+            'load_time': None,
+        }
+
+        self.load()
+
+    def load(self):
+        """Build the catalogue from the index file and a directory listing"""
+        start = time.perf_counter()
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION:
+                index = {}
+        except FileNotFoundError:
+            index = {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read sound index: {str(e)}")
+            index = {}
+
+        known = index.get('sounds', {})
+        indexed = {
+            record['digest']: [record.get(field) for field in ANALYSIS_FIELDS] for record in known.values()
+        }
+        entries = {}
+        for name, size, mtime in self._scan():
+            record = known.get(name)
+            if record and record['size'] == size and record['mtime'] == mtime:
+                info = SoundInfo(name, self._path(name), size, mtime, record['digest'],
+                                 *(record.get(field) for field in ANALYSIS_FIELDS))
+            else:
+                # Listed right away; refresh() fills in the analysis
+                info = SoundInfo(name, self._path(name), size, mtime, None, *([None] * 5))
+            entries[info.path] = info
+
+        with self._lock:
+            if entries.keys() != self._entries.keys():
+                self.generation += 1
+            self._entries = entries
+            self._indexed = indexed
+        self.stats['load_time'] = time.perf_counter() - start
+        logger.info(f"Sound library lists {len(entries)} sounds ({self.pending()} to analyze)")
+
+    def refresh(self):
+        """Rescan the directory and analyze new or changed files"""
+        self.load()
+        with self._lock:
+            indexed = dict(self._indexed)
+            pending = [info for info in self._entries.values() if info.digest is None]
+
+        for info in pending:
+            try:
+                digest = _file_digest(info.path)
+                analysis = indexed.get(digest)
+                if analysis is not None:
+                    # Same content under a new name or mtime
+                    self.stats['reused'] += 1
+                else:
+                    analysis = indexed[digest] = self._analyze(info.path)
+                updated = info._replace(digest=digest, **dict(zip(ANALYSIS_FIELDS, analysis)))
+            except Exception as e:
+                logger.error(f"Failed to analyze sound {info.path}: {str(e)}")
+                continue
+            with self._lock:
+                if info.path in self._entries:
+                    self._entries[info.path] = updated
+
+        if pending:
+            self.save()
+
+    def refresh_async(self):
+        """Refresh in the background"""
+        threading.Thread(target=self.refresh, name="sound-library", daemon=True).start()
+
+    def save(self):
+        """Write the index atomically"""
+        with self._lock:
+            sounds = {
+                info.name: {field: getattr(info, field) for field in SoundInfo._fields[2:]}
+                for info in self._entries.values() if info.digest is not None
+            }
+        try:
+            os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+            tmp_file = f"{self.index_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'sounds': sounds}, f, indent=1)
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            logger.error(f"Failed to write sound index: {str(e)}")
+
+    def catalogue(self):
+        """Every listed sound, by name"""
+        with self._lock:
+            return sorted(self._entries.values())
+
+    def get(self, path):
+        """SoundInfo for a sound path, or None if it is not in the library"""
+        return self._entries.get(os.path.normpath(path))
+
+    def exists(self, path):
+        """Check whether a sound path is in the library"""
+        return os.path.normpath(path) in self._entries
+
+    def default_sound(self, preferred):
+        """`preferred` if it is in the library, else the first listed sound"""
+        if self.exists(preferred) or not self._entries:
+            return os.path.normpath(preferred)
+        return min(self._entries)
+
+    def pending(self):
+        """Number of listed sounds not analyzed yet"""
+        return sum(1 for info in self._entries.values() if info.digest is None)
+
+    def gain(self, path):
+        """Linear playback gain that normalizes a sound's loudness (1.0 if unknown)"""
+        info = self.get(path)
+        if info is None or info.loudness is None:
+            return 1.0
+        gain_db = min(self.target_loudness - info.loudness, self.headroom - info.peak)
+        return min(self.max_gain, 10 ** (gain_db / 20))
+
+    def _scan(self):
+        """(name, size, mtime) of every sound file in the directory"""
+        try:
+            with os.scandir(self.sounds_dir) as entries:
+                files = []
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(SOUND_EXTENSIONS):
+                        stat = entry.stat()
+                        files.append((entry.name, stat.st_size, stat.st_mtime))
+                return files
+        except OSError as e:
+            logger.error(f"Failed to scan sounds directory: {str(e)}")
+            return []
+
+    def _path(self, name):
+        return os.path.normpath(os.path.join(self.sounds_dir, name))
+
+    def _analyze(self, path):
+        """Decode a file and measure it; returns values for ANALYSIS_FIELDS"""
+        start = time.perf_counter()
+        sound = pygame.mixer.Sound(path)
+        duration = sound.get_length()
+        channels = pygame.mixer.get_init()[2]
+        peak = loudness = None
+        if np is not None:
+            samples = pygame.sndarray.array(sound).astype(np.float32) / 32768
+            peak, loudness = _measure(samples.reshape(len(samples), -1), pygame.mixer.get_init()[0])
+        sample_rate, file_channels = _probe_format(path)
+
+        self.stats['analyzed'] += 1
+        self.stats['analysis_time'] += time.perf_counter() - start
+        logger.info(f"Analyzed {path}: {duration:.1f} s, peak {peak} dBFS, loudness {loudness} dBFS")
+        return duration, sample_rate, file_channels or channels, peak, loudness
+
+
+def _measure(samples, sample_rate):
+    """Peak and gated RMS loudness (dBFS) of float samples shaped (frames, channels).
+
+    Loudness follows the ITU-R BS.1770 gating: 400 ms blocks overlapping by
+    75%, an absolute gate at -70 and a relative gate 10 dB below the mean.
+    Samples are not K-weighted, so the result is close to, not equal to, LUFS.
+    """
+    peak = float(np.abs(samples).max()) if len(samples) else 0.0
+
+    step = sample_rate // 10  # 100 ms
+    steps = len(samples) // step
+    if steps < 4:
+        power = np.array([float(np.mean(samples ** 2)) * samples.shape[1]]) if len(samples) else np.zeros(1)
+    else:
+        # Channel powers summed, per 100 ms step, then averaged over 4 steps
+        squares = (samples[:steps * step] ** 2).reshape(steps, step, -1).mean(axis=1).sum(axis=1)
+        power = np.convolve(squares, np.full(4, 0.25), mode='valid')
+
+    gated = power[power > 10 ** (-70 / 10)]
+    if len(gated):
+        gated = gated[gated > gated.mean() * 10 ** (-10 / 10)]
+    loudness = 10 * math.log10(gated.mean()) if len(gated) else -70.0
+    return round(_to_db(peak), 2), round(loudness, 2)
+
+
+def _to_db(amplitude):
+    return 20 * math.log10(amplitude) if amplitude > 0 else -120.0
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _probe_format(path):
+    """(sample rate, channels) from a file's header, or (None, None)"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(64 * 1024)
+    except OSError:
+        return None, None
+
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        position = head.find(b'fmt ')
+        if position >= 0:
+            channels, rate = struct.unpack_from('<HI', head, position + 10)
+            return rate, channels
+    elif head[:4] == b'OggS':
+        position = head.find(b'\x01vorbis')
+        if position >= 0:
+            channels, rate = struct.unpack_from('<BI', head, position + 11)
+            return rate, channels
+    else:
+        start = 0
+        if head[:3] == b'ID3':
+            # Skip the ID3v2 tag (size is four 7-bit bytes)
+            size = head[6] << 21 | head[7] << 14 | head[8] << 7 | head[9]
+            start = 10 + size
+            if start + 4 > len(head):
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    head, start = f.read(64 * 1024), 0
+        for position in range(start, len(head) - 3):
+            if head[position] == 0xFF and head[position + 1] & 0xE0 == 0xE0:
+                version = head[position + 1] >> 3 & 0b11
+                rate_index = head[position + 2] >> 2 & 0b11
+                if version in MP3_SAMPLE_RATES and rate_index < 3:
+                    channels = 1 if head[position + 3] >> 6 == 0b11 else 2
+                    return MP3_SAMPLE_RATES[version][rate_index], channels
+    return None, None
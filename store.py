@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Settings keys that describe the alarm schedule
+SETTINGS_KEYS = ('alarms', 'snooze_duration', 'gradual_wake_duration', 'wake_profiles', 'holidays')
+
+
+class AlarmStore:
+    """On-disk copy of the alarm schedule: a snapshot plus an append-only journal.
+
+    Settings updates, snoozes, timers and dismissals are appended to the
+    journal as JSON lines and flushed to disk. The journal is folded into a
+    new snapshot once it grows past a limit, and on close. Restoring reads the
+    snapshot and replays the journal, ignoring a torn final line.
+    """
+
+    def __init__(self, directory="data", max_journal_records=200, max_journal_bytes=256 * 1024):
+        """Initialize the AlarmStore"""
+        self.snapshot_file = os.path.join(directory, "alarm_snapshot.json")
+        self.journal_file = os.path.join(directory, "alarm_journal.log")
+        self.max_journal_records = max_journal_records
+        self.max_journal_bytes = max_journal_bytes
+
+        self._lock = threading.Lock()
+        self._journal = None
+        self.journal_records = 0
+        self.settings = {}  # Latest value of each schedule setting
+        self.snooze = None  # {'alarm': entry, 'fire_time': ISO time} while a snooze is pending
+        self.timers = {}  # ISO fire time -> alarm entry for each pending timer
+
+        self.stats = {
+            'appends': 0,
+            'compactions': 0,
+            'replayed': 0,
+            'restore_time': None,
+        }
+
+    def load(self):
+        """Read the snapshot and replay the journal; returns (settings, snooze).
+
+        Pending timers are left in `timers`.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            try:
+                with open(self.snapshot_file) as f:
+                    snapshot = json.load(f)
+                self.settings = snapshot.get('settings', {})
+                self.snooze = snapshot.get('snooze')
+                self.timers = snapshot.get('timers', {})
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read alarm snapshot: {str(e)}")
+
+            self.journal_records = 0
+            torn = False
+            try:
+                with open(self.journal_file) as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            logger.warning("Ignoring a torn alarm journal record")
+                            torn = True
+                            break
+                        self._apply(record)
+                        self.journal_records += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to read alarm journal: {str(e)}")
+
+            self.stats['replayed'] = self.journal_records
+            if torn:
+                # New records must not land after the torn one
+                self._compact()
+
+        self.stats['restore_time'] = time.perf_counter() - start
+        logger.info(
+            f"Alarm store loaded in {self.stats['restore_time'] * 1000:.1f} ms "
+            f"({self.stats['replayed']} journal records)"
+        )
+        return dict(self.settings), self.snooze
+
+    def record_settings(self, settings):
+        """Journal the schedule settings that differ from the stored ones"""
+        changes = {
+            key: settings[key] for key in SETTINGS_KEYS
+            if key in settings and settings[key] != self.settings.get(key)
+        }
+        if changes:
+            self._append({'op': 'settings', 'settings': changes})
+
+    def record_snooze(self, alarm_entry, fire_time):
+        """Journal a pending snooze"""
+        self._append({'op': 'snooze', 'alarm': alarm_entry, 'fire_time': fire_time.isoformat()})
+
+    def record_dismiss(self):
+        """Journal that the current alarm, and any pending snooze, was dismissed"""
+        if self.snooze is not None:
+            self._append({'op': 'dismiss'})
+
+    def record_timer(self, alarm_entry, fire_time):
+        """Journal a pending timer"""
+        self._append({'op': 'timer', 'alarm': alarm_entry, 'fire_time': fire_time.isoformat()})
+
+    def record_timer_done(self, fire_time):
+        """Journal that a timer rang, expired or was cancelled"""
+        if fire_time.isoformat() in self.timers:
+            self._append({'op': 'timer_done', 'fire_time': fire_time.isoformat()})
+
+    def compact(self):
+        """Fold the journal into a new snapshot"""
+        with self._lock:
+            self._compact()
+
+    def close(self):
+        """Compact and close the journal"""
+        with self._lock:
+            if self.journal_records:
+                self._compact()
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+
+    def _apply(self, record):
+        op = record.get('op')
+        if op == 'settings':
+            self.settings.update(record['settings'])
+        elif op == 'snooze':
+            self.snooze = {'alarm': record['alarm'], 'fire_time': record['fire_time']}
+        elif op == 'dismiss':
+            self.snooze = None
+        elif op == 'timer':
+            self.timers[record['fire_time']] = record['alarm']
+        elif op == 'timer_done':
+            self.timers.pop(record['fire_time'], None)
+
+    def _append(self, record):
+        with self._lock:
+            self._apply(record)
+            record['at'] = datetime.now().isoformat()
+            try:
+                if self._journal is None:
+                    os.makedirs(os.path.dirname(self.journal_file) or ".", exist_ok=True)
+                    self._journal = open(self.journal_file, 'a')
+                self._journal.write(json.dumps(record, separators=(',', ':')) + "\n")
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self.journal_records += 1
+                self.stats['appends'] += 1
+            except OSError as e:
+                logger.error(f"Failed to append to alarm journal: {str(e)}")
+                return
+
+            if self.journal_records >= self.max_journal_records or \
+                    self._journal.tell() >= self.max_journal_bytes:
+                self._compact()
+
+    def _compact(self):
+        """Write the snapshot atomically, then truncate the journal (caller holds the lock)"""
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_file) or ".", exist_ok=True)
+            tmp_file = f"{self.snapshot_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({'settings': self.settings, 'snooze': self.snooze, 'timers': self.timers}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+
+            # Records in the journal are now in the snapshot
+            if self._journal:
+                self._journal.close()
+            self._journal = open(self.journal_file, 'w')
+            self.journal_records = 0
+            self.stats['compactions'] += 1
+            logger.info("Alarm journal compacted")
+        except OSError as e:
+            logger.error(f"Failed to compact alarm journal: {str(e)}")
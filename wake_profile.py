@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import logging
+import math
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = 'sunrise'
+SAMPLES_PER_SECOND = 4  # Table resolution over the wake window
+
+
+# Easing curves mapping progress 0..1 to output 0..1
+EASINGS = {
+    'linear': lambda t: t,
+    'ease_in': lambda t: t * t,
+    'ease_out': lambda t: 1 - (1 - t) * (1 - t),
+    'ease_in_out': lambda t: t * t * (3 - 2 * t),
+    'exponential': lambda t: (2 ** (10 * t) - 1) / 1023,
+}
+
+# Built-in profiles. Each can be overridden or extended from website settings.
+PROFILES = {
+    'sunrise': {
+        'brightness_curve': 'exponential',
+        'color_curve': 'ease_in_out',
+        'start_kelvin': 1800,
+        'end_kelvin': 6500,
+        'max_brightness': 100,
+        'volume_curve': 'ease_in',
+        'volume_start': 0.7,  # Fraction of the window before sound fades in
+        'max_volume': 0.6,
+        'ambient_sound': 'morning-dew.mp3',  # Bed mixed under the wake window, or None
+    },
+    'gentle': {
+        'brightness_curve': 'ease_in',
+        'color_curve': 'linear',
+        'start_kelvin': 1900,
+        'end_kelvin': 4000,
+        'max_brightness': 70,
+        'volume_curve': 'ease_in',
+        'volume_start': 0.85,
+        'max_volume': 0.4,
+        'ambient_sound': 'star-dust.mp3',
+    },
+    'linear': {
+        'brightness_curve': 'linear',
+        'color_curve': 'linear',
+        'start_kelvin': 2000,
+        'end_kelvin': 6500,
+        'max_brightness': 100,
+        'volume_curve': 'linear',
+        'volume_start': 0.5,
+        'max_volume': 0.5,
+        'ambient_sound': None,
+    },
+}
+
+
+def kelvin_to_rgb(kelvin):
+    """Approximate the RGB colour of a black body at the given temperature"""
+    temp = kelvin / 100
+
+    if temp <= 66:
+        r = 255
+        g = 99.4708025861 * math.log(temp) - 161.1195681661
+    else:
+        r = 329.698727446 * ((temp - 60) ** -0.1332047592)
+        g = 288.1221695283 * ((temp - 60) ** -0.0755148492)
+
+    if temp >= 66:
+        b = 255
+    elif temp <= 19:
+        b = 0
+    else:
+        b = 138.5177312231 * math.log(temp - 10) - 305.0447927307
+
+    return tuple(int(max(0, min(255, c))) for c in (r, g, b))
+
+
+class WakeProfile:
+    """Precomputed brightness, colour and volume tables for one wake window"""
+
+    def __init__(self, name, duration_seconds, spec, samples_per_second=SAMPLES_PER_SECOND):
+        """Build the lookup tables for a wake window"""
+        self.name = name
+        self.duration = duration_seconds
+        self.rate = samples_per_second
+        self.ambient_sound = spec.get('ambient_sound')
+
+        brightness_ease = EASINGS[spec['brightness_curve']]
+        color_ease = EASINGS[spec['color_curve']]
+        volume_ease = EASINGS[spec['volume_curve']]
+        start_k = spec['start_kelvin']
+        end_k = spec['end_kelvin']
+        max_brightness = spec['max_brightness']
+        volume_start = spec['volume_start']
+        max_volume = spec['max_volume']
+
+        count = max(2, int(duration_seconds * samples_per_second) + 1)
+        steps = count - 1
+        progress = [i / steps for i in range(count)]
+
+        self.brightness = [int(round(max_brightness * brightness_ease(t))) for t in progress]
+        self.colors = [kelvin_to_rgb(start_k + (end_k - start_k) * color_ease(t)) for t in progress]
+        if volume_start < 1:
+            self.volume = [
+                max_volume * volume_ease(max(0.0, (t - volume_start) / (1 - volume_start)))
+                for t in progress
+            ]
+        else:
+            self.volume = [0.0] * count
+
+    def index(self, elapsed):
+        """Table index for a number of seconds into the wake window"""
+        return max(0, min(len(self.brightness) - 1, int(elapsed * self.rate)))
+
+    def sample(self, elapsed):
+        """Get (brightness, rgb, volume) for a number of seconds into the window"""
+        i = self.index(elapsed)
+        return self.brightness[i], self.colors[i], self.volume[i]
+
+
+def register_profile(name, spec):
+    """Add or replace a profile definition (e.g. from website settings)"""
+    base = dict(PROFILES.get(name, PROFILES[DEFAULT_PROFILE]))
+    base.update(spec)
+    for key in ('brightness_curve', 'color_curve', 'volume_curve'):
+        if base[key] not in EASINGS:
+            raise ValueError(f"Unknown easing curve '{base[key]}' in profile '{name}'")
+    if PROFILES.get(name) != base:
+        PROFILES[name] = base
+        get_wake_profile.cache_clear()
+
+
+@lru_cache(maxsize=16)
+def get_wake_profile(name, duration_seconds):
+    """Get the precomputed profile for a name and wake window length"""
+    if name not in PROFILES:
+        logger.warning(f"Unknown wake profile '{name}', using '{DEFAULT_PROFILE}'")
+        name = DEFAULT_PROFILE
+    return WakeProfile(name, duration_seconds, PROFILES[name])
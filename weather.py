@@ -3,83 +3,370 @@
 import requests
 import json
 import logging
+import os
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta
 
+from metrics import get_registry
+
 logger = logging.getLogger(__name__)
 
+CURRENT = 'weather'
+FORECAST = 'forecast'
+
+NOT_MODIFIED = object()  # _request() result when a revalidation got 304
+
+
+class WeatherService:
+    """OpenWeatherMap client shared by every WeatherManager in the process.
+
+    Results are cached per (kind, location) with a TTL and persisted to disk.
+    Stale entries are served immediately while one background refresh
+    revalidates them (conditionally, when the API sent an ETag), and
+    concurrent fetches of the same entry collapse into a single request.
+    """
+
+    def __init__(self, base_url="http://api.openweathermap.org/data/2.5",
+                 cache_file=os.path.join("data", "weather_cache.json")):
+        """Initialize the WeatherService"""
+        self.base_url = base_url
+        self.cache_file = cache_file
+        self.ttl = {
+            CURRENT: timedelta(minutes=30),
+            FORECAST: timedelta(hours=3),
+        }
+        self.request_timeout = 10  # Seconds
+        self.session = requests.Session()
+
+        # Backoff after failures, per entry
+        self.min_backoff = 30  # Seconds
+        self.max_backoff = 1800  # Seconds
+
+        self._lock = threading.Lock()
+        self._entries = {}  # (kind, location) -> {'data', 'updated', 'etag'}
+        self._failures = defaultdict(int)
+        self._next_attempt = defaultdict(float)  # time.monotonic() before which no fetch is tried
+        self._inflight = {}  # (kind, location) -> threading.Event
+
+        self.registry = get_registry()
+        self.metrics = {
+            'fetches': 0,
+            'failures': 0,
+            'coalesced': 0,
+            'not_modified': 0,
+            'refreshes_skipped': 0,
+            'last_fetch_latency': None,
+        }
+
+        self._load_cache()
+
+    def get(self, kind, location, api_key, refresh=True):
+        """Get cached data immediately, revalidating it in the background if stale"""
+        key = (kind, location)
+        with self._lock:
+            entry = self._entries.get(key)
+        if refresh and self._is_stale(kind, entry):
+            self.refresh_async(kind, location, api_key)
+        return entry['data'] if entry else None
+
+    def fetch(self, kind, location, api_key, wait=True):
+        """Fetch an entry now; callers arriving mid-fetch share the one request"""
+        key = (kind, location)
+        with self._lock:
+            if time.monotonic() < self._next_attempt[key]:
+                self.metrics['refreshes_skipped'] += 1
+                entry = self._entries.get(key)
+                return entry['data'] if entry else None
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                inflight = self._inflight[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+                self.metrics['coalesced'] += 1
+
+        if not owner:
+            if wait:
+                inflight.wait(self.request_timeout * 2)
+            return self._data(key)
+
+        try:
+            with self._lock:
+                entry = self._entries.get(key)
+            result = self._request(kind, location, api_key, entry.get('etag') if entry else None)
+            with self._lock:
+                if result is NOT_MODIFIED:
+                    self._entries[key] = dict(entry, updated=datetime.now())
+                elif result is not None:
+                    data, etag = result
+                    self._entries[key] = {'data': data, 'updated': datetime.now(), 'etag': etag}
+                else:
+                    self._record_failure(key)
+                if result is not None:
+                    self._failures.pop(key, None)
+                    self._next_attempt.pop(key, None)
+            if result is not None:
+                self._save_cache()
+            return self._data(key)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.set()
+
+    def refresh_async(self, kind, location, api_key):
+        """Revalidate an entry in a background thread unless a fetch is running"""
+        key = (kind, location)
+        with self._lock:
+            if key in self._inflight or time.monotonic() < self._next_attempt[key]:
+                return
+        threading.Thread(
+            target=self.fetch, args=(kind, location, api_key, False),
+            name="weather-refresh", daemon=True
+        ).start()
+
+    def latest(self, kind):
+        """(location, data) of the most recently updated entry of a kind, or None"""
+        with self._lock:
+            entries = [(entry['updated'], location, entry['data'])
+                       for (entry_kind, location), entry in self._entries.items() if entry_kind == kind]
+        if not entries:
+            return None
+        _, location, data = max(entries)
+        return location, data
+
+    def entry_age(self, kind, location):
+        """Seconds since an entry was fetched, or None"""
+        with self._lock:
+            entry = self._entries.get((kind, location))
+        return (datetime.now() - entry['updated']).total_seconds() if entry else None
+
+    def is_stale(self, kind, location):
+        """Check whether an entry is missing or older than its TTL"""
+        with self._lock:
+            entry = self._entries.get((kind, location))
+        return self._is_stale(kind, entry)
+
+    def get_metrics(self, kind=None, location=None):
+        """Get fetch statistics, plus freshness of one entry if given"""
+        with self._lock:
+            metrics = dict(self.metrics, entries=len(self._entries))
+            if kind and location:
+                key = (kind, location)
+                metrics['consecutive_failures'] = self._failures.get(key, 0)
+                metrics['retry_in'] = max(0.0, self._next_attempt.get(key, 0.0) - time.monotonic())
+        if kind and location:
+            metrics['age_seconds'] = self.entry_age(kind, location)
+            metrics['fresh'] = not self.is_stale(kind, location)
+        return metrics
+
+    def _is_stale(self, kind, entry):
+        return not entry or datetime.now() - entry['updated'] > self.ttl[kind]
+
+    def _data(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry['data'] if entry else None
+
+    def _request(self, kind, location, api_key, etag=None):
+        """Call the API and parse the response.
+
+        Returns (data, etag), NOT_MODIFIED when `etag` is still current, or
+        None on failure.
+        """
+        params = {
+            'id': location,
+            'appid': api_key,
+            'units': 'metric'  # Use Celsius for temperature
+        }
+        headers = {'If-None-Match': etag} if etag else {}
+
+        start = time.monotonic()
+        self.metrics['fetches'] += 1
+        outcome = 'error'
+        try:
+            response = self.session.get(
+                f"{self.base_url}/{kind}", params=params, headers=headers, timeout=self.request_timeout
+            )
+            if response.status_code == 304:
+                self.metrics['not_modified'] += 1
+                outcome = 'not_modified'
+                return NOT_MODIFIED
+            response.raise_for_status()
+            payload = response.json()
+            data = self._parse_current(payload) if kind == CURRENT else self._parse_forecast(payload)
+            logger.info(f"Weather {kind} for {location} updated successfully")
+            outcome = 'ok'
+            return data, response.headers.get('ETag')
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to fetch weather {kind}: {str(e)}")
+        except (KeyError, IndexError, ValueError) as e:
+            logger.error(f"Failed to parse weather {kind}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected error updating weather: {str(e)}")
+        finally:
+            self.metrics['last_fetch_latency'] = time.monotonic() - start
+            self.registry.observe(
+                'smartalarm_http_request_seconds', self.metrics['last_fetch_latency'],
+                target=f"weather_{kind}", outcome=outcome
+            )
+        return None
+
+    @staticmethod
+    def _parse_current(weather_data):
+        """Extract the fields the display uses from a current weather response"""
+        return {
+            'temperature': round(weather_data['main']['temp']),
+            'condition': weather_data['weather'][0]['main'],
+            'description': weather_data['weather'][0]['description'],
+            'humidity': weather_data['main']['humidity'],
+            'wind_speed': weather_data['wind']['speed'],
+            'icon': weather_data['weather'][0]['icon']
+        }
+
+    @staticmethod
+    def _parse_forecast(forecast_data):
+        """Build hourly and daily summaries from a 5 day / 3 hour forecast"""
+        hourly = []
+        for item in forecast_data['list']:
+            hourly.append({
+                'time': datetime.fromtimestamp(item['dt']).isoformat(),
+                'temperature': round(item['main']['temp']),
+                'condition': item['weather'][0]['main'],
+                'icon': item['weather'][0]['icon'],
+                'precipitation_chance': item.get('pop', 0),
+            })
+
+        days = {}
+        for hour in hourly:
+            day = days.setdefault(hour['time'][:10], {
+                'date': hour['time'][:10],
+                'min': hour['temperature'],
+                'max': hour['temperature'],
+                'conditions': defaultdict(int),
+                'precipitation_chance': 0,
+            })
+            day['min'] = min(day['min'], hour['temperature'])
+            day['max'] = max(day['max'], hour['temperature'])
+            day['conditions'][hour['condition']] += 1
+            day['precipitation_chance'] = max(day['precipitation_chance'], hour['precipitation_chance'])
+
+        daily = []
+        for day in days.values():
+            conditions = day.pop('conditions')
+            day['condition'] = max(conditions, key=conditions.get)
+            daily.append(day)
+
+        return {'hourly': hourly, 'daily': daily}
+
+    def _record_failure(self, key):
+        """Back off exponentially after a failed fetch (caller holds the lock)"""
+        self._failures[key] += 1
+        self.metrics['failures'] += 1
+        backoff = min(self.max_backoff, self.min_backoff * 2 ** (self._failures[key] - 1))
+        self._next_attempt[key] = time.monotonic() + backoff
+        logger.info(f"Next weather {key[0]} fetch for {key[1]} in {backoff} s")
+
+    def _load_cache(self):
+        """Restore entries saved to disk so a reboot starts with data"""
+        try:
+            with open(self.cache_file) as f:
+                saved = json.load(f)
+            for item in saved['entries']:
+                key = (item['kind'], item['location'])
+                self._entries[key] = {
+                    'data': item['data'],
+                    'updated': datetime.fromisoformat(item['updated']),
+                    'etag': item.get('etag'),
+                }
+            logger.info(f"Loaded {len(self._entries)} weather cache entries")
+        except FileNotFoundError:
+            pass
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Failed to load weather cache: {str(e)}")
+
+    def _save_cache(self):
+        """Persist the cache atomically"""
+        with self._lock:
+            entries = [
+                {
+                    'kind': kind,
+                    'location': location,
+                    'updated': entry['updated'].isoformat(),
+                    'etag': entry.get('etag'),
+                    'data': entry['data'],
+                }
+                for (kind, location), entry in self._entries.items()
+            ]
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            tmp_file = f"{self.cache_file}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({'entries': entries}, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.error(f"Failed to save weather cache: {str(e)}")
+
+
+_shared_service = None
+_shared_service_lock = threading.Lock()
+
+
+def get_weather_service():
+    """Get the process-wide WeatherService"""
+    global _shared_service
+    with _shared_service_lock:
+        if _shared_service is None:
+            _shared_service = WeatherService()
+        return _shared_service
+
+
 class WeatherManager:
-    def __init__(self):
+    def __init__(self, service=None):
         """Initialize the WeatherManager"""
         # OpenWeatherMap configuration
-        self.api_key = None  # Set via update_api_key method
-        self.base_url = "http://api.openweathermap.org/data/2.5/weather"
+        self.api_key = None  # Set via update_settings method
         self.city_id = None  # Set via update_settings method
-        
-        # Cache configuration
-        self.cache = {}
-        self.cache_duration = timedelta(minutes=30)
-        self.last_update = None
+
+        # Cache shared with every other location in the process
+        self.service = service or get_weather_service()
 
     def update_settings(self, settings):
         """Update weather settings"""
         try:
-            self.api_key = settings.get('weather_api_key')
-            self.city_id = settings.get('city_id')
+            self.api_key = settings.get('weather_api_key', self.api_key)
+            self.city_id = settings.get('city_id', self.city_id)
             logger.info("Weather settings updated successfully")
         except Exception as e:
             logger.error(f"Failed to update weather settings: {str(e)}")
 
     def update_weather(self):
-        """Fetch current weather data from OpenWeatherMap API"""
+        """Fetch current weather and forecast for this location now"""
         if not self.api_key or not self.city_id:
             logger.error("Weather API key or city ID not set")
             return
-        
-        try:
-            # Build API URL
-            params = {
-                'id': self.city_id,
-                'appid': self.api_key,
-                'units': 'metric'  # Use Celsius for temperature
-            }
-            
-            # Make API request
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            
-            # Parse response
-            weather_data = response.json()
-            
-            # Extract relevant information
-            self.cache = {
-                'temperature': round(weather_data['main']['temp']),
-                'condition': weather_data['weather'][0]['main'],
-                'description': weather_data['weather'][0]['description'],
-                'humidity': weather_data['main']['humidity'],
-                'wind_speed': weather_data['wind']['speed'],
-                'icon': weather_data['weather'][0]['icon']
-            }
-            
-            self.last_update = datetime.now()
-            logger.info("Weather data updated successfully")
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch weather data: {str(e)}")
-        except (KeyError, json.JSONDecodeError) as e:
-            logger.error(f"Failed to parse weather data: {str(e)}")
-        except Exception as e:
-            logger.error(f"Unexpected error updating weather: {str(e)}")
 
-    def get_current_weather(self):
-        """Get the current weather data"""
-        # Check if cache needs updating
-        if (not self.last_update or 
-            datetime.now() - self.last_update > self.cache_duration):
-            self.update_weather()
-        
-        return self.cache if self.cache else None
-
-    def get_forecast(self):
-        """Get weather forecast (to be implemented)"""
-        # TODO: Implement forecast functionality
-        pass 
\ No newline at end of file
+        self.service.fetch(CURRENT, self.city_id, self.api_key)
+        if self.service.is_stale(FORECAST, self.city_id):
+            self.service.fetch(FORECAST, self.city_id, self.api_key)
+
+    def get_current_weather(self, refresh=True):
+        """Get the cached weather immediately, revalidating it in the background if stale"""
+        return self._get(CURRENT, refresh)
+
+    def get_forecast(self, refresh=True):
+        """Get the cached hourly and daily forecast without waiting on the network"""
+        return self._get(FORECAST, refresh)
+
+    def _get(self, kind, refresh):
+        if not self.city_id:
+            # Settings have not arrived yet (e.g. booting offline): show the last weather seen
+            latest = self.service.latest(kind)
+            return latest[1] if latest else None
+        return self.service.get(kind, self.city_id, self.api_key, refresh and bool(self.api_key))
+
+    def get_metrics(self):
+        """Get cache freshness and fetch statistics for this location"""
+        return self.service.get_metrics(CURRENT, self.city_id)